@@ -1,4 +1,7 @@
-from openbb import obb
+from data_source import obb
+from instrumentation import span
+import data_quality
+import shared_panel
 import pandas as pd
 import os
 from datetime import datetime, timedelta
@@ -10,18 +13,27 @@ END_DATE   = "2024-12-31"
 PROVIDER   = "fmp"
 SEED_CAP   = 10_000.00
 
-results_list = []
+def fetch_prices(crypto):
+    with span("fetch", crypto):
+        hist = obb.crypto.price.historical(
+            symbol=crypto,
+            start_date=START_DATE,
+            end_date=END_DATE,
+            provider=PROVIDER
+        )
+    with span("transform", crypto) as sp:
+        df = hist.to_df().copy()            # keep same source/shape as original
+        sp.count("rows", len(df))
+    return df
 
-for CRYPTO in CRYPTOS:
-    # --- Fetch & prep ---
-    hist = obb.crypto.price.historical(
-        symbol=CRYPTO,
-        start_date=START_DATE,
-        end_date=END_DATE,
-        provider=PROVIDER
-    )
 
-    df = hist.to_df().copy()              # keep same source/shape as original
+def gate(frames):
+    # data-quality checks over every fetched frame (crypto trades every day);
+    # drops quarantined rows, including change_percent that disagrees with close
+    return data_quality.gate_prices(frames, "Crypto_momentum_strategy", "close", calendar="D", change_percent=True)
+
+
+def backtest_momentum(crypto, df):
     n  = len(df)
     position = np.zeros(n, dtype=float)
 
@@ -62,20 +74,48 @@ for CRYPTO in CRYPTOS:
     else:
         performance = "Underperformer"
 
-    results_list.append([
-        CRYPTO, 
+    return [
+        crypto, 
         round(final_value, 2),
         num_trades,
         round(avg_return_per_trade, 2),
         performance
-    ])
+    ]
+
+
+COLUMNS = ["Crypto", "Final Value of the Portfolio", "Number of Trades", "Average Return per Trade (%)", "Performance Category"]
+# declared output types (output_sink.typed_frame), so Parquet/Arrow schemas
+# never depend on the first batch's values
+COLUMN_DTYPES = {"Crypto": "string", "Final Value of the Portfolio": "float64", "Number of Trades": "Int64",
+                 "Average Return per Trade (%)": "float64", "Performance Category": "string"}
+
+
+def results_frame(rows):
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def sort_results(results):
+    return results.sort_values("Final Value of the Portfolio", ascending=False).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    results_list = []
+
+    frames = gate({CRYPTO: fetch_prices(CRYPTO) for CRYPTO in CRYPTOS})
+    if shared_panel.WORKERS > 1:
+        with span("compute", name="shared_panel"):
+            results_list = shared_panel.map_frames(
+                frames, shared_panel.frame_kernel(backtest_momentum, ["change_percent"]), shared_panel.WORKERS)
+    else:
+        for CRYPTO in CRYPTOS:
+            with span("compute", CRYPTO):
+                results_list.append(backtest_momentum(CRYPTO, frames[CRYPTO]))
 
-# --- Required output ---
-results = pd.DataFrame(
-    results_list,
-    columns=["Crypto", "Final Value of the Portfolio", "Number of Trades", "Average Return per Trade (%)", "Performance Category"]
-)
+    # --- Required output ---
+    with span("compute", name="sort_results"):
+        results = results_frame(results_list)
 
-results = results.sort_values("Final Value of the Portfolio", ascending=False).reset_index(drop=True)
+        results = sort_results(results)
 
-df_to_csv(results)
+    with span("output"):
+        df_to_csv(results)
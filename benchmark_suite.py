@@ -0,0 +1,281 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# Scaling benchmarks for each analysis hot path against synthetic data. Every
+# (case, size) runs in a fresh interpreter so peak RSS belongs to that case;
+# results are appended as JSON lines so runs can be compared before/after.
+#
+#   python benchmark_suite.py --sizes 10,1000 --output bench.jsonl
+#   python benchmark_suite.py --compare before.jsonl after.jsonl
+
+os.environ.setdefault("FA_DATA_SOURCE", "local")
+
+SIZES = [10, 1_000, 10_000]
+OUTPUT = "benchmark_results.jsonl"
+
+CASES = {}
+
+
+def case(name):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def synthetic_price_frames(n, start, end, freq="B", seed=0):
+    # price frames shaped like obb price history, built straight from numpy
+    dates = pd.date_range(start, end, freq=freq)
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0003, 0.01, len(dates))
+    frames = {}
+    for i in range(n):
+        rets = rng.uniform(0.3, 1.8) * market + rng.normal(0, 0.015, len(dates))
+        close = rng.uniform(20, 500) * np.exp(np.cumsum(rets))
+        frames[f"SYM{i:05d}"] = pd.DataFrame({
+            "date": dates,
+            "close": close,
+            "adj_close": close,
+            "change_percent": np.concatenate([[0.0], close[1:] / close[:-1] - 1]),
+        })
+    return frames, pd.DataFrame({"date": dates, "adj_close": 4000 * np.exp(np.cumsum(market))})
+
+
+@case("etf_rolling_vol")
+def _etf_rolling_vol(n):
+    import etf_volatility_regime_analysis as etf
+    frames, _ = synthetic_price_frames(n, etf.FETCH_START, etf.FETCH_END)
+
+    def run():
+        return [etf.compute_vol_metrics(sym, df) for sym, df in frames.items()]
+    return run
+
+
+@case("capm_beta_alpha")
+def _capm_beta_alpha(n):
+    import capm_risk_adjusted_performance as capm
+    frames, market = synthetic_price_frames(n, capm.start_date, capm.end_date)
+
+    def returns(df, column):
+        df = df[["date", "adj_close"]].copy()
+        df["date"] = df["date"].dt.date
+        df[column] = df["adj_close"].pct_change()
+        return df
+
+    market = returns(market, "market_return")
+    frames = {sym: returns(df, "stock_return") for sym, df in frames.items()}
+
+    def run():
+        return [capm.compute_capm_row(sym, df, market) for sym, df in frames.items()]
+    return run
+
+
+@case("crypto_signal_loop")
+def _crypto_signal_loop(n):
+    import Crypto_momentum_strategy as crypto
+    frames, _ = synthetic_price_frames(n, crypto.START_DATE, crypto.END_DATE, freq="D")
+
+    def run():
+        return [crypto.backtest_momentum(sym, df) for sym, df in frames.items()]
+    return run
+
+
+@case("altman_z")
+def _altman_z(n):
+    import data_quality
+    import simple_altman_z_score_analysis as altman
+    symbols = [f"SYM{i:05d}" for i in range(n)]
+    fetched = altman.gate(data_quality.fetch_all(altman.fetch_statements, symbols))
+    statements = {sym: altman.fy_statements(sym, fetched[sym]) for sym in symbols}
+
+    def run():
+        return [altman.altman_z_row(sym, *stmts) for sym, stmts in statements.items()]
+    return run
+
+
+@case("liquidity_compute_one")
+def _liquidity_compute_one(n):
+    import data_quality
+    import liquidity_leverage as liq
+    symbols = [f"SYM{i:05d}" for i in range(n)]
+    # fetched and gated once in setup, so only the compute is timed
+    statements = liq.gate(data_quality.fetch_all(liq.fetch_statements, symbols))
+
+    def run():
+        return [liq.compute_one(sym, statements[sym]) for sym in symbols]
+    return run
+
+
+@case("distress_score")
+def _distress_score(n):
+    import data_quality
+    import financial_distress_analysis as fda
+    symbols = [f"SYM{i:05d}" for i in range(n)]
+    statements = fda.gate(data_quality.fetch_all(fda.fetch_statements, symbols))
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return [fda.calculate_distress_score(sym, statements[sym]) for sym in symbols]
+    return run
+
+
+@case("statement_gate")
+def _statement_gate(n):
+    import data_quality
+    import financial_distress_analysis as fda
+    statements = data_quality.fetch_all(fda.fetch_statements, [f"SYM{i:05d}" for i in range(n)])
+
+    # one vectorized data-quality pass over the whole fetched batch
+    def run():
+        with contextlib.redirect_stderr(io.StringIO()):
+            return fda.gate(statements)
+    return run
+
+
+@case("distress_engine")
+def _distress_engine(n):
+    import distress_engine
+    import financial_distress_analysis as fda
+    with contextlib.redirect_stdout(io.StringIO()):
+        statements, _ = fda.fetch_quarterly_statements([f"SYM{i:05d}" for i in range(n)])
+
+    def run():
+        tickers, values, available = distress_engine.build_panel(statements)
+        return distress_engine.score_panel(values, available)
+    return run
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_case(name, n):
+    t0 = time.perf_counter()
+    kernel = CASES[name](n)
+    setup_s = time.perf_counter() - t0
+    rss_before = _rss_mb()
+
+    t0 = time.perf_counter()
+    kernel()
+    wall_s = time.perf_counter() - t0
+
+    return {
+        "case": name,
+        "symbols": n,
+        "wall_s": wall_s,
+        "setup_s": setup_s,
+        "symbols_per_s": n / wall_s if wall_s > 0 else None,
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_suite(cases, sizes, output, timeout=None):
+    meta = {
+        "run_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+    }
+    rows = []
+    for name in cases:
+        for n in sizes:
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", name, str(n)]
+            try:
+                proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                row = {"case": name, "symbols": n, "error": f"timeout after {timeout}s"}
+            else:
+                if proc.returncode == 0:
+                    row = json.loads(proc.stdout.strip().splitlines()[-1])
+                else:
+                    row = {"case": name, "symbols": n, "error": proc.stderr.strip().splitlines()[-1:]}
+            row.update(meta)
+            rows.append(row)
+            with open(output, "a") as f:
+                f.write(json.dumps(row) + "\n")
+            _print_row(row)
+    return rows
+
+
+def _print_row(row):
+    if "error" in row:
+        print(f"{row['case']:<24}{row['symbols']:>8}  ERROR {row['error']}")
+        return
+    print(f"{row['case']:<24}{row['symbols']:>8}{row['wall_s']:>12.3f}s{row['symbols_per_s']:>14.1f}/s"
+          f"{row['peak_rss_mb']:>10.1f} MB")
+
+
+def compare(before, after):
+    def load(path):
+        df = pd.read_json(path, lines=True)
+        df = df[df.get("error").isna()] if "error" in df else df
+        # latest run per (case, symbols)
+        return df.groupby(["case", "symbols"]).last()[["wall_s", "peak_rss_mb"]]
+
+    b, a = load(before), load(after)
+    out = b.join(a, lsuffix="_before", rsuffix="_after", how="inner")
+    out["speedup"] = out["wall_s_before"] / out["wall_s_after"]
+    out["rss_ratio"] = out["peak_rss_mb_after"] / out["peak_rss_mb_before"]
+    print(out.round(3).to_string())
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis kernels at several universe sizes")
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)))
+    parser.add_argument("--output", default=OUTPUT)
+    parser.add_argument("--timeout", type=float, default=None)
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--worker", nargs=2, metavar=("CASE", "N"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_case(args.worker[0], int(args.worker[1]))))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    cases = [c for c in args.cases.split(",") if c]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {sorted(unknown)}")
+    print(f"{'case':<24}{'symbols':>8}{'wall':>13}{'throughput':>16}{'peak RSS':>13}")
+    run_suite(cases, [int(s) for s in args.sizes.split(",")], args.output, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
-from openbb import obb
+from data_source import obb
+from instrumentation import span
+import data_quality
+import shared_panel
 import pandas as pd
 import numpy as np
 
@@ -10,33 +13,40 @@ annual_rf_rate = 0.045  # 4.5% annual risk-free rate
 daily_rf_rate = annual_rf_rate / 252
 trading_days_per_year = 252
 
-obb.user.preferences.output_type = "dataframe"
-
-# Fetch market data
-market_data = obb.equity.price.historical(
-    symbol=market_ticker, 
-    start_date=start_date, 
-    end_date=end_date, 
-    provider='fmp'
-).reset_index()
-
-market_data['date'] = pd.to_datetime(market_data['date']).dt.date
-market_data['market_return'] = market_data['adj_close'].pct_change()
-
-results = []
-
-for ticker in tickers:
-    # Fetch stock data
-    data = obb.equity.price.historical(
-        symbol=ticker, 
-        start_date=start_date, 
-        end_date=end_date, 
-        provider='fmp'
-    ).reset_index()
-    
+def fetch_prices(symbol):
+    with span("fetch", symbol):
+        res = obb.equity.price.historical(
+            symbol=symbol, 
+            start_date=start_date, 
+            end_date=end_date, 
+            provider='fmp'
+        )
+
+    with span("transform", symbol) as sp:
+        data = res.to_dataframe().reset_index()
+        sp.count("rows", len(data))
+    return data
+
+
+def gate(frames):
+    # data-quality checks over every fetched frame; drops quarantined rows
+    # before any returns are taken
+    return data_quality.gate_prices(frames, "capm_risk_adjusted_performance", "adj_close")
+
+
+def returns_frame(data, column):
     data['date'] = pd.to_datetime(data['date']).dt.date
-    data['stock_return'] = data['adj_close'].pct_change()
-    
+    data[column] = data['adj_close'].pct_change()
+    return data
+
+
+def fetch_returns(symbol, column):
+    data = fetch_prices(symbol)
+    with span("transform", symbol):
+        return returns_frame(data, column)
+
+
+def compute_capm_row(ticker, data, market_data):
     # Merge stock and market returns
     merged_data = pd.merge(
         data[['date', 'stock_return']], 
@@ -53,20 +63,25 @@ for ticker in tickers:
     var = np.var(merged_data['market_return'], ddof=0)
     beta = cov / var
     
-    # Calculate correlation and R-squared
+    # Calculate correlation
     correlation = np.corrcoef(merged_data['stock_return'], merged_data['market_return'])[0][1]
-    r_squared = correlation ** 2
     
     # Calculate average returns
     avg_stock_return = merged_data['stock_return'].mean()
     avg_market_return = merged_data['market_return'].mean()
-    
+    stock_std = merged_data['stock_return'].std(ddof=0)
+
+    return capm_row(ticker, beta, correlation, avg_stock_return, avg_market_return, stock_std)
+
+
+def capm_row(ticker, beta, correlation, avg_stock_return, avg_market_return, stock_std):
+    r_squared = correlation ** 2
+
     # Calculate alpha (Jensen's alpha) - daily then annualize
     daily_alpha = avg_stock_return - (daily_rf_rate + beta * (avg_market_return - daily_rf_rate))
     annual_alpha = daily_alpha * trading_days_per_year * 100  # Convert to percentage
     
     # Calculate Sharpe ratio - annualized
-    stock_std = merged_data['stock_return'].std(ddof=0)
     daily_sharpe = (avg_stock_return - daily_rf_rate) / stock_std
     annual_sharpe = daily_sharpe * np.sqrt(trading_days_per_year)
     
@@ -98,7 +113,7 @@ for ticker in tickers:
     else:
         performance_category = "Underperform"
     
-    results.append({
+    return {
         'ticker': ticker,
         'beta': beta_rounded,
         'alpha': alpha_rounded,
@@ -108,19 +123,67 @@ for ticker in tickers:
         'r_squared': r_squared_rounded,
         'risk_category': risk_category,
         'performance_category': performance_category
-    })
+    }
+
+
+_market_returns = {}
+
 
-# Create output dataframe
-final_df = pd.DataFrame(results)
+def capm_row_from_panel(ticker, panel):
+    # shared_panel kernel: market returns are built once per worker process
+    if market_ticker not in _market_returns:
+        _market_returns[market_ticker] = returns_frame(panel.frame(market_ticker, ['adj_close']), 'market_return')
+    data = returns_frame(panel.frame(ticker, ['adj_close']), 'stock_return')
+    return compute_capm_row(ticker, data, _market_returns[market_ticker])
 
-# Define custom sort order for performance_category
+
+# Custom sort order for performance_category
 category_order = {'Outperform': 0, 'Market Perform': 1, 'Underperform': 2}
-final_df['sort_key'] = final_df['performance_category'].map(category_order)
 
-# Sort by performance category, then alpha descending, then ticker ascending
-final_df = final_df.sort_values(
-    ['sort_key', 'alpha', 'ticker'], 
-    ascending=[True, False, True]
-).drop('sort_key', axis=1).reset_index(drop=True)
 
-df_to_csv(final_df)
+# declared output types (output_sink.typed_frame), so Parquet/Arrow schemas
+# never depend on the first batch's values
+COLUMN_DTYPES = {"ticker": "string", "beta": "float64", "alpha": "float64", "sharpe_ratio": "float64",
+                 "treynor_ratio": "float64", "correlation": "float64", "r_squared": "float64",
+                 "risk_category": "string", "performance_category": "string"}
+
+
+def results_frame(rows):
+    return pd.DataFrame(rows)
+
+
+def sort_results(final_df):
+    final_df = final_df.copy()
+    final_df['sort_key'] = final_df['performance_category'].map(category_order)
+
+    # Sort by performance category, then alpha descending, then ticker ascending
+    return final_df.sort_values(
+        ['sort_key', 'alpha', 'ticker'], 
+        ascending=[True, False, True]
+    ).drop('sort_key', axis=1).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    frames = gate({symbol: fetch_prices(symbol) for symbol in [market_ticker] + tickers})
+    if shared_panel.WORKERS > 1:
+        with span("compute", name="shared_panel"):
+            results = shared_panel.map_frames(frames, capm_row_from_panel, shared_panel.WORKERS,
+                                              fields=['adj_close'], symbols=tickers)
+    else:
+        with span("transform", market_ticker):
+            market_data = returns_frame(frames[market_ticker], 'market_return')
+
+        results = []
+
+        for ticker in tickers:
+            with span("transform", ticker):
+                data = returns_frame(frames[ticker], 'stock_return')
+            with span("compute", ticker):
+                results.append(compute_capm_row(ticker, data, market_data))
+
+    # Create output dataframe
+    with span("compute", name="sort_results"):
+        final_df = sort_results(results_frame(results))
+
+    with span("output"):
+        df_to_csv(final_df)
@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+import data_quality
+import data_source
+from instrumentation import span
+
+# Resumable universe runs. Every finished symbol is appended to a JSONL file
+# as one line, {"symbol", "ok", "row"}, and flushed right away. A run that
+# dies part-way loses at most the symbol it was working on. The next run with
+# the same parameters reads the file back, skips the symbols whose last record
+# is ok, and runs the failed and missing ones again. The symbols to run are
+# fetched and data-quality gated FA_CHECKPOINT_CHUNK at a time (default 256),
+# then computed and recorded one by one.
+#
+# The file is named after a hash of the run's parameters (the script's
+# run_params(): YEAR, provider, quarter set, data source and, in local mode,
+# the FA_LOCAL_* universe settings), so changing any of them starts a new
+# checkpoint instead of reusing stale rows. The first line of the file records
+# the parameters themselves.
+#
+#   python checkpoint.py liquidity --symbols-file sp1500.txt
+#   python checkpoint.py distress --symbols BA,GE,F      # after a crash: same command
+#   FA_DATA_SOURCE=local FA_LOCAL_SYMBOLS=5000 python checkpoint.py liquidity --fresh
+
+CHECKPOINT_DIR = os.environ.get("FA_CHECKPOINT_DIR", "checkpoints")
+# symbols fetched and data-quality gated together before they are computed
+CHUNK = int(os.environ.get("FA_CHECKPOINT_CHUNK", 256))
+
+
+def run_key(params):
+    blob = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+
+def _json_default(x):
+    if isinstance(x, np.generic):
+        return x.item()
+    return str(x)
+
+
+class Checkpoint:
+
+    def __init__(self, name, params, directory=None, fresh=False):
+        self.params = params
+        self.key = run_key(params)
+        directory = directory or CHECKPOINT_DIR
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}-{self.key}.jsonl")
+        self.rows = {}
+        self.failed = set()
+        if fresh and os.path.exists(self.path):
+            os.remove(self.path)
+        if os.path.exists(self.path):
+            self._load()
+        else:
+            self._append({"run": self.key, "params": params, "created": time.strftime("%Y-%m-%dT%H:%M:%S")})
+
+    def _load(self):
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # a line cut short by a crash mid-write
+                    continue
+                if "symbol" not in rec:
+                    continue
+                if rec["ok"]:
+                    self.rows[rec["symbol"]] = rec["row"]
+                    self.failed.discard(rec["symbol"])
+                else:
+                    self.rows.pop(rec["symbol"], None)
+                    self.failed.add(rec["symbol"])
+
+    def _append(self, rec):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(rec, default=_json_default) + "\n")
+            f.flush()
+
+    def done(self, symbol):
+        return symbol in self.rows
+
+    def record(self, symbol, row, ok=True):
+        self._append({"symbol": symbol, "ok": ok, "row": row})
+        if ok:
+            self.rows[symbol] = row
+            self.failed.discard(symbol)
+        else:
+            self.failed.add(symbol)
+
+
+def run(checkpoint, symbols, compute, failed=None, on_error=None, fetch=None, chunk=CHUNK):
+    # rows for `symbols` in order. fetch(chunk of symbols) -> {symbol: inputs}
+    # and compute(symbol, inputs or None) -> row; a row is recorded as failed
+    # when failed(row) is true or compute raised, in which case
+    # on_error(symbol, exc) supplies the row (without on_error the exception
+    # propagates after being recorded)
+    symbols = list(dict.fromkeys(symbols))
+    todo = [s for s in symbols if not checkpoint.done(s)]
+    retried = sum(s in checkpoint.failed for s in todo)
+    print(f"Checkpoint {checkpoint.path}: {len(symbols) - len(todo)} done, {len(todo)} to run "
+          f"({retried} failed before)")
+    rows = {}
+    for i0 in range(0, len(todo), chunk):
+        batch = todo[i0:i0 + chunk]
+        inputs = fetch(batch) if fetch else {}
+        for symbol in batch:
+            with span("compute", symbol):
+                try:
+                    row = compute(symbol, inputs.get(symbol))
+                    ok = not (failed and failed(row))
+                except Exception as e:
+                    if on_error is None:
+                        checkpoint.record(symbol, None, ok=False)
+                        raise
+                    row, ok = on_error(symbol, e), False
+            checkpoint.record(symbol, row, ok)
+            rows[symbol] = row
+    return [rows[s] if s in rows else checkpoint.rows[s] for s in symbols]
+
+
+def _liquidity(symbols, ckpt_dir, fresh):
+    import liquidity_leverage as liquidity
+
+    ckpt = Checkpoint("liquidity_leverage", liquidity.run_params(), ckpt_dir, fresh)
+    rows = run(ckpt, symbols, liquidity.compute_one, failed=lambda row: row["Status"] == liquidity.STATUS_ERROR,
+               fetch=lambda batch: liquidity.gate(data_quality.fetch_all(liquidity.fetch_statements, batch)))
+    return liquidity, ckpt, liquidity.sort_results(liquidity.results_frame(rows))
+
+
+def _distress(symbols, ckpt_dir, fresh):
+    import financial_distress_analysis as distress
+
+    def on_error(symbol, e):
+        print(f" Error in analysis for {symbol}: {e}")
+        return distress.error_row(symbol)
+
+    ckpt = Checkpoint("financial_distress_analysis", distress.run_params(), ckpt_dir, fresh)
+    rows = run(ckpt, symbols, lambda s, statements: distress.calculate_distress_score(s, statements, raise_errors=True),
+               on_error=on_error,
+               fetch=lambda batch: distress.gate(data_quality.fetch_all(distress.fetch_statements, batch)))
+    return distress, ckpt, distress.results_frame(rows)
+
+
+ANALYSES = {"liquidity": _liquidity, "distress": _distress}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Checkpointed, resumable universe runs")
+    parser.add_argument("analysis", choices=sorted(ANALYSES))
+    parser.add_argument("--symbols", help="comma-separated symbols")
+    parser.add_argument("--symbols-file", help="one symbol per line")
+    parser.add_argument("--dir", default=None, help="checkpoint directory (default FA_CHECKPOINT_DIR)")
+    parser.add_argument("--fresh", action="store_true", help="discard this run's checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    if args.symbols:
+        symbols = [s for s in args.symbols.split(",") if s]
+    elif args.symbols_file:
+        with open(args.symbols_file) as f:
+            symbols = [line.strip() for line in f if line.strip()]
+    elif hasattr(data_source.obb, "universe"):
+        symbols = data_source.obb.universe()
+    else:
+        parser.error("--symbols or --symbols-file is required unless FA_DATA_SOURCE=local")
+
+    module, ckpt, out = ANALYSES[args.analysis](symbols, args.dir, args.fresh)
+    failed = [s for s in symbols if s in ckpt.failed]
+    if failed:
+        print(f"{len(failed)} symbols failed; rerun the same command to retry them")
+    with span("output"):
+        data_source.save_output(out, module.__name__, getattr(module, "COLUMN_DTYPES", None))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,249 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+import capm_risk_adjusted_performance as capm
+import data_source
+import etf_volatility_regime_analysis as etf
+from instrumentation import span
+from price_store import PriceStore
+
+# Out-of-core versions of the ETF volatility and CAPM analyses over a
+# price_store.PriceStore. Symbols are processed in batches and each batch walks
+# the calendar in date chunks. State is carried from one chunk to the next:
+#
+#   etf   last close and the last 62 log returns per symbol (the rolling
+#         windows reach 62 rows back), plus the report year's vol21/vol63
+#   capm  last adj_close per symbol and of the market, plus running count,
+#         means, sums of squared deviations and co-deviation (merged per
+#         chunk with Chan's pairwise update)
+#
+# so nothing is held for the whole history. Batch and chunk sizes come from the
+# memory budget (FA_MEMORY_BUDGET_MB, default 512). The final rows come from
+# the same etf.vol_metrics / capm.capm_row code as the in-memory scripts, over
+# the same date ranges by default.
+#
+#   python chunked_pipeline.py etf prices/ --budget-mb 256
+#   python chunked_pipeline.py capm prices/ --start 2000-01-01 --end 2024-12-31
+
+MEMORY_BUDGET_MB = float(os.environ.get("FA_MEMORY_BUDGET_MB", 512))
+DATE_CHUNK = 2520  # ~10 years of business days
+ETF_WINDOWS = (21, 63)
+TAIL = max(ETF_WINDOWS) - 1
+
+# working bytes per symbol x date cell of a chunk: the block reads, the
+# compacted copies and, for etf, the (window,)-wide temporaries of the
+# rolling std
+ETF_CELL_BYTES = 8 * (8 + 2 * sum(ETF_WINDOWS))
+CAPM_CELL_BYTES = 8 * 16
+
+
+def plan(n_symbols, n_dates, cell_bytes, state_bytes=0, budget_mb=None):
+    # (symbol batch, date chunk) whose working set fits the budget
+    budget = (budget_mb or MEMORY_BUDGET_MB) * 2 ** 20
+    date_chunk = max(min(n_dates, DATE_CHUNK), 1)
+    batch = int(budget // (date_chunk * cell_bytes + state_bytes))
+    if batch < 1:
+        batch = 1
+        date_chunk = max(int((budget - state_bytes) // cell_bytes), 1)
+    return min(batch, max(n_symbols, 1)), date_chunk
+
+
+def batches(n, size):
+    for i0 in range(0, n, size):
+        yield i0, min(i0 + size, n)
+
+
+def compact(values, present):
+    # each row's present values moved to the front in date order, NaN after;
+    # returns (values, original column of each value, count per row)
+    order = np.argsort(~present, axis=1, kind="stable")
+    n = present.sum(axis=1)
+    out = np.take_along_axis(values, order, axis=1)
+    out[np.arange(out.shape[1]) >= n[:, None]] = np.nan
+    return out, order, n
+
+
+def _last(values, n, previous):
+    # value at position n-1 per row, or `previous` where the row was empty
+    idx = np.maximum(n - 1, 0)[:, None]
+    return np.where(n > 0, np.take_along_axis(values, idx, axis=1)[:, 0], previous)
+
+
+def rolling_std(ext, window, n_out):
+    # ddof=1 std of each window ending at the last n_out positions of ext; any
+    # NaN in a window gives NaN, as rolling(window, min_periods=window) does
+    windows = sliding_window_view(ext, window, axis=1)[:, -n_out:]
+    return windows.std(axis=2, ddof=1)
+
+
+def etf_vol_chunked(store, symbols=None, report_start=etf.REPORT_START, report_end=etf.REPORT_END,
+                    history_start=etf.FETCH_START, budget_mb=None):
+    # history_start=None uses every bar in the store; the default matches the
+    # script's fetch window, so rows equal compute_vol_metrics on its fetch
+    symbols = list(symbols or store.symbols)
+    rows_idx = np.array([store.symbol_index[s] for s in symbols], dtype=np.intp)
+    d0, d1 = store.date_range(history_start, report_end)
+    r0, r1 = store.date_range(report_start, report_end)
+    r0 = max(r0, d0)
+    n_report = max(r1 - r0, 0)
+    state_bytes = 8 * (TAIL + 1 + 2 * n_report)
+    batch, chunk = plan(len(symbols), d1 - d0, ETF_CELL_BYTES, state_bytes, budget_mb)
+    report_dates = pd.DatetimeIndex(store.dates[r0:r1])
+
+    out = []
+    for i0, i1 in batches(len(symbols), batch):
+        rows = rows_idx[i0:i1]
+        b = len(rows)
+        last_close = np.full(b, np.nan)
+        tail = np.full((b, TAIL), np.nan)
+        vols = {w: np.full((b, n_report), np.nan) for w in ETF_WINDOWS}
+        seen = np.zeros((b, n_report), dtype=bool)
+
+        for c0, c1 in batches(d1 - d0, chunk):
+            c0, c1 = d0 + c0, d0 + c1
+            with span("fetch", name="price_store"):
+                close = store.block("close", rows, c0, c1)
+                present = store.block_present(rows, c0, c1)
+            with span("compute", name="etf_chunk"):
+                close, order, n = compact(close, present)
+                prev = np.concatenate([last_close[:, None], close[:, :-1]], axis=1)
+                logret = np.log(close / prev)
+                ext = np.concatenate([tail, logret], axis=1)
+                last_close = _last(close, n, last_close)
+                tail = np.take_along_axis(ext, n[:, None] + np.arange(TAIL), axis=1)
+
+                if c1 <= r0 or c0 >= r1:
+                    continue
+                # scatter the windows that end on report dates back to date columns
+                col = c0 + order
+                in_report = (np.arange(c1 - c0) < n[:, None]) & (col >= r0) & (col < r1)
+                bi, ji = np.nonzero(in_report)
+                ri = col[bi, ji] - r0
+                seen[bi, ri] = True
+                for w in ETF_WINDOWS:
+                    vols[w][bi, ri] = rolling_std(ext[:, TAIL - w + 1:], w, c1 - c0)[bi, ji]
+
+        with span("compute", name="etf_metrics"):
+            for k, sym in enumerate(symbols[i0:i1]):
+                mask = seen[k]
+                yr = pd.DataFrame({"date": report_dates[mask], "vol21": vols[21][k, mask], "vol63": vols[63][k, mask]})
+                out.append(etf.vol_metrics(sym, yr))
+    return etf.sort_results(etf.results_frame(out))
+
+
+def chunk_returns(prices, present, last, log=False):
+    # pct_change (or, with log, log(close / previous close)) over each row's
+    # own bars, scattered back to date columns
+    values, order, n = compact(prices, present)
+    prev = np.concatenate([last[:, None], values[:, :-1]], axis=1)
+    rets = np.log(values / prev) if log else values / prev - 1
+    out = np.full(prices.shape, np.nan)
+    np.put_along_axis(out, order, np.where(np.arange(prices.shape[1]) < n[:, None], rets, np.nan), axis=1)
+    out[~present] = np.nan
+    return out, _last(values, n, last)
+
+
+def _moments(x, y, valid):
+    # count, means, sums of squared deviations and co-deviation per row
+    n = valid.sum(axis=1)
+    safe = np.maximum(n, 1)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+    mx = x.sum(axis=1) / safe
+    my = y.sum(axis=1) / safe
+    dx = np.where(valid, x - mx[:, None], 0.0)
+    dy = np.where(valid, y - my[:, None], 0.0)
+    return n, mx, my, (dx * dx).sum(axis=1), (dy * dy).sum(axis=1), (dx * dy).sum(axis=1)
+
+
+def _merge(a, b):
+    na, ma_x, ma_y, sa_xx, sa_yy, sa_xy = a
+    nb, mb_x, mb_y, sb_xx, sb_yy, sb_xy = b
+    n = na + nb
+    w = np.where(n > 0, nb / np.maximum(n, 1), 0.0)
+    cross = np.where(n > 0, na * nb / np.maximum(n, 1), 0.0)
+    dx, dy = mb_x - ma_x, mb_y - ma_y
+    return (n, ma_x + dx * w, ma_y + dy * w,
+            sa_xx + sb_xx + dx * dx * cross, sa_yy + sb_yy + dy * dy * cross, sa_xy + sb_xy + dx * dy * cross)
+
+
+def capm_chunked(store, tickers=None, market=capm.market_ticker, start=capm.start_date, end=capm.end_date,
+                 budget_mb=None):
+    # returns are taken within [start, end], as the script's fetch window does
+    tickers = [t for t in (tickers or store.symbols) if t != market]
+    rows_idx = np.array([store.symbol_index[t] for t in tickers], dtype=np.intp)
+    m_idx = np.array([store.symbol_index[market]], dtype=np.intp)
+    d0, d1 = store.date_range(start, end)
+    batch, chunk = plan(len(tickers), d1 - d0, CAPM_CELL_BYTES, 8 * 8, budget_mb)
+
+    out = []
+    for i0, i1 in batches(len(tickers), batch):
+        rows = rows_idx[i0:i1]
+        b = len(rows)
+        last = np.full(b, np.nan)
+        last_market = np.full(1, np.nan)
+        zeros = np.zeros(b)
+        acc = (np.zeros(b, dtype=np.int64), zeros, zeros, zeros, zeros, zeros)
+
+        for c0, c1 in batches(d1 - d0, chunk):
+            c0, c1 = d0 + c0, d0 + c1
+            with span("fetch", name="price_store"):
+                prices = store.block("adj_close", rows, c0, c1)
+                present = store.block_present(rows, c0, c1)
+                m_prices = store.block("adj_close", m_idx, c0, c1)
+                m_present = store.block_present(m_idx, c0, c1)
+            with span("compute", name="capm_chunk"):
+                stock, last = chunk_returns(prices, present, last)
+                market_ret, last_market = chunk_returns(m_prices, m_present, last_market)
+                market_ret = np.broadcast_to(market_ret, stock.shape)
+                # inner merge on date, then dropna on both returns
+                valid = np.isfinite(stock) & np.isfinite(market_ret)
+                acc = _merge(acc, _moments(stock, market_ret, valid))
+
+        with span("compute", name="capm_metrics"):
+            n, mean_s, mean_m, ss_s, ss_m, ss_sm = acc
+            with np.errstate(divide="ignore", invalid="ignore"):
+                beta = (ss_sm / (n - 1)) / (ss_m / n)
+                correlation = ss_sm / np.sqrt(ss_s * ss_m)
+                stock_std = np.sqrt(ss_s / n)
+                for k, ticker in enumerate(tickers[i0:i1]):
+                    out.append(capm.capm_row(ticker, beta[k], correlation[k], mean_s[k], mean_m[k], stock_std[k]))
+    return capm.sort_results(capm.results_frame(out))
+
+
+ANALYSES = {
+    "etf": (etf_vol_chunked, etf),
+    "capm": (capm_chunked, capm),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ETF volatility or CAPM analysis over a price store in chunks")
+    parser.add_argument("analysis", choices=sorted(ANALYSES))
+    parser.add_argument("store", help="directory written by price_store.py build")
+    parser.add_argument("--symbols", help="comma-separated subset of the store's symbols")
+    parser.add_argument("--start", help="first date (etf: start of history, capm: start of returns)")
+    parser.add_argument("--end", help="last date (etf: end of the report window, capm: end of returns)")
+    parser.add_argument("--report-start", help="etf: first date of the report window")
+    parser.add_argument("--budget-mb", type=float, default=None, help="memory budget (default FA_MEMORY_BUDGET_MB)")
+    args = parser.parse_args(argv)
+
+    store = PriceStore(args.store)
+    symbols = [s for s in args.symbols.split(",") if s] if args.symbols else None
+    fn, module = ANALYSES[args.analysis]
+    if args.analysis == "etf":
+        out = fn(store, symbols, report_start=args.report_start or etf.REPORT_START, report_end=args.end or etf.REPORT_END,
+                 history_start=args.start or etf.FETCH_START, budget_mb=args.budget_mb)
+    else:
+        out = fn(store, symbols, start=args.start or capm.start_date, end=args.end or capm.end_date,
+                 budget_mb=args.budget_mb)
+    with span("output"):
+        data_source.save_output(out, module.__name__, module.COLUMN_DTYPES)
+
+
+if __name__ == "__main__":
+    main()
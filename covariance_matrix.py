@@ -0,0 +1,208 @@
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+
+import capm_risk_adjusted_performance as capm
+from chunked_pipeline import MEMORY_BUDGET_MB, batches, chunk_returns, plan
+from instrumentation import span
+from price_store import PriceStore
+
+# Full cross-sectional covariance and correlation matrices for a price store's
+# tickers, for universes too large for one dense np.cov (5,000 x 5,000 and up).
+#
+#   1. returns.npy      (S, T) daily returns on the store calendar, NaN where
+#                       missing, written in symbol batches
+#   2. covariance.npy   (S, S) built tile by tile: for a block of tickers a and
+#                       a block b, with X the mean-removed returns (0 where
+#                       missing) and V the presence masks,
+#
+#                         n   = Va Vb'    pairwise observation counts
+#                         sxy = Xa Xb'    sx = Xa Vb'    sy = Va Xb'
+#                         cov = (sxy - sx * sy / n) / (n - 1)
+#
+#                       so every pair uses exactly the dates both tickers have
+#                       (pandas DataFrame.cov semantics)
+#   3. Ledoit-Wolf shrinkage toward a scaled identity, with the intensity
+#      estimated from the same tiles, applied in place; correlation.npy is
+#      the shrunk covariance normalised by its diagonal
+#
+# Only two row blocks and one tile are in memory at a time; the tile size
+# comes from the memory budget. float32 halves both the working set and the
+# files. The .npy files reopen with load(), memory-mapped.
+#
+#   python covariance_matrix.py prices/ cov/ --start 2020-01-01 --end 2024-12-31
+#   python covariance_matrix.py prices/ cov/ --float32 --shrinkage 0.1
+
+MIN_PERIODS = 2
+
+
+def tile_size(n_tickers, n_dates, itemsize, budget_mb=None):
+    # tickers per block so two blocks (X, V, X^2 and the float64 read) plus
+    # the tile's matrices fit the budget
+    budget = (budget_mb or MEMORY_BUDGET_MB) * 2 ** 20
+    per_row = 2 * (3 * itemsize + 8) * n_dates
+    per_cell = 8 * 8
+    b = int((-per_row + math.sqrt(per_row * per_row + 4 * per_cell * budget)) / (2 * per_cell))
+    return max(1, min(b, n_tickers))
+
+
+def returns_panel(store, path, tickers=None, start=None, end=None, budget_mb=None):
+    # aligned (S, T) returns of adj_close on the store calendar, as a .npy memmap
+    tickers = list(tickers or store.symbols)
+    rows_idx = np.array([store.symbol_index[t] for t in tickers], dtype=np.intp)
+    d0, d1 = store.date_range(start, end)
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(len(tickers), d1 - d0))
+    batch, chunk = plan(len(tickers), d1 - d0, 8 * 6, 8, budget_mb)
+    for i0, i1 in batches(len(tickers), batch):
+        rows = rows_idx[i0:i1]
+        last = np.full(len(rows), np.nan)
+        for c0, c1 in batches(d1 - d0, chunk):
+            with span("fetch", name="price_store"):
+                prices = store.block("adj_close", rows, d0 + c0, d0 + c1)
+                present = store.block_present(rows, d0 + c0, d0 + c1)
+            with span("compute", name="returns_panel"):
+                out[i0:i1, c0:c1], last = chunk_returns(prices, present, last)
+    out.flush()
+    return out
+
+
+def _row_means(returns, block):
+    means = np.empty(len(returns))
+    for i0, i1 in batches(len(returns), block):
+        rows = np.asarray(returns[i0:i1])
+        n = np.isfinite(rows).sum(axis=1)
+        with np.errstate(invalid="ignore"):
+            means[i0:i1] = np.where(n > 0, np.nansum(rows, axis=1) / np.maximum(n, 1), 0.0)
+    return means
+
+
+def _block(returns, means, i0, i1, dtype):
+    rows = np.asarray(returns[i0:i1], dtype=np.float64)
+    valid = np.isfinite(rows)
+    x = np.where(valid, rows - means[i0:i1, None], 0.0).astype(dtype)
+    return x, valid.astype(dtype), x * x
+
+
+def blocked_covariance(returns, out_dir, dtype=np.float64, shrinkage=None, min_periods=MIN_PERIODS, budget_mb=None):
+    # returns: (S, T) array or memmap, NaN where missing. Writes
+    # covariance.npy and correlation.npy to out_dir and returns a summary.
+    # shrinkage=None estimates the Ledoit-Wolf intensity; 0 keeps the sample
+    # covariance.
+    dtype = np.dtype(dtype)
+    n_tickers, n_dates = returns.shape
+    block = tile_size(n_tickers, n_dates, dtype.itemsize, budget_mb)
+    os.makedirs(out_dir, exist_ok=True)
+    cov = np.lib.format.open_memmap(os.path.join(out_dir, "covariance.npy"), mode="w+", dtype=dtype,
+                                    shape=(n_tickers, n_tickers))
+    means = _row_means(returns, block)
+
+    # Ledoit-Wolf sums over all pairs, on the 1/n-normalised covariance s:
+    # sum s_ij^2, sum of (mean x_i^2 x_j^2 - s_ij^2) / n_ij, and the diagonal
+    sum_s2 = sum_pi = 0.0
+    diag = np.full(n_tickers, np.nan)
+    min_obs = None
+    spans = list(batches(n_tickers, block))
+    for a, (a0, a1) in enumerate(spans):
+        xa, va, x2a = _block(returns, means, a0, a1, dtype)
+        for b0, b1 in spans[a:]:
+            xb, vb, x2b = (xa, va, x2a) if b0 == a0 else _block(returns, means, b0, b1, dtype)
+            with span("compute", name="covariance_tile"):
+                n = (va @ vb.T).astype(np.float64)
+                sx = (xa @ vb.T).astype(np.float64)
+                sy = (va @ xb.T).astype(np.float64)
+                cross = (xa @ xb.T).astype(np.float64) - sx * sy / np.maximum(n, 1)
+                enough = n >= max(min_periods, 2)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    tile = np.where(enough, cross / (n - 1), np.nan)
+                    s = np.where(enough, cross / n, np.nan)
+                    pi = np.where(enough, ((x2a @ x2b.T).astype(np.float64) / n - s * s) / n, np.nan)
+                weight = 1.0 if b0 == a0 else 2.0
+                sum_s2 += weight * np.nansum(s * s)
+                sum_pi += weight * np.nansum(pi)
+                if b0 == a0:
+                    diag[a0:a1] = np.diagonal(s)
+                if enough.any():
+                    lo = int(n[enough].min())
+                    min_obs = lo if min_obs is None else min(min_obs, lo)
+                cov[a0:a1, b0:b1] = tile
+                if b0 != a0:
+                    cov[b0:b1, a0:a1] = tile.T
+
+    # shrink toward mu * I: delta = min(pi, d2) / d2 with d2 = ||S - mu I||^2
+    have = np.isfinite(diag)
+    mu = float(diag[have].mean()) if have.any() else float("nan")
+    d2 = sum_s2 - have.sum() * mu * mu
+    if shrinkage is None:
+        shrinkage = min(sum_pi, d2) / d2 if d2 > 0 else 0.0
+    shrinkage = float(min(max(shrinkage, 0.0), 1.0))
+
+    corr = np.lib.format.open_memmap(os.path.join(out_dir, "correlation.npy"), mode="w+", dtype=dtype,
+                                     shape=(n_tickers, n_tickers))
+    # mu * I on the ddof=1 scale of the stored covariance
+    sample_var = np.diagonal(cov).astype(np.float64)
+    target = float(np.nanmean(sample_var)) if np.isfinite(sample_var).any() else float("nan")
+    variances = sample_var * (1 - shrinkage) + shrinkage * target
+    scale = 1 / np.sqrt(variances)
+    rows_per_pass = max(1, int((budget_mb or MEMORY_BUDGET_MB) * 2 ** 20 // (4 * 8 * max(n_tickers, 1))))
+    for a0, a1 in batches(n_tickers, rows_per_pass):
+        with span("compute", name="shrink_tile"):
+            rows = np.asarray(cov[a0:a1], dtype=np.float64) * (1 - shrinkage)
+            rows[np.arange(a1 - a0), np.arange(a0, a1)] = variances[a0:a1]
+            cov[a0:a1] = rows
+            corr[a0:a1] = rows * scale[a0:a1, None] * scale[None, :]
+    cov.flush()
+    corr.flush()
+    return {"tickers": n_tickers, "dates": n_dates, "dtype": dtype.name, "block": block,
+            "shrinkage": shrinkage, "target_variance": target, "min_pairwise_obs": min_obs}
+
+
+def build(store, out_dir, tickers=None, start=None, end=None, dtype=np.float64, shrinkage=None,
+          min_periods=MIN_PERIODS, budget_mb=None):
+    tickers = list(tickers or store.symbols)
+    os.makedirs(out_dir, exist_ok=True)
+    with span("compute", name="returns_panel"):
+        returns = returns_panel(store, os.path.join(out_dir, "returns.npy"), tickers, start, end, budget_mb)
+    summary = blocked_covariance(returns, out_dir, dtype, shrinkage, min_periods, budget_mb)
+    d0, d1 = store.date_range(start, end)
+    summary.update(symbols=tickers, start=str(store.dates[d0]) if d1 > d0 else None,
+                   end=str(store.dates[d1 - 1]) if d1 > d0 else None)
+    with open(os.path.join(out_dir, "index.json"), "w") as f:
+        json.dump(summary, f)
+    return summary
+
+
+def load(out_dir, mmap_mode="r"):
+    # (index, covariance, correlation, returns), the arrays memory-mapped
+    with open(os.path.join(out_dir, "index.json")) as f:
+        index = json.load(f)
+    arrays = [np.load(os.path.join(out_dir, name + ".npy"), mmap_mode=mmap_mode)
+              for name in ("covariance", "correlation", "returns")]
+    return (index, *arrays)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Blocked covariance / correlation matrices with shrinkage")
+    parser.add_argument("store", help="directory written by price_store.py build")
+    parser.add_argument("out_dir")
+    parser.add_argument("--symbols", help="comma-separated subset of the store's symbols")
+    parser.add_argument("--start", default=capm.start_date)
+    parser.add_argument("--end", default=capm.end_date)
+    parser.add_argument("--float32", action="store_true", help="float32 tiles and output files")
+    parser.add_argument("--shrinkage", type=float, default=None, help="fixed intensity in [0, 1] (default: Ledoit-Wolf)")
+    parser.add_argument("--min-periods", type=int, default=MIN_PERIODS)
+    parser.add_argument("--budget-mb", type=float, default=None, help="memory budget (default FA_MEMORY_BUDGET_MB)")
+    args = parser.parse_args(argv)
+
+    store = PriceStore(args.store)
+    symbols = [s for s in args.symbols.split(",") if s] if args.symbols else None
+    summary = build(store, args.out_dir, symbols, args.start, args.end, np.float32 if args.float32 else np.float64,
+                    args.shrinkage, args.min_periods, args.budget_mb)
+    print(f"Saved {args.out_dir}: {summary['tickers']} x {summary['tickers']} {summary['dtype']}, "
+          f"shrinkage {summary['shrinkage']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
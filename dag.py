@@ -0,0 +1,129 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Minimal task graph. Each task is a callable that receives its dependencies'
+# results positionally; tasks run on a thread pool as soon as their inputs are
+# ready, so fetches for different symbols overlap with computations whose data
+# already arrived. A failed task fails its dependents unless they are added
+# with allow_failed=True, in which case they receive None for that input.
+
+
+class DependencyFailed(RuntimeError):
+    pass
+
+
+class Task:
+    __slots__ = ("name", "fn", "deps", "allow_failed")
+
+    def __init__(self, name, fn, deps=(), allow_failed=False):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.allow_failed = allow_failed
+
+
+class Graph:
+
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, fn, deps=(), allow_failed=False):
+        # adding an existing name returns it unchanged, so shared inputs are one node
+        if name not in self.tasks:
+            self.tasks[name] = Task(name, fn, deps, allow_failed)
+        return name
+
+    def __contains__(self, name):
+        return name in self.tasks
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def order(self):
+        # topological order; raises on unknown dependencies and cycles
+        indegree = {name: 0 for name in self.tasks}
+        dependents = {name: [] for name in self.tasks}
+        for task in self.tasks.values():
+            for dep in task.deps:
+                if dep not in self.tasks:
+                    raise ValueError(f"Task {task.name!r} depends on unknown task {dep!r}")
+                indegree[task.name] += 1
+                dependents[dep].append(task.name)
+
+        ready = [name for name, n in indegree.items() if n == 0]
+        out = []
+        while ready:
+            name = ready.pop()
+            out.append(name)
+            for child in dependents[name]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+        if len(out) != len(self.tasks):
+            stuck = sorted(name for name, n in indegree.items() if n > 0)
+            raise ValueError(f"Dependency cycle among tasks: {stuck}")
+        return out
+
+    def run(self, workers=8):
+        # Returns (results, errors, timings) keyed by task name.
+        self.order()
+        waiting = {name: len(task.deps) for name, task in self.tasks.items()}
+        dependents = {name: [] for name in self.tasks}
+        for task in self.tasks.values():
+            for dep in task.deps:
+                dependents[dep].append(task.name)
+
+        results, errors, timings = {}, {}, {}
+
+        def execute(task, args):
+            t0 = time.perf_counter()
+            try:
+                return task.fn(*args)
+            finally:
+                timings[task.name] = time.perf_counter() - t0
+
+        def inputs(task):
+            args = []
+            for dep in task.deps:
+                if dep in errors:
+                    if not task.allow_failed:
+                        raise DependencyFailed(f"{task.name}: input {dep!r} failed")
+                    args.append(None)
+                else:
+                    args.append(results[dep])
+            return args
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            running = {}
+
+            def submit(name):
+                task = self.tasks[name]
+                try:
+                    args = inputs(task)
+                except DependencyFailed as e:
+                    finish(name, error=e)
+                    return
+                running[pool.submit(execute, task, args)] = name
+
+            def finish(name, result=None, error=None):
+                if error is None:
+                    results[name] = result
+                else:
+                    errors[name] = error
+                for child in dependents[name]:
+                    waiting[child] -= 1
+                    if waiting[child] == 0:
+                        submit(child)
+
+            for name, n in list(waiting.items()):
+                if n == 0:
+                    submit(name)
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    finish(name, None if error else future.result(), error)
+
+        return results, errors, timings
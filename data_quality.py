@@ -0,0 +1,323 @@
+import atexit
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+import memo
+from instrumentation import span
+from output_sink import ResultSink
+
+# Data-quality gate run on fetched inputs before any computation. The checks
+# run on the whole panel at once: every symbol's rows are concatenated and
+# compared with the previous row of the same symbol using numpy, with no
+# per-symbol loop.
+#
+#   prices      non-monotonic or duplicate dates, missing/non-positive prices,
+#               missing trading days, repeated closes, extreme returns, spikes
+#               (an extreme move reverted by the next bar) and, where a script
+#               trades on it, change_percent that matches neither the
+#               close-to-close nor the open-to-close change (as a decimal or
+#               in percent)
+#   statements  duplicate periods, zero/negative/missing denominators and
+#               assets != liabilities + equity
+#
+# Rows failing a hard check (QUARANTINE) are removed, and the rest pass
+# through in their original shape. The other checks are counted in the report
+# only. When anything is flagged, a per-symbol report `<name>_quality` and the
+# removed rows `<name>_quarantine` are written through output_sink, and a
+# one-line summary goes to stderr. A run that gates in several calls (one per
+# batch, or from run_all's threads) appends each flagged call's rows to the
+# same two files, which are closed at exit.
+#
+#   FA_QUALITY             gate (default) | report (flag, never remove) | off
+#   FA_QUALITY_MAX_RETURN  |daily log return| counted as extreme (default 0.5)
+
+MODE = os.environ.get("FA_QUALITY", "gate").lower()
+
+MAX_LOG_RETURN = float(os.environ.get("FA_QUALITY_MAX_RETURN", 0.5))
+MAX_MISSING_FRACTION = 0.05
+CHANGE_TOL = 1e-4
+IDENTITY_TOL = 0.01
+EQUITY_FIELDS = ("total_equity", "total_stockholders_equity", "total_shareholders_equity")
+DENOMINATORS = ("total_assets", "total_liabilities")
+
+PRICE_CHECKS = ("non_monotonic", "bad_price", "repeated_close", "extreme_return", "spike", "bad_change_percent")
+STATEMENT_CHECKS = ("non_monotonic", "bad_denominator", "identity")
+QUARANTINE = {"non_monotonic", "bad_price", "spike", "bad_change_percent", "bad_denominator", "identity"}
+
+STATUS_OK = "OK"
+STATUS_WARNING = "Warning"
+STATUS_QUARANTINED = "Quarantined"
+
+# {output name: ResultSink} and {name: {symbol: latest report row}} for this process
+_sinks = {}
+_latest = {}
+_emit_lock = threading.Lock()
+
+
+def _dates(df):
+    values = df["date"].to_numpy() if "date" in df.columns else df.index.to_numpy()
+    try:
+        # datetime64, datetime.date and ISO strings convert without pandas' parser
+        return values.astype("datetime64[D]")
+    except (TypeError, ValueError):
+        return pd.to_datetime(values).to_numpy(dtype="datetime64[D]")
+
+
+def _column(df, name):
+    if name not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _stack(frames, columns):
+    # every symbol's rows end to end, plus a "same symbol as the previous row" mask
+    symbols = list(frames)
+    lengths = np.array([len(frames[s]) for s in symbols], dtype=np.intp)
+    code = np.repeat(np.arange(len(symbols)), lengths)
+    same = np.zeros(len(code), dtype=bool)
+    same[1:] = code[1:] == code[:-1]
+    stacked = {c: np.concatenate([_column(frames[s], c) for s in symbols]) if symbols else np.empty(0)
+               for c in columns}
+    dates = np.concatenate([_dates(frames[s]) for s in symbols]) if symbols else np.empty(0, "datetime64[D]")
+    return symbols, lengths, code, same, dates, stacked
+
+
+def _prev(x, same):
+    out = np.empty_like(x)
+    if len(x):
+        out[0] = np.nan if x.dtype.kind == "f" else x[0]
+        out[1:] = x[:-1]
+    return np.where(same, out, np.nan) if x.dtype.kind == "f" else out
+
+
+def price_flags(frames, price="close", calendar="B", change_percent=False):
+    # (row flags as a DataFrame, missing trading days per symbol)
+    symbols, lengths, code, same, dates, cols = _stack(frames, [price, "open", "change_percent"])
+    close = cols[price]
+    prev_close = _prev(close, same)
+    prev_date = _prev(dates, same)
+
+    flags = {"non_monotonic": same & (dates <= prev_date),
+             "bad_price": ~(close > 0)}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logret = np.log(close / prev_close)
+        simple = close / prev_close - 1
+    flags["repeated_close"] = same & (close == prev_close)
+    extreme = np.abs(logret) > MAX_LOG_RETURN
+    # a spike jumps and the next bar of the same symbol jumps back
+    next_logret = np.append(logret[1:], np.nan)
+    next_same = np.append(same[1:], False)
+    flags["spike"] = extreme & next_same & (np.abs(next_logret) > MAX_LOG_RETURN) & (np.sign(next_logret) == -np.sign(logret))
+    flags["extreme_return"] = extreme & ~flags["spike"] & ~np.append(False, flags["spike"][:-1])
+
+    if change_percent:
+        has_change = np.repeat(np.array(["change_percent" in frames[s].columns for s in symbols], dtype=bool),
+                               lengths)
+        cp = cols["change_percent"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            intraday = close / cols["open"] - 1
+        mismatch = np.ones(len(cp), dtype=bool)
+        for change in (simple, intraday):
+            mismatch &= ~(np.abs(cp - change) <= CHANGE_TOL) & ~(np.abs(cp / 100 - change) <= CHANGE_TOL)
+        # a symbol's first bar has no previous close and is only checked for NaN
+        checkable = np.isfinite(simple)
+        flags["bad_change_percent"] = has_change & (~np.isfinite(cp) | (checkable & mismatch))
+
+    out = pd.DataFrame({"symbol": pd.Categorical.from_codes(code, symbols),
+                        "row": np.arange(len(code)) - np.repeat(np.cumsum(lengths) - lengths, lengths),
+                        "date": dates, **flags})
+
+    # expected bars between each symbol's first and last date, less the
+    # distinct dates it has
+    valid = ~np.isnat(dates)
+    days = dates.astype(np.int64)
+    counts = np.bincount(code[valid], minlength=len(symbols))
+    has = np.flatnonzero(counts)
+    starts = (np.cumsum(lengths) - lengths)[has]
+    first = np.minimum.reduceat(np.where(valid, days, np.iinfo(np.int64).max), starts)
+    last = np.maximum.reduceat(np.where(valid, days, np.iinfo(np.int64).min), starts)
+    first_d, last_d = first.astype("datetime64[D]"), last.astype("datetime64[D]")
+    if calendar == "B":
+        expected = np.busday_count(first_d, last_d + np.timedelta64(1, "D"))
+    else:
+        expected = last - first + 1
+    offset = days[valid] - (days[valid].min() if valid.any() else 0)
+    keys = np.sort(code[valid].astype(np.int64) << 32 | offset)
+    first_of_key = np.append(True, keys[1:] != keys[:-1]) if len(keys) else np.empty(0, dtype=bool)
+    distinct = np.bincount(keys[first_of_key] >> 32, minlength=len(symbols))[has]
+    missing = pd.Series(0, index=symbols, dtype=np.int64)
+    missing.iloc[has] = np.maximum(expected - distinct, 0)
+    return out, missing
+
+
+def statement_flags(frames, denominators=DENOMINATORS):
+    # frames: {symbol: statement DataFrame}, one row per period; the balance
+    # sheet identity is checked when assets, liabilities and equity are present
+    columns = list(dict.fromkeys(list(denominators) + ["total_assets", "total_liabilities", *EQUITY_FIELDS]))
+    frames = {s: (df if "period_ending" in df.columns else df.reset_index()) for s, df in frames.items()}
+    frames = {s: df.assign(date=df["period_ending"]) if "period_ending" in df.columns else df for s, df in frames.items()}
+    symbols, lengths, code, same, dates, cols = _stack(frames, columns)
+
+    # earlier rows with the same period_ending make later ones duplicates
+    dup = pd.DataFrame({"code": code, "date": dates}).duplicated().to_numpy()
+    present = {c: np.repeat(np.array([c in frames[s].columns for s in symbols], dtype=bool), lengths)
+               for c in columns}
+    bad = np.zeros(len(code), dtype=bool)
+    for c in denominators:
+        bad |= present[c] & ~(cols[c] > 0)
+
+    equity = np.full(len(code), np.nan)
+    for c in EQUITY_FIELDS:
+        equity = np.where(np.isnan(equity) & present[c], cols[c], equity)
+    assets, liabilities = cols["total_assets"], cols["total_liabilities"]
+    checkable = np.isfinite(assets) & np.isfinite(liabilities) & np.isfinite(equity)
+    identity = checkable & (np.abs(assets - liabilities - equity) > IDENTITY_TOL * np.abs(assets))
+
+    flags = pd.DataFrame({"symbol": pd.Categorical.from_codes(code, symbols),
+                          "row": np.arange(len(code)) - np.repeat(np.cumsum(lengths) - lengths, lengths),
+                          "date": dates, "non_monotonic": dup, "bad_denominator": bad, "identity": identity})
+    return flags, pd.Series(0, index=symbols, dtype=np.int64)
+
+
+def quality_report(flags, missing, checks, lengths):
+    # one row per symbol: row count, count per check, quarantined rows, status
+    checks = [c for c in checks if c in flags.columns]
+    by_symbol = flags.groupby("symbol", sort=False, observed=True)[list(checks)].sum()
+    hard = flags[[c for c in checks if c in QUARANTINE]].any(axis=1)
+    report = pd.DataFrame({"Symbol": list(lengths.index), "Rows": lengths.to_numpy()})
+    for c in checks:
+        report[c] = by_symbol[c].reindex(lengths.index, fill_value=0).to_numpy().astype(np.int64)
+    report["missing_days"] = missing.reindex(lengths.index, fill_value=0).to_numpy()
+    report["quarantined"] = hard.groupby(flags["symbol"], observed=True).sum().reindex(lengths.index, fill_value=0).to_numpy()
+    soft = report[[c for c in checks if c not in QUARANTINE]].sum(axis=1) > 0
+    soft |= report["missing_days"] > MAX_MISSING_FRACTION * (report["Rows"] + report["missing_days"])
+    report["Status"] = np.where(report["quarantined"] > 0, STATUS_QUARANTINED, np.where(soft, STATUS_WARNING, STATUS_OK))
+    return report, hard.to_numpy()
+
+
+def _sink(name):
+    # one appending sink per output for the whole run, closed at exit
+    if name not in _sinks:
+        _sinks[name] = ResultSink(name)
+    return _sinks[name]
+
+
+def _emit(name, report, flags, hard, checks):
+    if (report["Status"] == STATUS_OK).all():
+        return
+    counts = ", ".join(f"{c}={int(report[c].sum())}" for c in list(checks) + ["missing_days", "quarantined"]
+                       if c in report.columns and report[c].sum())
+    print(f"data quality [{name}]: {int((report['Status'] != STATUS_OK).sum())} of {len(report)} symbols flagged "
+          f"({counts})", file=sys.stderr)
+    quarantine = flags[hard].reset_index(drop=True)
+    quarantine["symbol"] = quarantine["symbol"].astype(object)
+    with _emit_lock:
+        # a symbol gated again (a retried batch) is appended only when its
+        # report row changed, so the later row supersedes the earlier one
+        latest = _latest.setdefault(name, {})
+        keys = list(report.itertuples(index=False, name=None))
+        new = np.array([latest.get(k[0]) != k for k in keys], dtype=bool)
+        if not new.any():
+            return
+        latest.update((k[0], k) for k, n in zip(keys, new) if n)
+        report = report[new]
+        quarantine = quarantine[quarantine["symbol"].isin(report["Symbol"])]
+        for suffix, frame in (("quality", report), ("quarantine", quarantine)):
+            if len(frame):
+                sink = _sink(f"{name}_{suffix}")
+                sink.write(frame)
+                sink.flush()
+
+
+def _close_sinks():
+    with _emit_lock:
+        for sink in _sinks.values():
+            sink.close()
+
+
+atexit.register(_close_sinks)
+
+
+def _drop(frames, flags, hard):
+    if not hard.any():
+        return frames
+    out = dict(frames)
+    for symbol, rows in flags[hard].groupby("symbol", sort=False, observed=True)["row"]:
+        keep = np.ones(len(frames[symbol]), dtype=bool)
+        keep[rows.to_numpy()] = False
+        out[symbol] = frames[symbol][keep].copy()
+    return out
+
+
+def gate_prices(frames, name, price="close", calendar="B", change_percent=False):
+    # frames: {symbol: price DataFrame, date column or index}; returns the
+    # frames with quarantined rows removed (FA_QUALITY=gate)
+    if MODE == "off" or not frames:
+        return frames
+    with span("transform", name="data_quality"):
+        flags, missing = price_flags(frames, price, calendar, change_percent)
+        lengths = pd.Series({s: len(df) for s, df in frames.items()})
+        report, hard = quality_report(flags, missing, PRICE_CHECKS, lengths)
+        _emit(name, report, flags, hard, PRICE_CHECKS)
+        return _drop(frames, flags, hard) if MODE == "gate" else frames
+
+
+@memo.memoize(deps=(statement_flags, quality_report, _stack, _column, _dates),
+              version=f"{IDENTITY_TOL} {MAX_MISSING_FRACTION} {EQUITY_FIELDS} {STATEMENT_CHECKS} {sorted(QUARANTINE)}")
+def check_statements(frames, denominators=DENOMINATORS):
+    # (flags, report, hard) for gate_statements; pure in the frames, so it is
+    # memoized on disk when FA_MEMO_DIR is set (memo.py)
+    flags, missing = statement_flags(frames, denominators)
+    lengths = pd.Series({s: len(df) for s, df in frames.items()})
+    report, hard = quality_report(flags, missing, STATEMENT_CHECKS, lengths)
+    return flags, report, hard
+
+
+def _without_periods(res, periods):
+    # copy of an OBBject-like result without the records for `periods`
+    import copy
+
+    out = copy.copy(res)
+    out.results = [r for r in res.results if getattr(r, "period_ending", None) not in periods]
+    return out
+
+
+def fetch_all(fetch, symbols):
+    # {symbol: fetch(symbol)} for every symbol whose fetch succeeds, so a
+    # batch can be gated at once; a failed symbol is left out and its analysis
+    # fetches it again and reports the error as it would on its own
+    out = {}
+    for symbol in symbols:
+        try:
+            out[symbol] = fetch(symbol)
+        except Exception:
+            pass
+    return out
+
+
+def gate_statements(statements, name, denominators=DENOMINATORS, balance_index=1):
+    # statements: {symbol: (income, balance, cash, ...) OBBject tuple}. Checks
+    # the balance sheets and drops a quarantined period from every statement,
+    # so income/balance/cash records stay aligned
+    if MODE == "off" or not statements:
+        return statements
+    with span("transform", name="data_quality"):
+        frames = {}
+        for symbol, results in statements.items():
+            records = getattr(results[balance_index], "results", None) or []
+            frames[symbol] = pd.DataFrame([r.model_dump() for r in records])
+            if frames[symbol].empty:
+                frames[symbol] = pd.DataFrame({"period_ending": pd.Series([], dtype="datetime64[ns]")})
+        flags, report, hard = check_statements(frames, denominators)
+        _emit(name, report, flags, hard, STATEMENT_CHECKS)
+        if MODE != "gate" or not hard.any():
+            return statements
+        out = dict(statements)
+        for symbol, rows in flags[hard].groupby("symbol", sort=False, observed=True)["row"]:
+            periods = set(frames[symbol]["period_ending"].iloc[rows.to_numpy()])
+            out[symbol] = tuple(_without_periods(res, periods) for res in statements[symbol])
+        return out
@@ -0,0 +1,54 @@
+import builtins
+import os
+import sys
+
+from output_sink import write_frame
+
+# Picks the `obb` the analysis scripts talk to. FA_DATA_SOURCE=openbb (default)
+# uses the OpenBB platform through lazy_obb.LazyOBB, which imports openbb only
+# when a call misses the FA_CACHE_DIR cache; FA_DATA_SOURCE=local uses
+# local_provider.LocalOBB, configured through the FA_LOCAL_* variables, so
+# every script runs offline.
+
+DATA_SOURCE = os.environ.get("FA_DATA_SOURCE", "openbb").lower()
+
+
+def save_output(df, name=None, dtypes=None):
+    # Installed (through _df_to_csv) as df_to_csv when the hosting environment
+    # has not provided one. Writes CSV by default, or Parquet / Arrow per
+    # FA_OUTPUT_FORMAT; dtypes (a script's COLUMN_DTYPES) fixes the typed
+    # formats' column types.
+    name = name or os.path.splitext(os.path.basename(sys.argv[0] or "result"))[0] or "result"
+    path = write_frame(df, name, dtypes=dtypes)
+    print(f"Saved {path}")
+    return path
+
+
+def _df_to_csv(df, name=None):
+    # df_to_csv(df) from a script's __main__: the calling module's declared
+    # COLUMN_DTYPES apply, as they do through run_all, shard and checkpoint
+    return save_output(df, name, sys._getframe(1).f_globals.get("COLUMN_DTYPES"))
+
+
+def source_params():
+    # what fetched data depends on, for run keys (checkpoint.py, shard.py): in
+    # local mode the synthetic universe's size, history, end date and seed
+    params = {"data_source": DATA_SOURCE}
+    if DATA_SOURCE == "local":
+        params["local"] = {"symbols": obb.n_symbols, "years": obb.years, "end_date": str(obb.end_date.date()),
+                           "seed": obb.seed, "data_dir": obb.data_dir}
+    return params
+
+
+if DATA_SOURCE == "local":
+    from local_provider import LocalOBB
+
+    obb = LocalOBB.from_env()
+    if not hasattr(builtins, "df_to_csv"):
+        builtins.df_to_csv = _df_to_csv
+elif DATA_SOURCE == "openbb":
+    from lazy_obb import LazyOBB
+
+    obb = LazyOBB.from_env()
+else:
+    raise ValueError(f"Unknown FA_DATA_SOURCE: {DATA_SOURCE!r} (expected 'openbb' or 'local')")
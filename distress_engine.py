@@ -0,0 +1,359 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from fundamentals_arrays import StatementArrays
+
+# Vectorized version of calculate_distress_score in financial_distress_analysis.py.
+# Works on a (ticker x quarter x line-item) array so thousands of issuers are
+# scored in one pass. Quarters run oldest -> newest.
+
+QUARTER_DATES = [
+    "2022-09-30",
+    "2022-12-31",
+    "2023-03-31",
+    "2023-06-30",
+    "2023-09-30",
+    "2023-12-31",
+    "2024-03-31",
+    "2024-06-30",
+]
+
+INCOME_ITEMS = ["revenue", "net_income", "operating_income", "ebit"]
+BALANCE_ITEMS = ["total_assets", "current_assets", "current_liabilities", "retained_earnings", "total_liabilities"]
+CASH_ITEMS = ["operating_cash_flow"]
+
+LINE_ITEMS = INCOME_ITEMS + BALANCE_ITEMS + CASH_ITEMS
+ITEM = {name: k for k, name in enumerate(LINE_ITEMS)}
+
+# line item -> (statement, provider field, default), same getattr(..., d) or d
+# fallbacks the scalar version uses
+ITEM_SOURCES = {
+    "revenue": ("income", "revenue", 0.0),
+    "net_income": ("income", "consolidated_net_income", 0.0),
+    "operating_income": ("income", "total_operating_income", 0.0),
+    "ebit": ("income", "total_operating_income", 0.0),
+    "total_assets": ("balance", "total_assets", 1.0),
+    "current_assets": ("balance", "total_current_assets", 0.0),
+    "current_liabilities": ("balance", "total_current_liabilities", 0.0),
+    "retained_earnings": ("balance", "retained_earnings", 0.0),
+    "total_liabilities": ("balance", "total_liabilities", 1.0),
+    "operating_cash_flow": ("cash", "operating_cash_flow", 0.0),
+}
+
+STATEMENT_ITEMS = {
+    "income": INCOME_ITEMS,
+    "balance": BALANCE_ITEMS,
+    "cash": CASH_ITEMS,
+}
+
+Z_WEIGHTS = np.array([0.1, 0.2, 0.3, 0.4])
+WINDOW = len(QUARTER_DATES)
+
+TABLE_COLUMNS = {
+    "Z Contribution": "z_contribution",
+    "F Contribution": "f_contribution",
+    "M Contribution": "m_contribution",
+    "Volatility Penalty": "volatility_penalty",
+    "Distress Score": "distress_score",
+}
+
+
+def sigmoid(x):
+    with np.errstate(over="ignore"):
+        return 1 / (1 + np.exp(-x))
+
+
+def _match_quarters(results, quarters):
+    # first record whose period_ending contains the quarter date, like the scalar loop
+    found = [None] * len(quarters)
+    for rec in results or []:
+        if not hasattr(rec, "period_ending"):
+            continue
+        pe = str(rec.period_ending)
+        for q, q_date in enumerate(quarters):
+            if found[q] is None and q_date in pe:
+                found[q] = rec
+    return found
+
+
+def _fill_from_arrays(out, store, items, quarters):
+    # column reads straight from a StatementArrays, no per-record attribute access
+    pe = store.period_endings()
+    for q, q_date in enumerate(quarters):
+        hits = np.flatnonzero(np.char.find(pe, q_date) >= 0)
+        if len(hits) == 0:
+            continue
+        for name in items:
+            _, field, default = ITEM_SOURCES[name]
+            v = store.column(field)[hits[0]]
+            out[q, ITEM[name]] = default if np.isnan(v) or v == 0 else v
+
+
+def build_panel(statements, quarters=QUARTER_DATES):
+    # statements: {ticker: {"income": results, "balance": results, "cash": results}},
+    # where each entry is an obb results list or a StatementArrays
+    # Returns tickers, values (T, Q, F) with NaN where a statement is missing for a
+    # quarter, and an `available` mask (False when any statement list is empty).
+    tickers = list(statements)
+    values = np.full((len(tickers), len(quarters), len(LINE_ITEMS)), np.nan)
+    available = np.zeros(len(tickers), dtype=bool)
+
+    for t, ticker in enumerate(tickers):
+        stmts = statements[ticker]
+        available[t] = all(bool(stmts.get(s)) for s in STATEMENT_ITEMS)
+
+        for stmt, items in STATEMENT_ITEMS.items():
+            if isinstance(stmts.get(stmt), StatementArrays):
+                _fill_from_arrays(values[t], stmts[stmt], items, quarters)
+                continue
+            matched = _match_quarters(stmts.get(stmt), quarters)
+            for q, rec in enumerate(matched):
+                if rec is None:
+                    continue
+                for name in items:
+                    _, field, default = ITEM_SOURCES[name]
+                    values[t, q, ITEM[name]] = getattr(rec, field, default) or default
+
+    return tickers, values, available
+
+
+def _compact(block):
+    # Drop missing quarters and right-align what is left, so [:, -k] is the k-th
+    # most recent reported quarter, matching the scalar version's appended lists.
+    present = ~np.isnan(block[..., 0])
+    order = np.argsort(present, axis=1, kind="stable")
+    return np.take_along_axis(block, order[..., None], axis=1), present.sum(axis=1)
+
+
+def _div(a, b, default):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(b != 0, a / np.where(b != 0, b, 1), default)
+
+
+def altman_z(q):
+    # raw quarterly Z from a {line item: array} mapping
+    ta, tl = q["total_assets"], q["total_liabilities"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (
+            0.717 * ((q["current_assets"] - q["current_liabilities"]) / ta) +
+            0.847 * (q["retained_earnings"] / ta) +
+            3.107 * (q["ebit"] / ta) +
+            0.420 * _div(ta - tl, tl, 1) +
+            0.998 * (q["revenue"] / ta)
+        )
+
+
+def f_flags(cur, prior, year_ago):
+    # nine Piotroski-style tests, current quarter vs the same quarter a year earlier
+    ni1, ta1, ta5 = cur["net_income"], cur["total_assets"], prior["total_assets"]
+    ocf1 = cur["operating_cash_flow"]
+    flags = [
+        ni1 > 0,
+        ocf1 > 0,
+        year_ago & (_div(ni1, ta1, 0) > _div(prior["net_income"], ta5, 0)),
+        ocf1 > ni1,
+        year_ago & (_div(cur["total_liabilities"], ta1, 1) < _div(prior["total_liabilities"], ta5, 1)),
+        year_ago & (_div(cur["current_assets"], cur["current_liabilities"], 1) >
+                    _div(prior["current_assets"], prior["current_liabilities"], 1)),
+        np.ones_like(year_ago),  # assuming no new equity is issued
+        _div(cur["operating_income"], cur["revenue"], 0) > _div(prior["operating_income"], prior["revenue"], 0),
+        _div(cur["revenue"], ta1, 0) > _div(prior["revenue"], ta5, 0),
+    ]
+    return np.stack(flags, axis=-1).astype(np.int8)
+
+
+def f_momentum(ni1, ni4, has_four):
+    return np.where(has_four, np.clip(_div(ni1 - ni4, np.abs(ni4), 0), -3, 3), 0.0)
+
+
+M_INDICES = ["dsri", "gmi", "aqi", "sgi", "depi", "sgai", "lvgi", "tata"]
+
+
+def m_indices(cur, prior, year_ago, has_cash):
+    rev1, rev5 = cur["revenue"], prior["revenue"]
+    oi1, oi5 = cur["operating_income"], prior["operating_income"]
+    ta1, ta5 = cur["total_assets"], prior["total_assets"]
+    tl1, tl5 = cur["total_liabilities"], prior["total_liabilities"]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        both_rev = (rev5 != 0) & (rev1 != 0)
+        indices = [
+            rev1 / rev5,
+            np.where((oi5 != 0) & (rev5 != 0), _div(oi5 / rev5, _div(oi1, rev1, 0), 1), 1.0),
+            np.where(year_ago, _div(_div(ta1 - cur["current_assets"], ta1, 0),
+                                    _div(ta5 - prior["current_assets"], ta5, 0), 1), 1.0),
+            rev1 / rev5,
+            np.where(both_rev, _div(1 - (oi5 / rev5), 1 - (oi1 / rev1), 1), 1.0),
+            np.where(both_rev, _div((rev1 - oi1) / rev1, (rev5 - oi5) / rev5, 1), 1.0),
+            np.where((tl5 != 0) & (ta5 != 0), _div(_div(tl1, ta1, 0), tl5 / ta5, 1), 1.0),
+            np.where(has_cash & (ta1 != 0), (cur["net_income"] - cur["operating_cash_flow"]) / ta1, 0.0),
+        ]
+    return np.stack(indices, axis=-1)
+
+
+def m_score(indices, active):
+    dsri, gmi, aqi, sgi, depi, sgai, lvgi, tata = np.moveaxis(indices, -1, 0)
+    return np.where(
+        active,
+        -4.84 +
+        0.92 * dsri +
+        0.528 * gmi +
+        0.404 * aqi +
+        0.892 * sgi +
+        0.115 * depi -
+        0.172 * sgai +
+        4.679 * tata -
+        0.327 * lvgi,
+        -5.0,
+    )
+
+
+def volatility_penalty(means, stds, full):
+    # means/stds: (..., 3) for revenue, net income and operating cash flow
+    rev_vol = _div(stds[..., 0], means[..., 0], 0)
+    earnings_vol = _div(stds[..., 1], np.abs(means[..., 1]), 0)
+    cf_vol = _div(stds[..., 2], np.abs(means[..., 2]), 0)
+    with np.errstate(over="ignore", invalid="ignore"):
+        return np.where(full, np.exp(-(rev_vol + earnings_vol + cf_vol)), 1.0)
+
+
+def combine(z_raw, f_score, f_mom, m, penalty, failed):
+    # z_raw: (N, 4) raw Z for the last four quarters, oldest first
+    z_scores = sigmoid(0.5 * (z_raw - 1.8))
+    z_contribution = (
+        z_scores[:, 0] * Z_WEIGHTS[0] + z_scores[:, 1] * Z_WEIGHTS[1] +
+        z_scores[:, 2] * Z_WEIGHTS[2] + z_scores[:, 3] * Z_WEIGHTS[3]
+    ) * 40
+
+    f_contribution = (f_score + f_mom * 0.5) / 12 * 35
+    m_contribution = (1 - sigmoid(m)) * 25
+
+    base_score = z_contribution + f_contribution + m_contribution
+
+    z_last = z_scores[:, -1]
+    interaction_multiplier = np.where(
+        (z_last < sigmoid(0.5 * (1.8 - 1.8))) & (f_score < 5), 0.7,
+        np.where((z_last > sigmoid(0.5 * (3 - 1.8))) & (f_score > 7), 1.2, 1.0),
+    )
+
+    volatility_adjusted = base_score * interaction_multiplier * (0.6 + 0.4 * penalty)
+    distress_score = np.round(100 / (1 + np.exp(-0.1 * (volatility_adjusted - 50))), 1)
+
+    # rows the scalar version would have errored on fall back to its neutral 50.0
+    distress_score = np.where(failed, 50.0, distress_score)
+
+    def _mask(x):
+        return np.where(failed, np.nan, x)
+
+    return {
+        "z_contribution": _mask(z_contribution),
+        "f_score": np.where(failed, -1, f_score),
+        "f_contribution": _mask(f_contribution),
+        "m_score": _mask(m),
+        "m_contribution": _mask(m_contribution),
+        "volatility_penalty": _mask(penalty),
+        "distress_score": distress_score,
+        "failed": failed,
+    }
+
+
+def score_panel(values, available=None):
+    values = np.asarray(values, dtype=float)
+    n_tickers = values.shape[0]
+    if available is None:
+        available = np.ones(n_tickers, dtype=bool)
+
+    blocks = {}
+    for stmt, items in STATEMENT_ITEMS.items():
+        blocks[stmt] = _compact(values[..., [ITEM[x] for x in items]])
+    n_i, n_b, n_c = blocks["income"][1], blocks["balance"][1], blocks["cash"][1]
+
+    def quarter(k):
+        # k-th most recent reported value of every line item, NaN when missing
+        q = {}
+        for stmt, items in STATEMENT_ITEMS.items():
+            block, n = blocks[stmt]
+            for j, name in enumerate(items):
+                if block.shape[1] < k:
+                    q[name] = np.full(n_tickers, np.nan)
+                else:
+                    q[name] = np.where(n >= k, block[:, -k, j], np.nan)
+        return q
+
+    failed = ~available
+
+    z_raw = np.ones((n_tickers, 4))
+    for j, k in enumerate(range(4, 0, -1)):
+        q = quarter(k)
+        use = (n_b >= k) & (q["total_assets"] != 0)
+        failed |= use & (n_i < k)
+        z_raw[:, j] = np.where(use, altman_z(q), 1.0)
+
+    cur, prior = quarter(1), quarter(5)
+    full = n_i >= 8
+    year_ago = n_b >= 5
+    failed |= full & ((n_c < 1) | ~year_ago)
+
+    f_score = np.where(full, f_flags(cur, prior, year_ago).sum(axis=1), 0)
+    f_mom = f_momentum(cur["net_income"], quarter(4)["net_income"], n_i >= 4)
+
+    m_active = (n_i >= 5) & (prior["revenue"] != 0)
+    failed |= m_active & ~year_ago
+    m = m_score(m_indices(cur, prior, year_ago, n_c > 0), m_active)
+
+    with warnings.catch_warnings():
+        # nanmean/nanstd warn on all-NaN rows; those rows are masked anyway
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        series = np.stack([
+            blocks["income"][0][..., INCOME_ITEMS.index("revenue")],
+            blocks["income"][0][..., INCOME_ITEMS.index("net_income")],
+            blocks["cash"][0][..., 0],
+        ], axis=-1)
+        penalty = volatility_penalty(np.nanmean(series, axis=1), np.nanstd(series, axis=1), full)
+
+    return combine(z_raw, f_score, f_mom, m, penalty, failed)
+
+
+def score_table(tickers, values, available=None, assessment_date=None):
+    scores = score_panel(values, available)
+    table = pd.DataFrame({"Ticker": list(tickers), "Assessment Date": assessment_date or QUARTER_DATES[-1]})
+    for column, key in TABLE_COLUMNS.items():
+        table[column] = scores[key]
+    return table
+
+
+def quarter_ends(start, end):
+    # calendar quarter-end dates between start and end, oldest first
+    return list(pd.period_range(start, end, freq="Q").end_time.strftime("%Y-%m-%d"))
+
+
+def score_history(tickers, values, quarters, available=None, min_quarters=WINDOW):
+    # Score every eight-quarter window of a longer (T, Q, F) panel in one call.
+    # A window is kept when its last quarter is fully reported and at least
+    # `min_quarters` of its quarters have an income statement.
+    values = np.asarray(values, dtype=float)
+    n_tickers, n_quarters, n_items = values.shape
+    if available is None:
+        available = np.ones(n_tickers, dtype=bool)
+    if n_quarters < WINDOW:
+        return pd.DataFrame(columns=["Ticker", "Assessment Date"] + list(TABLE_COLUMNS))
+
+    n_windows = n_quarters - WINDOW + 1
+    windows = sliding_window_view(values, WINDOW, axis=1)  # (T, n_windows, F, WINDOW) view
+    windows = np.moveaxis(windows, -1, 2).reshape(-1, WINDOW, n_items)
+
+    reported = ~np.isnan(windows[..., ITEM["revenue"]])
+    keep = (reported.sum(axis=1) >= min_quarters) & ~np.isnan(windows[:, -1]).any(axis=1)
+
+    scores = score_panel(windows[keep], np.repeat(available, n_windows)[keep])
+
+    table = pd.DataFrame({
+        "Ticker": np.repeat(np.asarray(tickers, dtype=object), n_windows)[keep],
+        "Assessment Date": np.tile(np.asarray(quarters[WINDOW - 1:], dtype=object), n_tickers)[keep],
+    })
+    for column, key in TABLE_COLUMNS.items():
+        table[column] = scores[key]
+    return table.reset_index(drop=True)
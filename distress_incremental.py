@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+
+import distress_engine as de
+
+# Persisted per-ticker state for the distress score, so a newly filed quarter
+# updates one ticker's score in constant time instead of refetching and
+# rescoring the whole eight-quarter window for the universe.
+#
+# A quarter may come without some of its statements (all of a statement's
+# line items NaN). The window keeps them missing, and a ticker with a gap in
+# its window is scored by distress_engine.score_panel on that window, which
+# uses each statement's own latest filings; the running sums count a gap as
+# the scalar defaults, so they stay consistent when the quarter drops out.
+
+WINDOW = de.WINDOW
+Z_QUARTERS = len(de.Z_WEIGHTS)
+VOL_ITEMS = [de.ITEM["revenue"], de.ITEM["net_income"], de.ITEM["operating_cash_flow"]]
+
+_DEFAULTS = np.array([de.ITEM_SOURCES[name][2] for name in de.LINE_ITEMS])
+# line-item columns of each statement; a statement with all of them NaN was not filed
+_STATEMENT_COLUMNS = [[de.ITEM[name] for name in items] for items in de.STATEMENT_ITEMS.values()]
+_BALANCE = list(de.STATEMENT_ITEMS).index("balance")
+
+# name -> (trailing shape, dtype, fill) for every per-ticker array in the state
+_FIELDS = {
+    "window": ((WINDOW, len(de.LINE_ITEMS)), float, np.nan),
+    "period_ending": ((WINDOW,), "U10", ""),
+    "count": ((), np.int64, 0),
+    "z_raw": ((Z_QUARTERS,), float, 1.0),
+    "f_flags": ((9,), np.int8, 0),
+    "m_inputs": ((len(de.M_INDICES),), float, np.nan),
+    "vol_shift": ((3,), float, 0.0),
+    "vol_sum": ((3,), float, 0.0),
+    "vol_sumsq": ((3,), float, 0.0),
+    "z_contribution": ((), float, np.nan),
+    "f_contribution": ((), float, np.nan),
+    "m_contribution": ((), float, np.nan),
+    "volatility_penalty": ((), float, np.nan),
+    "distress_score": ((), float, np.nan),
+}
+
+
+def _filed(values):
+    # (..., 3) whether each statement has any line item in values (..., F)
+    return np.stack([~np.isnan(values[..., cols]).all(axis=-1) for cols in _STATEMENT_COLUMNS], axis=-1)
+
+
+def _filled(values):
+    # the scalar version's fallbacks for missing or zero line items
+    return np.where(np.isnan(values) | (values == 0), _DEFAULTS, values)
+
+
+class DistressState:
+
+    def __init__(self):
+        self.tickers = []
+        self.index = {}
+        for name, (shape, dtype, fill) in _FIELDS.items():
+            setattr(self, name, np.full((0,) + shape, fill, dtype=dtype))
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def _rows(self, tickers):
+        missing = [t for t in dict.fromkeys(tickers) if t not in self.index]
+        if missing:
+            for t in missing:
+                self.index[t] = len(self.tickers)
+                self.tickers.append(t)
+            for name, (shape, dtype, fill) in _FIELDS.items():
+                extra = np.full((len(missing),) + shape, fill, dtype=dtype)
+                setattr(self, name, np.concatenate([getattr(self, name), extra]))
+        return np.array([self.index[t] for t in tickers], dtype=np.int64)
+
+    def _accumulate(self, rows, values, sign):
+        x = _filled(values)[:, VOL_ITEMS] - self.vol_shift[rows]
+        self.vol_sum[rows] += sign * x
+        self.vol_sumsq[rows] += sign * x * x
+
+    def ingest(self, ticker, period_ending, values):
+        self.ingest_many([ticker], [period_ending], [values])
+
+    def ingest_statements(self, ticker, income, balance, cash):
+        # one quarter's income/balance/cash records, read with the scalar fallbacks
+        records = {"income": income, "balance": balance, "cash": cash}
+        values = []
+        for name in de.LINE_ITEMS:
+            stmt, field, default = de.ITEM_SOURCES[name]
+            values.append(getattr(records[stmt], field, default) or default)
+        self.ingest(ticker, str(income.period_ending)[:10], values)
+
+    def ingest_many(self, tickers, period_endings, values):
+        # One new (or restated) quarter per ticker; every step only touches the
+        # fixed-size rows of the tickers in this batch.
+        if len(set(tickers)) != len(tickers):
+            raise ValueError("ingest_many takes at most one quarter per ticker")
+
+        values = np.asarray(values, dtype=float).reshape(len(tickers), len(de.LINE_ITEMS))
+        filed = _filed(values)
+        values = _filled(values)
+        for k, cols in enumerate(_STATEMENT_COLUMNS):
+            values[:, cols] = np.where(filed[:, k, None], values[:, cols], np.nan)
+        period_endings = np.asarray([str(p)[:10] for p in period_endings], dtype="U10")
+
+        rows = self._rows(list(tickers))
+        seen = self.count[rows] > 0
+        last = self.period_ending[rows, -1]
+        stale = seen & (period_endings < last)
+        if stale.any():
+            t = tickers[int(np.flatnonzero(stale)[0])]
+            raise ValueError(f"{t} already has a quarter newer than {period_endings[stale][0]}")
+
+        restated = seen & (period_endings == last)
+        old, new = rows[restated], rows[~restated]
+
+        # a restatement replaces the latest quarter; otherwise the oldest one drops out
+        self._accumulate(old, self.window[old, -1], -1)
+        full = new[self.count[new] == WINDOW]
+        self._accumulate(full, self.window[full, 0], -1)
+
+        self.window[new] = np.roll(self.window[new], -1, axis=1)
+        self.period_ending[new] = np.roll(self.period_ending[new], -1, axis=1)
+        self.z_raw[new] = np.roll(self.z_raw[new], -1, axis=1)
+        fresh = ~seen
+        self.vol_shift[rows[fresh]] = _filled(values[fresh])[:, VOL_ITEMS]
+        self.count[new] = np.minimum(self.count[new] + 1, WINDOW)
+
+        self.window[rows, -1] = values
+        self.period_ending[rows, -1] = period_endings
+        self._accumulate(rows, values, 1)
+
+        q = {name: values[:, k] for name, k in de.ITEM.items()}
+        self.z_raw[rows, -1] = np.where(filed[:, _BALANCE] & (q["total_assets"] != 0), de.altman_z(q), 1.0)
+
+        self._rescore(rows)
+
+    def _rescore(self, rows):
+        w = self.window[rows]
+        n = self.count[rows]
+        year_ago = n >= 5
+        full = n >= WINDOW
+
+        cur = {name: w[:, -1, k] for name, k in de.ITEM.items()}
+        prior = {name: np.where(year_ago, w[:, -5, k], np.nan) for name, k in de.ITEM.items()}
+
+        flags = de.f_flags(cur, prior, year_ago)
+        self.f_flags[rows] = flags
+        f_score = np.where(full, flags.sum(axis=1), 0)
+        ni4 = np.where(n >= 4, w[:, -4, de.ITEM["net_income"]], np.nan)
+        f_mom = de.f_momentum(cur["net_income"], ni4, n >= 4)
+
+        m_in = de.m_indices(cur, prior, year_ago, n > 0)
+        self.m_inputs[rows] = m_in
+        m = de.m_score(m_in, year_ago & (prior["revenue"] != 0))
+
+        # running mean/std over the window from shifted sums
+        nn = np.maximum(n, 1)[:, None]
+        mean_x = self.vol_sum[rows] / nn
+        var = np.maximum(self.vol_sumsq[rows] / nn - mean_x * mean_x, 0.0)
+        penalty = de.volatility_penalty(self.vol_shift[rows] + mean_x, np.sqrt(var), full)
+
+        scores = de.combine(self.z_raw[rows], f_score, f_mom, m, penalty, np.zeros(len(rows), dtype=bool))
+
+        # windows with a missing statement: the engine's per-statement view
+        in_window = np.arange(WINDOW) >= WINDOW - n[:, None]
+        gaps = ((~_filed(w)) & in_window[..., None]).any(axis=(1, 2))
+        if gaps.any():
+            exact = de.score_panel(w[gaps])
+            for name in scores:
+                scores[name] = np.array(scores[name], dtype=np.result_type(scores[name], exact[name]))
+                scores[name][gaps] = exact[name]
+        for name in ("z_contribution", "f_contribution", "m_contribution", "volatility_penalty", "distress_score"):
+            getattr(self, name)[rows] = scores[name]
+
+    @classmethod
+    def from_panel(cls, tickers, values, available=None, quarters=de.QUARTER_DATES):
+        # bootstrap from build_panel() output, one vectorized ingest per
+        # quarter. Every quarter goes in as it is, with any missing statements,
+        # so the window stays aligned with the engine's; tickers outside
+        # `available` are left out, as score_panel fails them
+        state = cls()
+        values = np.asarray(values, dtype=float)
+        keep = np.ones(len(values), dtype=bool) if available is None else np.asarray(available, dtype=bool)
+        tickers = [t for t, k in zip(tickers, keep) if k]
+        if tickers:
+            for q, q_date in enumerate(quarters):
+                state.ingest_many(tickers, [q_date] * len(tickers), values[keep, q])
+        return state
+
+    def table(self):
+        return pd.DataFrame({
+            "Ticker": self.tickers,
+            "Assessment Date": self.period_ending[:, -1],
+            "Distress Score": self.distress_score,
+            "Z Contribution": self.z_contribution,
+            "F Contribution": self.f_contribution,
+            "M Contribution": self.m_contribution,
+            "Volatility Penalty": self.volatility_penalty,
+        })
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in _FIELDS}
+        np.savez(path, tickers=np.array(self.tickers, dtype=str), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        state = cls()
+        with np.load(path, allow_pickle=False) as data:
+            state.tickers = data["tickers"].tolist()
+            for name in _FIELDS:
+                setattr(state, name, data[name])
+        state.index = {t: k for k, t in enumerate(state.tickers)}
+        return state
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+import distress_engine as de
+
+# Monte Carlo sensitivity of the distress score to reporting noise. Line items
+# are perturbed multiplicatively, x * (1 + sd * eps), and every simulated panel
+# is scored with one batched distress_engine.score_panel call per chunk.
+
+N_SIMS = 10_000
+NOISE = 0.02
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# simulated panels (ticker x simulation, each Q quarters x F line items) scored
+# per score_panel call; peak memory is about CHUNK_ROWS * Q * F * 8 bytes times
+# the few temporaries score_panel keeps
+CHUNK_ROWS = 50_000
+
+# ebit is read from the same provider field as operating income, so it moves with it
+TIED_ITEMS = {"ebit": "operating_income"}
+
+
+def _noise_levels(noise):
+    if isinstance(noise, dict):
+        unknown = set(noise) - set(de.LINE_ITEMS)
+        if unknown:
+            raise ValueError(f"Unknown line items: {sorted(unknown)}")
+        levels = {name: float(noise.get(name, 0.0)) for name in de.LINE_ITEMS}
+    else:
+        levels = {name: float(noise) for name in de.LINE_ITEMS}
+    for name, source in TIED_ITEMS.items():
+        levels[name] = levels[source]
+    return levels
+
+
+def _perturb(block, levels, rng):
+    # block: (k, m, Q, F) copies of the base panel, perturbed in place
+    drawn = [name for name in de.LINE_ITEMS if levels[name] > 0 and name not in TIED_ITEMS]
+    if not drawn:
+        return block
+    eps = rng.standard_normal(block.shape[:3] + (len(drawn),))
+    for j, name in enumerate(drawn):
+        block[..., de.ITEM[name]] *= 1 + levels[name] * eps[..., j]
+    for name, source in TIED_ITEMS.items():
+        if levels[source] > 0:
+            block[..., de.ITEM[name]] *= 1 + levels[source] * eps[..., drawn.index(source)]
+    return block
+
+
+def simulate_scores(values, available=None, n_sims=N_SIMS, noise=NOISE, seed=None, chunk_rows=CHUNK_ROWS):
+    # Returns a (T, n_sims) array of simulated distress scores.
+    values = np.asarray(values, dtype=float)
+    n_tickers, n_quarters, n_items = values.shape
+    if available is None:
+        available = np.ones(n_tickers, dtype=bool)
+
+    levels = _noise_levels(noise)
+    rng = np.random.default_rng(seed)
+
+    sims_per_chunk = max(1, min(n_sims, chunk_rows))
+    tickers_per_chunk = max(1, chunk_rows // sims_per_chunk)
+
+    scores = np.empty((n_tickers, n_sims))
+    for t0 in range(0, n_tickers, tickers_per_chunk):
+        base = values[t0:t0 + tickers_per_chunk]
+        k = len(base)
+        for s0 in range(0, n_sims, sims_per_chunk):
+            m = min(sims_per_chunk, n_sims - s0)
+            block = np.repeat(base[:, None], m, axis=1)
+            block = _perturb(block, levels, rng)
+            out = de.score_panel(
+                block.reshape(k * m, n_quarters, n_items),
+                np.repeat(available[t0:t0 + k], m),
+            )
+            scores[t0:t0 + k, s0:s0 + m] = out["distress_score"].reshape(k, m)
+    return scores
+
+
+def sensitivity_table(tickers, values, available=None, n_sims=N_SIMS, noise=NOISE, seed=None,
+                      percentiles=PERCENTILES, chunk_rows=CHUNK_ROWS):
+    values = np.asarray(values, dtype=float)
+    base = de.score_panel(values, available)["distress_score"]
+    scores = simulate_scores(values, available, n_sims, noise, seed, chunk_rows)
+
+    table = pd.DataFrame({
+        "Ticker": list(tickers),
+        "Base Score": base,
+        "Mean Score": scores.mean(axis=1),
+        "Std Score": scores.std(axis=1),
+        "Min Score": scores.min(axis=1),
+        "Max Score": scores.max(axis=1),
+    })
+    for p, col in zip(percentiles, np.percentile(scores, percentiles, axis=1)):
+        table[f"P{p}"] = col
+    # share of simulations that move the score by more than five points
+    table["Share |Change| > 5"] = (np.abs(scores - base[:, None]) > 5).mean(axis=1)
+    return table
@@ -1,23 +1,49 @@
+import os
 import pandas as pd
 import numpy as np
-from openbb import obb
+from data_source import obb
+from instrumentation import span
+import data_quality
+import shared_panel
 
 TICKERS = ["EEM", "IWM", "QQQ", "SPY"]
 FETCH_START = "2018-09-01"
 FETCH_END = "2019-12-31"
+REPORT_START = "2019-01-01"
+REPORT_END = "2019-12-31"
 
-rows = []
-
-for sym in TICKERS:
-    # Fetch data
-    df = obb.equity.price.historical(
-        symbol=sym,
-        start_date=FETCH_START,
-        end_date=FETCH_END,
-        provider="fmp",
-        adjustment="splits_and_dividends",
-    ).to_dataframe().reset_index()
-    
+# FA_ETF_YEARS=2005-2024 reports every year of the range from one fetch
+YEARS = os.environ.get("FA_ETF_YEARS", "")
+
+def fetch_prices(sym, start=None, end=None):
+    with span("fetch", sym):
+        res = obb.equity.price.historical(
+            symbol=sym,
+            start_date=start or FETCH_START,
+            end_date=end or FETCH_END,
+            provider="fmp",
+            adjustment="splits_and_dividends",
+        )
+    with span("transform", sym) as sp:
+        df = res.to_dataframe().reset_index()
+        sp.count("rows", len(df))
+    return df
+
+
+def gate(frames):
+    # data-quality checks over every fetched frame; drops quarantined rows
+    return data_quality.gate_prices(frames, "etf_volatility_regime_analysis", "close")
+
+
+def compute_vol_metrics(sym, df):
+    df = add_rolling_vols(df)
+
+    # Step 3: Filter to 2019 only
+    yr = df[(df["date"] >= REPORT_START) & (df["date"] <= REPORT_END)].copy()
+    return vol_metrics(sym, yr)
+
+
+def add_rolling_vols(df):
     # Ensure date column exists
     if 'date' not in df.columns:
         df = df.rename(columns={df.columns[0]: 'date'})
@@ -32,13 +58,15 @@ for sym in TICKERS:
     # Step 2: Calculate rolling volatilities (using ddof=1, which is pandas default)
     df["vol21"] = df["logret"].rolling(window=21, min_periods=21).std()
     df["vol63"] = df["logret"].rolling(window=63, min_periods=63).std()
-    
-    # Step 3: Filter to 2019 only
-    yr = df[(df["date"] >= "2019-01-01") & (df["date"] <= "2019-12-31")].copy()
-    
+    return df
+
+
+def vol_metrics(sym, yr):
+    # yr: the report year's rows with date, vol21 and vol63 columns
+
     # Handle case where all volatilities are NaN
     if yr["vol21"].isna().all():
-        rows.append({
+        return {
             "Ticker": sym,
             "Max21dVolPct": 0.0,
             "DateOfMax21d": "N/A",
@@ -46,8 +74,7 @@ for sym in TICKERS:
             "DateOfMax63d": "N/A",
             "AboveMedianVolDays": 0,
             "VolRatioAtMax21d": np.nan
-        })
-        continue
+        }
     
     # Step 4: Calculate output metrics
     
@@ -83,7 +110,7 @@ for sym in TICKERS:
     else:
         vol_ratio = round(vol21_at_max / vol63_at_max, 4)
     
-    rows.append({
+    return {
         "Ticker": sym,
         "Max21dVolPct": max_vol21_pct,
         "DateOfMax21d": date_of_max21_str,
@@ -91,9 +118,99 @@ for sym in TICKERS:
         "DateOfMax63d": date_of_max63_str,
         "AboveMedianVolDays": above_median_count,
         "VolRatioAtMax21d": vol_ratio
+    }
+
+
+def parse_years(spec):
+    first, _, last = spec.partition("-")
+    return int(first), int(last or first)
+
+
+def years_window(first, last):
+    # same lead-in as the single-year fetch, so the rolling windows agree
+    return f"{first - 1}-09-01", f"{last}-12-31"
+
+
+def yearly_vol_metrics(frames, first, last):
+    # vol_metrics for every (ticker, year) in [first, last]: rolling vols are
+    # computed once per ticker, then every statistic is a groupby aggregation
+    parts = []
+    for sym, df in frames.items():
+        df = add_rolling_vols(df)
+        parts.append(pd.DataFrame({"Ticker": sym, "date": df["date"], "vol21": df["vol21"], "vol63": df["vol63"]}))
+    panel = pd.concat(parts, ignore_index=True)
+    panel["Year"] = panel["date"].dt.year
+    panel = panel[(panel["Year"] >= first) & (panel["Year"] <= last)].reset_index(drop=True)
+    keys = [panel["Ticker"], panel["Year"]]
+
+    # idxmax gives the first (earliest) row of each group's max
+    at21 = panel["vol21"].fillna(-np.inf).groupby(keys).idxmax()
+    at63 = panel["vol63"].fillna(-np.inf).groupby(keys).idxmax()
+    has21 = panel["vol21"].groupby(keys).count() > 0
+    has63 = panel["vol63"].groupby(keys).count() > 0
+    median21 = panel["vol21"].groupby(keys).transform("median")
+    above = (panel["vol21"] > median21).groupby(keys).sum()
+
+    max21 = panel["vol21"].to_numpy()[at21.to_numpy()]
+    max63 = panel["vol63"].to_numpy()[at63.to_numpy()]
+    vol63_at_max21 = panel["vol63"].to_numpy()[at21.to_numpy()]
+    dates = panel["date"].dt.strftime("%Y-%m-%d").to_numpy()
+    ok21, ok63 = has21.to_numpy(), has63.to_numpy() & has21.to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(np.isnan(vol63_at_max21) | (vol63_at_max21 == 0), np.nan,
+                         np.round(max21 / vol63_at_max21, 4))
+
+    return pd.DataFrame({
+        "Ticker": at21.index.get_level_values(0),
+        "Year": at21.index.get_level_values(1),
+        "Max21dVolPct": np.where(ok21, np.round(max21 * 100, 4), 0.0),
+        "DateOfMax21d": np.where(ok21, dates[at21.to_numpy()], "N/A"),
+        "Max63dVolPct": np.where(ok63, np.round(max63 * 100, 4), 0.0),
+        "DateOfMax63d": np.where(ok63, dates[at63.to_numpy()], "N/A"),
+        "AboveMedianVolDays": np.where(ok21, above.to_numpy(), 0).astype(int),
+        "VolRatioAtMax21d": np.where(ok21, ratio, np.nan),
     })
 
-# Create output and sort
-out = pd.DataFrame(rows).sort_values("Ticker").reset_index(drop=True)
 
-df_to_csv(out)
+# declared output types (output_sink.typed_frame), so Parquet/Arrow schemas
+# never depend on the first batch's values
+COLUMN_DTYPES = {"Ticker": "string", "Max21dVolPct": "float64", "DateOfMax21d": "string", "Max63dVolPct": "float64",
+                 "DateOfMax63d": "string", "AboveMedianVolDays": "Int64", "VolRatioAtMax21d": "float64"}
+
+
+def results_frame(rows):
+    return pd.DataFrame(rows)
+
+
+def sort_results(out):
+    return out.sort_values("Ticker").reset_index(drop=True)
+
+
+if __name__ == "__main__" and YEARS:
+    first, last = parse_years(YEARS)
+    start, end = years_window(first, last)
+    frames = gate({sym: fetch_prices(sym, start, end) for sym in TICKERS})
+    with span("compute", name="yearly_vol_metrics"):
+        out = yearly_vol_metrics(frames, first, last).sort_values(["Ticker", "Year"]).reset_index(drop=True)
+
+    with span("output"):
+        df_to_csv(out)
+
+elif __name__ == "__main__":
+    frames = gate({sym: fetch_prices(sym) for sym in TICKERS})
+    if shared_panel.WORKERS > 1:
+        with span("compute", name="shared_panel"):
+            rows = shared_panel.map_frames(frames, shared_panel.frame_kernel(compute_vol_metrics, ["close"]),
+                                           shared_panel.WORKERS)
+    else:
+        rows = []
+        for sym in TICKERS:
+            with span("compute", sym):
+                rows.append(compute_vol_metrics(sym, frames[sym]))
+
+    # Create output and sort
+    with span("compute", name="sort_results"):
+        out = sort_results(results_frame(rows))
+
+    with span("output"):
+        df_to_csv(out)
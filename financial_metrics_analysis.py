@@ -1,8 +1,13 @@
-from openbb import obb
+from data_source import obb
 import pandas as pd
 import os
 from datetime import datetime, timedelta
 import numpy as np
+import traceback
+import data_quality
+from fundamentals_arrays import to_arrays
+from instrumentation import span
+import memo
 
 ticker = "MSFT"
 
@@ -21,11 +26,33 @@ FISCAL_YEARS = {
     "FY 2021": "2021-06-30",
 }
 
-def calculate_financial_metrics(ticker):
-    print(f" Analyzing {ticker}...")
-
-    try:
-
+# metric columns are float64 with NaN for missing values; Status and the
+# flag column say why
+METRIC_COLUMNS = [
+    "EV/EBITDA",
+    "ROIC (%)",
+    "FCF Yield (%)",
+    "Gross Margin (%)",
+    "Debt/EBITDA",
+    "Working Capital (B)",
+    "Revenue CAGR (%)",
+    "R&D Intensity (%)",
+    "Share Buyback (%)",
+    "Interest Coverage",
+    "Book Value/Share",
+]
+COLUMNS = ["Ticker", "Analysis Date"] + METRIC_COLUMNS + ["Interest Coverage Flag", "Status"]
+# declared output types (output_sink.typed_frame), so Parquet/Arrow schemas
+# never depend on the first batch's values
+COLUMN_DTYPES = {c: ("float64" if c in METRIC_COLUMNS else "string") for c in COLUMNS}
+
+FLAG_NO_DEBT = "No Debt"
+STATUS_OK = "OK"
+STATUS_INSUFFICIENT = "Insufficient Data"
+STATUS_ERROR = "Error"
+
+def fetch_inputs(ticker):
+    with span("fetch", ticker):
         income_q = obb.equity.fundamental.income(
             symbol=ticker,
             peiod="quarter",
@@ -67,53 +94,170 @@ def calculate_financial_metrics(ticker):
             limit=8,
             provider="fmp"
         )
+    return income_q, balance_q, cash_q, income_a, historical_price, metrics
+
+
+@memo.memoize
+def statement_inputs(income_q, balance_q, cash_q, income_a, metrics, quarters, fiscal_years):
+    # period matching, TTM sums and period-end balances from the statement
+    # arrays. Pure in its inputs, so it is memoized on disk when FA_MEMO_DIR is
+    # set (memo.py); the ratios and their rounding stay in
+    # calculate_financial_metrics
+    quarterly_data = {}
+
+    for quarter_name, target_date in quarters.items():
+        quarterly_data[quarter_name] = {
+            "income": None,
+            "balance": None,
+            "cash": None,
+            "metrics": None
+        }
 
-        if not all([income_q.results, balance_q.results, cash_q.results]):
-            raise ValueError("Insufficient data from OpenBB")
-
-        analysis_date = "2024-06-30"
-
-        quarterly_data = {}
-
-        for quarter_name, target_date in QUARTERS_NEEDED.items():
-            quarterly_data[quarter_name] = {
-                "income": None,
-                "balance": None,
-                "cash": None,
-                "metrics": None
-            }
-
-            for inc in income_q.results:
-                if hasattr(inc, 'period_ending') and target_date in str(inc.period_ending):
-                    quarterly_data[quarter_name]["income"] = inc
-                    break
+        for inc in income_q.results:
+            if hasattr(inc, 'period_ending') and target_date in str(inc.period_ending):
+                quarterly_data[quarter_name]["income"] = inc
+                break
+
+        for bal in balance_q.results:
+            if hasattr(bal, 'period_ending') and target_date in str(bal.period_ending):
+                quarterly_data[quarter_name]["balance"] = bal
+                break
+
+        for cf in cash_q.results:
+            if hasattr(cf, 'period_ending') and target_date in str(cf.period_ending):
+                quarterly_data[quarter_name]["cash"] = cf
+                break
+
+        for met in metrics.results:
+            if hasattr(met, 'period_ending') and target_date in str(met.period_ending):
+                quarterly_data[quarter_name]["metrics"] = met
+                break
+
+    annual_data = {}
+    for fy_name, target_date in fiscal_years.items():
+        for inc in income_a.results:
+            if hasattr(inc, 'period_ending') and target_date in str(inc.period_ending):
+                annual_data[fy_name] = inc
+                break
+
+    shares_june_2024 = 0
+    shares_june_2023 = 0
+
+    if quarterly_data["Q2 2024"]["income"]:
+        shares_june_2024 = getattr(quarterly_data["Q2 2024"]["income"], 'weighted_average_basic_shares_outstanding', 0) or 7.43e9
+    else:
+        shares_june_2024 = 7.43e9 # Approximate shares MSFT
+
+    if quarterly_data["Q2 2023"]["income"]:
+        shares_june_2023 = getattr(quarterly_data["Q2 2023"]["income"], 'weighted_average_basic_shares_outstanding', 0) or 7.45e9
+    else:
+        shares_june_2023 = 7.45e9
+
+    ttm_quarters = ["Q3 2023", "Q4 2023", "Q1 2024", "Q2 2024"]
+
+    revenue_ttm = 0
+    operating_income_ttm = 0
+    depreciation_ttm = 0
+    operating_cash_flow_ttm = 0
+    capex_ttm = 0
+    interest_expense_ttm = 0
+    tax_expense_ttm = 0
+    income_before_tax_ttm = 0
+    rd_expense_ttm = 0
+    gross_profit_ttm = 0
+
+    for q in ttm_quarters:
+        if quarterly_data[q]["income"]:
+            inc = quarterly_data[q]["income"]
+            revenue_ttm += getattr(inc, 'revenue', 0) or 0
+            operating_income_ttm += getattr(inc, 'total_operating_income', 0) or 0
+            depreciation_ttm += getattr(inc, 'depreciation_and_amortization', 0) or 0
+            interest_expense_ttm += getattr(inc, 'interest_expense', 0) or 0
+            tax_expense_ttm += getattr(inc, 'income_tax_expense', 0) or 0
+            income_before_tax_ttm += getattr(inc, 'income_before_tax', 0) or 0
+            rd_expense_ttm += getattr(inc, 'research_and_development_expense', 0) or 0
+            gross_profit_ttm += getattr(inc, 'gross_profit', 0) or 0
+
+        if quarterly_data[q]["cash"]:
+            cf = quarterly_data[q]["cash"]
+            operating_cash_flow_ttm += getattr(cf, 'operating_cash_flow', 0) or 0
+            capex_ttm += abs(getattr(cf, 'capital_expenditure', 0) or 0)
+
+    q2_2024_balance = quarterly_data["Q2 2024"]["balance"]
+    q3_2023_balance = quarterly_data["Q3 2023"]["balance"]
+
+    if q2_2024_balance:
+        total_assets = getattr(q2_2024_balance, 'total_assets', 0) or 0
+        total_liabilities = getattr(q2_2024_balance, 'total_liabilities', 0) or 0
+        current_assets = getattr(q2_2024_balance, 'total_current_assets', 0) or 0
+        current_liabilities = getattr(q2_2024_balance, 'total_current_liabilities', 0) or 0
+        long_term_debt = getattr(q2_2024_balance, 'long_term_debt', 0) or 0
+        short_term_debt = getattr(q2_2024_balance, 'short_term_debt', 0) or 0
+        cash_equivalents = getattr(q2_2024_balance, 'cash_and_cash_equivalents', 0) or 0
+    else:
+        total_assets = 0
+        total_liabilities = 0
+        current_assets = 0
+        current_liabilities = 0
+        long_term_debt = 0
+        short_term_debt = 0
+        cash_equivalents = 0
+
+    if q3_2023_balance:
+        prior_total_assets = getattr(q3_2023_balance, 'total_assets', 0) or total_assets
+        prior_current_liabilities = getattr(q3_2023_balance, 'total_current_liabilities', 0) or current_liabilities
+        prior_short_term_debt = getattr(q3_2023_balance, 'short_term_debt', 0) or short_term_debt
+    else:
+        prior_total_assets = total_assets
+        prior_current_liabilities = current_liabilities
+        prior_short_term_debt = short_term_debt
+
+    return {
+        "found": [q for q in quarters if quarterly_data[q]["income"]],
+        "annual_revenue": {fy: getattr(inc, 'revenue', 0) or 0 for fy, inc in annual_data.items()},
+        "shares": (shares_june_2024, shares_june_2023),
+        "ttm": (revenue_ttm, operating_income_ttm, depreciation_ttm, operating_cash_flow_ttm, capex_ttm,
+                interest_expense_ttm, tax_expense_ttm, income_before_tax_ttm, rd_expense_ttm, gross_profit_ttm),
+        "balance": (total_assets, total_liabilities, current_assets, current_liabilities,
+                    long_term_debt, short_term_debt, cash_equivalents),
+        "prior_balance": (prior_total_assets, prior_current_liabilities, prior_short_term_debt),
+    }
+
+
+def gate(inputs):
+    # data-quality checks over every fetched {ticker: fetch_inputs(ticker)} at
+    # once; a quarter failing them is dropped from the quarterly income,
+    # balance and cash statements (annual income, prices and metrics are kept)
+    gated = data_quality.gate_statements({t: v[:3] for t, v in inputs.items()}, "financial_metrics_analysis")
+    return {t: tuple(gated[t]) + tuple(v[3:]) for t, v in inputs.items()}
+
+
+def calculate_financial_metrics(ticker, inputs=None):
+    # inputs: the ticker's entry of gate(...), fetched and gated here when not given
+    print(f" Analyzing {ticker}...")
 
-            for bal in balance_q.results:
-                if hasattr(bal, 'period_ending') and target_date in str(bal.period_ending):
-                    quarterly_data[quarter_name]["balance"] = bal
-                    break
+    try:
 
-            for cf in cash_q.results:
-                if hasattr(cf, 'period_ending') and target_date in str(cf.period_ending):
-                    quarterly_data[quarter_name]["cash"] = cf
-                    break
+        inputs = inputs or gate({ticker: fetch_inputs(ticker)})[ticker]
+        income_q, balance_q, cash_q, income_a, historical_price, metrics = inputs
 
-            for met in metrics.results:
-                if hasattr(met, 'period_ending') and target_date in str(met.period_ending):
-                    quarterly_data[quarter_name]["metrics"] = met
-                    break
+        with span("transform", ticker):
+            income_q = to_arrays(income_q)
+            balance_q = to_arrays(balance_q)
+            cash_q = to_arrays(cash_q)
+            income_a = to_arrays(income_a)
+            metrics = to_arrays(metrics)
 
-            if quarterly_data[quarter_name]["income"]:
-                print(f" Found {quarter_name} data")
+        if not all([income_q.results, balance_q.results, cash_q.results]):
+            raise ValueError("Insufficient data from OpenBB")
 
-        annual_data = {}
-        for fy_name, target_date in FISCAL_YEARS.items():
-            for inc in income_a.results:
-                if hasattr(inc, 'period_ending') and target_date in str(inc.period_ending):
-                    annual_data[fy_name] = inc
-                    break
+        analysis_date = "2024-06-30"
 
-        print(f" Found {len(annual_data)} years of annual data")
+        inputs = statement_inputs(income_q, balance_q, cash_q, income_a, metrics, QUARTERS_NEEDED, FISCAL_YEARS)
+        for quarter_name in inputs["found"]:
+            print(f" Found {quarter_name} data")
+        annual_revenue = inputs["annual_revenue"]
+        print(f" Found {len(annual_revenue)} years of annual data")
 
         price_june_2024 = 0
         if historical_price.results:
@@ -128,84 +272,19 @@ def calculate_financial_metrics(ticker):
         else:
             print(f" Price on June 30, 2024: ${price_june_2024}")
 
-        shares_june_2024 = 0
-        shares_june_2023 = 0
-
-        if quarterly_data["Q2 2024"]["income"]:
-            shares_june_2024 = getattr(quarterly_data["Q2 2024"]["income"], 'weighted_average_basic_shares_outstanding', 0) or 7.43e9
-        else:
-            shares_june_2024 = 7.43e9 # Approximate shares MSFT
-
-        if quarterly_data["Q2 2023"]["income"]:
-            shares_june_2023 = getattr(quarterly_data["Q2 2023"]["income"], 'weighted_average_basic_shares_outstanding', 0) or 7.45e9
-        else:
-            shares_june_2023 = 7.45e9
-
+        shares_june_2024, shares_june_2023 = inputs["shares"]
         market_cap_june_2024 = price_june_2024 * shares_june_2024
 
-        ttm_quarters = ["Q3 2023", "Q4 2023", "Q1 2024", "Q2 2024"]
-
-        revenue_ttm = 0
-        operating_income_ttm = 0
-        depreciation_ttm = 0
-        operating_cash_flow_ttm = 0
-        capex_ttm = 0
-        interest_expense_ttm = 0
-        tax_expense_ttm = 0
-        income_before_tax_ttm = 0
-        rd_expense_ttm = 0
-        gross_profit_ttm = 0
-
-        for q in ttm_quarters:
-            if quarterly_data[q]["income"]:
-                inc = quarterly_data[q]["income"]
-                revenue_ttm += getattr(inc, 'revenue', 0) or 0
-                operating_income_ttm += getattr(inc, 'total_operating_income', 0) or 0
-                depreciation_ttm += getattr(inc, 'depreciation_and_amortization', 0) or 0
-                interest_expense_ttm += getattr(inc, 'interest_expense', 0) or 0
-                tax_expense_ttm += getattr(inc, 'income_tax_expense', 0) or 0
-                income_before_tax_ttm += getattr(inc, 'income_before_tax', 0) or 0
-                rd_expense_ttm += getattr(inc, 'research_and_development_expense', 0) or 0
-                gross_profit_ttm += getattr(inc, 'gross_profit', 0) or 0
-
-            if quarterly_data[q]["cash"]:
-                cf = quarterly_data[q]["cash"]
-                operating_cash_flow_ttm += getattr(cf, 'operating_cash_flow', 0) or 0
-                capex_ttm += abs(getattr(cf, 'capital_expenditure', 0) or 0)
-
-        q2_2024_balance = quarterly_data["Q2 2024"]["balance"]
-        q3_2023_balance = quarterly_data["Q3 2023"]["balance"]
-
-        if q2_2024_balance:
-            total_assets = getattr(q2_2024_balance, 'total_assets', 0) or 0
-            total_liabilities = getattr(q2_2024_balance, 'total_liabilities', 0) or 0
-            current_assets = getattr(q2_2024_balance, 'total_current_assets', 0) or 0
-            current_liabilities = getattr(q2_2024_balance, 'total_current_liabilities', 0) or 0
-            long_term_debt = getattr(q2_2024_balance, 'long_term_debt', 0) or 0
-            short_term_debt = getattr(q2_2024_balance, 'short_term_debt', 0) or 0
-            cash_equivalents = getattr(q2_2024_balance, 'cash_and_cash_equivalents', 0) or 0
-        else:
-            total_assets = 0
-            total_liabilities = 0
-            current_assets = 0
-            current_liabilities = 0
-            long_term_debt = 0
-            short_term_debt = 0
-            cash_equivalents = 0
-
-        if q3_2023_balance:
-            prior_total_assets = getattr(q3_2023_balance, 'total_assets', 0) or total_assets
-            prior_current_liabilities = getattr(q3_2023_balance, 'total_current_liabilities', 0) or current_liabilities
-            prior_short_term_debt = getattr(q3_2023_balance, 'short_term_debt', 0) or short_term_debt
-        else:
-            prior_total_assets = total_assets
-            prior_current_liabilities = current_liabilities
-            prior_short_term_debt = short_term_debt
+        (revenue_ttm, operating_income_ttm, depreciation_ttm, operating_cash_flow_ttm, capex_ttm,
+         interest_expense_ttm, tax_expense_ttm, income_before_tax_ttm, rd_expense_ttm, gross_profit_ttm) = inputs["ttm"]
+        (total_assets, total_liabilities, current_assets, current_liabilities,
+         long_term_debt, short_term_debt, cash_equivalents) = inputs["balance"]
+        prior_total_assets, prior_current_liabilities, prior_short_term_debt = inputs["prior_balance"]
 
         total_debt = long_term_debt + short_term_debt
         enterprise_value = market_cap_june_2024 + total_debt - cash_equivalents
         ebitda_ttm = operating_income_ttm + depreciation_ttm
-        ev_ebitda = round(enterprise_value / ebitda_ttm, 2) if ebitda_ttm > 0 else "N/A"
+        ev_ebitda = round(enterprise_value / ebitda_ttm, 2) if ebitda_ttm > 0 else np.nan
         print(f" EV/EBITDA: {ev_ebitda}")
 
         tax_rate = tax_expense_ttm / income_before_tax_ttm if income_before_tax_ttm > 0 else 0.21
@@ -215,51 +294,53 @@ def calculate_financial_metrics(ticker):
         ic_sept_2023 = prior_total_assets - prior_current_liabilities + prior_short_term_debt
         avg_invested_capital = (ic_june_2024 + ic_sept_2023) / 2
 
-        roic = round((nopat / avg_invested_capital) * 100, 2) if avg_invested_capital > 0 else "N/A"
+        roic = round((nopat / avg_invested_capital) * 100, 2) if avg_invested_capital > 0 else np.nan
         print(f" ROIC: {roic}%")
 
         free_cash_flow_ttm = operating_cash_flow_ttm - capex_ttm
-        fcf_yield = round((free_cash_flow_ttm / market_cap_june_2024) * 100, 2) if market_cap_june_2024 > 0 else "N/A"
+        fcf_yield = round((free_cash_flow_ttm / market_cap_june_2024) * 100, 2) if market_cap_june_2024 > 0 else np.nan
         print(f" FCF yield: {fcf_yield}%")
 
-        gross_margin = round((gross_profit_ttm / revenue_ttm) * 100, 2) if revenue_ttm > 0 else "N/A"
+        gross_margin = round((gross_profit_ttm / revenue_ttm) * 100, 2) if revenue_ttm > 0 else np.nan
         print(f" Gross Margin: {gross_margin}%")
 
-        debt_ebitda = round(total_debt / ebitda_ttm, 2) if ebitda_ttm > 0 else "N/A"
+        debt_ebitda = round(total_debt / ebitda_ttm, 2) if ebitda_ttm > 0 else np.nan
         print(f" Debt/EBITDA: {debt_ebitda}")
 
         working_capital = round((current_assets - current_liabilities) / 1e9, 2)
         print(f" Working Capital: {working_capital}")
 
-        if "FY 2024" in annual_data and "FY 2021" in annual_data:
-            revenue_fy2024 = getattr(annual_data["FY 2024"], 'revenue', 0) or 0
-            revenue_fy2021 = getattr(annual_data["FY 2021"], 'revenue', 0) or 0
+        if "FY 2024" in annual_revenue and "FY 2021" in annual_revenue:
+            revenue_fy2024 = annual_revenue["FY 2024"]
+            revenue_fy2021 = annual_revenue["FY 2021"]
             if revenue_fy2021 > 0:
                 revenue_cagr = round(((revenue_fy2024 / revenue_fy2021) ** (1/3) - 1) * 100, 2)
             else:
-                revenue_cagr = "N/A"
+                revenue_cagr = np.nan
             print(f" FY2024 Revenue: ${revenue_fy2024/1e9:.2f}B")
             print(f" FY2021 Revenue: ${revenue_fy2021/1e9:.2f}B")
         else: 
-            revenue_cagr = "N/A"
+            revenue_cagr = np.nan
         print(f" 3-Year Revenue CAGR: {revenue_cagr}%")
 
-        rd_intensity = round((rd_expense_ttm / revenue_ttm) * 100, 2) if revenue_ttm > 0 and rd_expense_ttm > 0 else "N/A"
+        rd_intensity = round((rd_expense_ttm / revenue_ttm) * 100, 2) if revenue_ttm > 0 and rd_expense_ttm > 0 else np.nan
         print(f" R&D Intensity: {rd_intensity}%")
 
-        share_buyback = round(((shares_june_2023 - shares_june_2024) / shares_june_2023) * 100, 2) if shares_june_2023 > 0 else "N/A"
+        share_buyback = round(((shares_june_2023 - shares_june_2024) / shares_june_2023) * 100, 2) if shares_june_2023 > 0 else np.nan
         print(f" Share Buyback: {share_buyback}%")
 
+        interest_coverage_flag = ""
         if interest_expense_ttm > 0:
             interest_coverage = round(operating_income_ttm / interest_expense_ttm, 2)
         elif interest_expense_ttm == 0 and operating_income_ttm > 0:
-            interest_coverage = "No Debt"
+            interest_coverage = np.nan
+            interest_coverage_flag = FLAG_NO_DEBT
         else:
-            interest_coverage = "N/A"
-        print(f" Interest Coverage: {interest_coverage}")
+            interest_coverage = np.nan
+        print(f" Interest Coverage: {interest_coverage_flag or interest_coverage}")
 
         book_value = total_assets - total_liabilities
-        book_value_per_share = round(book_value / shares_june_2024, 2) if shares_june_2024 > 0 else "N/A"
+        book_value_per_share = round(book_value / shares_june_2024, 2) if shares_june_2024 > 0 else np.nan
         print(f" Book Value/Share: ${book_value_per_share}")
 
         result = {
@@ -275,8 +356,13 @@ def calculate_financial_metrics(ticker):
             "R&D Intensity (%)": rd_intensity,
             "Share Buyback (%)": share_buyback,
             "Interest Coverage": interest_coverage,
-            "Book Value/Share": book_value_per_share
+            "Book Value/Share": book_value_per_share,
+            "Interest Coverage Flag": interest_coverage_flag,
         }
+        # "No Debt" leaves coverage undefined, not missing
+        missing = [c for c in METRIC_COLUMNS if np.isnan(result[c])
+                   and not (c == "Interest Coverage" and interest_coverage_flag)]
+        result["Status"] = STATUS_INSUFFICIENT if missing else STATUS_OK
 
         return result
 
@@ -284,27 +370,26 @@ def calculate_financial_metrics(ticker):
         print(f" Error in Analysis: {e}")
         traceback.print_exc()
 
-        return {
-            "Ticker": ticker,
-            "Analysis Date": "2024-06-30",
-            "EV/EBITDA": "N/A",
-            "ROIC (%)": "N/A",
-            "FCF Yield (%)": "N/A",
-            "Gross Margin (%)": "N/A",
-            "Debt/EBITDA": "N/A",
-            "Working Capital (B)": "N/A",
-            "Revenue CAGR (%)": "N/A",
-            "R&D Intensity (%)": "N/A",
-            "Share Buyback (%)": "N/A",
-            "Interest Coverage": "N/A",
-            "Book Value/Share": "N/A"
-        }
+        result = {"Ticker": ticker, "Analysis Date": "2024-06-30"}
+        result.update({c: np.nan for c in METRIC_COLUMNS})
+        result.update({"Interest Coverage Flag": "", "Status": STATUS_ERROR})
+        return result
         
-result = calculate_financial_metrics(ticker)
+def results_frame(rows):
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df[METRIC_COLUMNS] = df[METRIC_COLUMNS].astype("float64")
+    return df
+
+
+if __name__ == "__main__":
+    # fetch and transform spans nest inside this one
+    with span("compute", ticker):
+        result = calculate_financial_metrics(ticker)
 
-df = pd.DataFrame([result])
+    df = results_frame([result])
 
-print("=" * 70)
-print(df.to_string(index=False))
+    print("=" * 70)
+    print(df.to_string(index=False))
 
-df_to_csv(df)
+    with span("output"):
+        df_to_csv(df)
@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+# Compact stand-in for a list of obb statement results: one float64 column per
+# numeric field (NaN for missing), a field -> column index, and the few
+# non-numeric fields (dates, periods, currency) kept as small object arrays.
+# Results are converted once at fetch time; analysis code reads columns
+# directly or goes through the lightweight row views in `.results`.
+
+META_FIELDS = (
+    "period_ending", "fiscal_period", "fiscal_year", "date", "filing_date",
+    "accepted_date", "reported_currency", "symbol", "cik", "calendar_year",
+)
+
+
+def _dump(rec):
+    if hasattr(rec, "model_dump"):
+        return rec.model_dump()
+    if hasattr(rec, "dict"):
+        return rec.dict()
+    if isinstance(rec, dict):
+        return rec
+    return vars(rec)
+
+
+def _is_number(x):
+    return isinstance(x, (int, float, np.integer, np.floating)) and not isinstance(x, (bool, np.bool_))
+
+
+class StatementArrays:
+    __slots__ = ("symbol", "fields", "index", "values", "meta", "_rows")
+
+    def __init__(self, fields, values, meta=None, symbol=None):
+        self.symbol = symbol
+        self.fields = list(fields)
+        self.index = {name: k for k, name in enumerate(self.fields)}
+        self.values = np.asfortranarray(values, dtype=np.float64)
+        self.meta = dict(meta or {})
+        self._rows = None
+
+    @classmethod
+    def from_results(cls, results, symbol=None):
+        # accepts an obb result object, a list of result models/dicts, or another StatementArrays
+        if isinstance(results, StatementArrays):
+            return results
+        if hasattr(results, "results"):
+            results = results.results
+        if isinstance(results, pd.DataFrame):
+            return cls.from_frame(results, symbol)
+        rows = [_dump(r) for r in (results or [])]
+
+        fields, meta_names = {}, {}
+        for row in rows:
+            for name, value in row.items():
+                if name in fields or name in meta_names:
+                    continue
+                if value is None:
+                    continue
+                if name in META_FIELDS or not _is_number(value):
+                    meta_names[name] = None
+                else:
+                    fields[name] = None
+
+        values = np.full((len(rows), len(fields)), np.nan)
+        meta = {name: np.empty(len(rows), dtype=object) for name in meta_names}
+        for i, row in enumerate(rows):
+            for k, name in enumerate(fields):
+                v = row.get(name)
+                if _is_number(v):
+                    values[i, k] = v
+            for name in meta:
+                meta[name][i] = row.get(name)
+
+        return cls(fields, values, meta, symbol)
+
+    @classmethod
+    def from_frame(cls, df, symbol=None):
+        df = df.reset_index() if df.index.name else df
+        fields, meta = [], {}
+        for name in df.columns:
+            if name in META_FIELDS or not pd.api.types.is_numeric_dtype(df[name]) or pd.api.types.is_bool_dtype(df[name]):
+                meta[name] = df[name].to_numpy(dtype=object)
+            else:
+                fields.append(name)
+        values = df[fields].to_numpy(dtype=np.float64) if fields else np.empty((len(df), 0))
+        return cls(fields, values, meta, symbol)
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __contains__(self, name):
+        return name in self.index or name in self.meta
+
+    def column(self, name):
+        k = self.index.get(name)
+        if k is None:
+            return np.full(len(self), np.nan)
+        return self.values[:, k]
+
+    def period_endings(self):
+        pe = self.meta.get("period_ending")
+        if pe is None:
+            return np.full(len(self), "", dtype=str)
+        return np.array(["" if p is None else str(p) for p in pe], dtype=str)
+
+    def row(self, i):
+        return StatementRow(self, i)
+
+    @property
+    def results(self):
+        # row views for code written against obb result lists
+        if self._rows is None:
+            self._rows = [StatementRow(self, i) for i in range(len(self))]
+        return self._rows
+
+    def to_frame(self):
+        df = pd.DataFrame(self.values, columns=self.fields)
+        for name, col in self.meta.items():
+            df[name] = col
+        return df
+
+
+class StatementRow:
+    # Read-only attribute view of one row. Known fields that are missing read as
+    # None, like an unset optional field on the original result model, so
+    # `getattr(row, "field", 0) or 0` keeps working unchanged.
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store, i):
+        self._store = store
+        self._i = i
+
+    def __getattr__(self, name):
+        store = self._store
+        k = store.index.get(name)
+        if k is not None:
+            v = store.values[self._i, k]
+            return None if np.isnan(v) else float(v)
+        if name in store.meta:
+            return store.meta[name][self._i]
+        raise AttributeError(name)
+
+    def model_dump(self):
+        out = {name: getattr(self, name) for name in self._store.fields}
+        out.update({name: col[self._i] for name, col in self._store.meta.items()})
+        return out
+
+    def __repr__(self):
+        return f"StatementRow({self._store.symbol!r}, {self._i})"
+
+
+def to_arrays(obb_object, symbol=None):
+    return StatementArrays.from_results(obb_object, symbol)
@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Import-time budget for every entry point. Each module is imported in a fresh
+# interpreter (interpreter startup excluded) several times and the median is
+# checked against its budget. Importing a script must not pull in openbb: the
+# platform is loaded lazily by lazy_obb on the first uncached call.
+#
+#   python import_budget.py            exits 1 when any entry point is over budget
+#   python import_budget.py --repeat 9 --json
+
+# seconds; pandas + numpy alone are ~0.35s on a warm disk
+BUDGETS = {
+    "etf_volatility_regime_analysis": 1.0,
+    "capm_risk_adjusted_performance": 1.0,
+    "Crypto_momentum_strategy": 1.0,
+    "simple_altman_z_score_analysis": 1.0,
+    "liquidity_leverage": 1.0,
+    "financial_metrics_analysis": 1.0,
+    "financial_distress_analysis": 1.0,
+}
+REPEAT = 5
+
+_PROBE = (
+    "import sys, time\n"
+    "t = time.perf_counter()\n"
+    "import {module}\n"
+    "print(time.perf_counter() - t, 'openbb' in sys.modules)\n"
+)
+
+
+def measure(module, repeat=REPEAT):
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])))
+    times, eager = [], False
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", _PROBE.format(module=module)],
+                              capture_output=True, text=True, env=env, cwd=here)
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} failed: {proc.stderr.strip().splitlines()[-1:]}")
+        seconds, loaded = proc.stdout.split()
+        times.append(float(seconds))
+        eager = eager or loaded == "True"
+    return {"module": module, "median_s": statistics.median(times), "max_s": max(times), "openbb_imported": eager}
+
+
+def check(budgets=BUDGETS, repeat=REPEAT):
+    rows = []
+    for module, budget in budgets.items():
+        row = measure(module, repeat)
+        row["budget_s"] = budget
+        row["ok"] = row["median_s"] <= budget and not row["openbb_imported"]
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check import time of each entry point against its budget")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    rows = check(repeat=args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{'module':<34}{'median':>9}{'budget':>9}  status")
+        for r in rows:
+            status = "ok" if r["ok"] else ("imports openbb" if r["openbb_imported"] else "OVER BUDGET")
+            print(f"{r['module']:<34}{r['median_s']:>8.3f}s{r['budget_s']:>8.2f}s  {status}")
+    return 0 if all(r["ok"] for r in rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
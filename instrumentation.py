@@ -0,0 +1,236 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import pandas as pd
+
+# Per-stage timers for the analysis scripts. Wrap stage boundaries in spans:
+#
+#   with span("fetch", ticker):      obb network calls
+#   with span("transform", ticker):  to_dataframe() / to_arrays() / model_dump()
+#   with span("compute", ticker):    pandas / numpy analysis
+#   with span("output"):             df_to_csv
+#
+# @timed(stage) does the same for a whole function. Spans nest; "self" time
+# excludes nested spans, so a compute span around a function that fetches
+# internally is not double counted. Disabled (the default), span() returns a
+# shared no-op and costs one global check.
+#
+# FA_PROFILE=1 prints the summary to stderr at exit; FA_PROFILE_TRACE=path
+# also writes a Chrome trace (chrome://tracing, ui.perfetto.dev).
+
+STAGES = ("fetch", "transform", "compute", "output")
+
+ENABLED = os.environ.get("FA_PROFILE", "").lower() not in ("", "0", "false", "no")
+TRACE_PATH = os.environ.get("FA_PROFILE_TRACE") or None
+if TRACE_PATH:
+    ENABLED = True
+
+_spans = []
+_counters = defaultdict(float)
+_lock = threading.Lock()
+_local = threading.local()
+_t_origin = time.perf_counter()
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, name, n=1):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("stage", "ticker", "name", "t0", "child")
+
+    def __init__(self, stage, ticker=None, name=None):
+        self.stage = stage
+        self.ticker = ticker
+        self.name = name or stage
+        self.child = 0.0
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        dur = time.perf_counter() - self.t0
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].child += dur
+        _spans.append((self.stage, self.ticker, self.name, self.t0, dur, dur - self.child,
+                       threading.get_ident(), exc_type is not None))
+        return False
+
+    def count(self, name, n=1):
+        count(name, n, stage=self.stage, ticker=self.ticker)
+
+
+def span(stage, ticker=None, name=None):
+    if not ENABLED:
+        return _NOOP
+    return _Span(stage, ticker, name)
+
+
+def timed(stage, name=None):
+    # Decorator form of span(). The enabled check happens per call, so enable()
+    # after import still takes effect.
+    def decorate(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _Span(stage, None, label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1, stage=None, ticker=None):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[(name, stage, ticker)] += n
+
+
+def enable(trace_path=None):
+    global ENABLED, TRACE_PATH
+    ENABLED = True
+    if trace_path:
+        TRACE_PATH = trace_path
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    global _t_origin
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+    _t_origin = time.perf_counter()
+
+
+def spans():
+    return pd.DataFrame(list(_spans), columns=[
+        "stage", "ticker", "name", "start_s", "total_s", "self_s", "thread", "error",
+    ]).assign(start_s=lambda d: d["start_s"] - _t_origin)
+
+
+def summary(by="stage"):
+    # by: "stage", "ticker" (ticker x stage) or "name" (stage x span name)
+    keys = {"stage": ["stage"], "ticker": ["ticker", "stage"], "name": ["stage", "name"]}[by]
+    df = spans()
+    if df.empty:
+        return pd.DataFrame(columns=keys + ["calls", "total_s", "self_s", "mean_s", "max_s", "errors", "share"])
+    df["ticker"] = df["ticker"].fillna("-")
+    out = df.groupby(keys, sort=False).agg(
+        calls=("total_s", "size"),
+        total_s=("total_s", "sum"),
+        self_s=("self_s", "sum"),
+        mean_s=("total_s", "mean"),
+        max_s=("total_s", "max"),
+        errors=("error", "sum"),
+    ).reset_index()
+    out["share"] = out["self_s"] / out["self_s"].sum()
+    order = {s: k for k, s in enumerate(STAGES)}
+    out["_order"] = out["stage"].map(order).fillna(len(STAGES))
+    return out.sort_values(keys[:-1] + ["_order"] if by == "ticker" else ["_order", "self_s"],
+                           ascending=True if by == "ticker" else [True, False],
+                           kind="stable").drop(columns="_order").reset_index(drop=True)
+
+
+def counters():
+    return pd.DataFrame(
+        [(name, stage, ticker, value) for (name, stage, ticker), value in _counters.items()],
+        columns=["counter", "stage", "ticker", "value"],
+    )
+
+
+def report(file=None, top=10):
+    file = file or sys.stderr
+    if not _spans and not _counters:
+        return
+    print("=" * 70, file=file)
+    print("Stage timings", file=file)
+    print(summary().round(4).to_string(index=False), file=file)
+
+    by_ticker = summary("ticker")
+    by_ticker = by_ticker[by_ticker["ticker"] != "-"]
+    if not by_ticker.empty:
+        slowest = by_ticker.pivot_table(index="ticker", columns="stage", values="self_s", aggfunc="sum", fill_value=0.0)
+        slowest = slowest.reindex(columns=[s for s in STAGES if s in slowest.columns]
+                                  + [s for s in slowest.columns if s not in STAGES])
+        slowest["total"] = slowest.sum(axis=1)
+        print(f"\nSlowest tickers (self seconds, top {top})", file=file)
+        print(slowest.sort_values("total", ascending=False).head(top).round(4).to_string(), file=file)
+
+    c = counters()
+    if not c.empty:
+        print("\nCounters", file=file)
+        print(c.groupby(["counter", "stage"], dropna=False)["value"].sum().reset_index().to_string(index=False), file=file)
+
+
+def trace_events():
+    pid = os.getpid()
+    events = []
+    for stage, ticker, name, t0, dur, self_dur, tid, error in list(_spans):
+        args = {"self_ms": round(self_dur * 1e3, 3)}
+        if ticker is not None:
+            args["ticker"] = ticker
+        if error:
+            args["error"] = True
+        events.append({
+            "name": name if ticker is None else f"{name} {ticker}",
+            "cat": stage,
+            "ph": "X",
+            "ts": (t0 - _t_origin) * 1e6,
+            "dur": dur * 1e6,
+            "pid": pid,
+            "tid": tid,
+            "args": args,
+        })
+    return events
+
+
+def write_trace(path=None):
+    path = path or TRACE_PATH
+    if not path:
+        return None
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace_events(), "displayTimeUnit": "ms",
+                   "otherData": {"argv": sys.argv, "counters": counters().to_dict("records")}}, f)
+    return path
+
+
+@atexit.register
+def _at_exit():
+    if not ENABLED:
+        return
+    report()
+    if TRACE_PATH:
+        write_trace(TRACE_PATH)
+        print(f"Wrote trace {TRACE_PATH}", file=sys.stderr)
@@ -0,0 +1,158 @@
+import os
+import threading
+from concurrent.futures import Future
+
+import pandas as pd
+
+from instrumentation import count
+from local_provider import LocalResult, load_recorded, record_key, save_recorded
+
+# Stand-in for `from openbb import obb` that defers the import until a call
+# actually has to go to the network. With FA_CACHE_DIR set, every
+# obb.<route>(**params) call is answered from the cache when a matching
+# response was saved (same on-disk format as local_provider recordings) and
+# written back on a miss. FA_CACHE_ONLY=1 never imports openbb: a miss raises
+# CacheMiss instead, so offline or scheduled reruns start in pandas time.
+
+# top-level obb attributes that are not data routes; these load the platform
+PLATFORM_ATTRS = {"user", "account", "coverage", "system", "reference"}
+
+
+class CacheMiss(LookupError):
+    pass
+
+
+class _Route:
+    __slots__ = ("_owner", "_path")
+
+    def __init__(self, owner, path):
+        self._owner = owner
+        self._path = path
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Route(self._owner, f"{self._path}.{name}")
+
+    def __call__(self, **params):
+        return self._owner._call(self._path, params)
+
+    def __repr__(self):
+        return f"<obb route {self._path}>"
+
+
+class LazyOBB:
+
+    def __init__(self, cache_dir=None, cache_only=False):
+        self.cache_dir = cache_dir
+        self.cache_only = cache_only
+        self._obb = None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            cache_dir=os.environ.get("FA_CACHE_DIR") or None,
+            cache_only=os.environ.get("FA_CACHE_ONLY", "").lower() not in ("", "0", "false", "no"),
+        )
+
+    @property
+    def loaded(self):
+        return self._obb is not None
+
+    def load(self):
+        if self._obb is None:
+            if self.cache_only:
+                raise CacheMiss("FA_CACHE_ONLY is set; refusing to import openbb")
+            from openbb import obb
+            self._obb = obb
+        return self._obb
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in PLATFORM_ATTRS:
+            return getattr(self.load(), name)
+        return _Route(self, name)
+
+    def _resolve(self, path):
+        target = self.load()
+        for part in path.split("."):
+            target = getattr(target, part)
+        return target
+
+    def _call(self, route, params):
+        if self.cache_dir:
+            results = load_recorded(self.cache_dir, route, params)
+            if results is not None:
+                self.hits += 1
+                count("cache_hits", stage="fetch", ticker=params.get("symbol"))
+                out = LocalResult(results, route, params)
+                if self._obb is not None and self._obb.user.preferences.output_type == "dataframe":
+                    return out.to_dataframe()
+                return out
+
+        self.misses += 1
+        count("cache_misses", stage="fetch", ticker=params.get("symbol"))
+        if self.cache_only:
+            raise CacheMiss(f"No cached response for {route}({params}) in {self.cache_dir}")
+
+        res = self._resolve(route)(**params)
+        if self.cache_dir:
+            save_recorded(self.cache_dir, route, params, _rows(res))
+        return res
+
+
+class SharedOBB:
+    # Wraps any obb so identical calls made from several threads in one run go
+    # out once: the first caller fetches, later callers for the same route and
+    # params wait on its result (or get its exception re-raised).
+
+    def __init__(self, obb):
+        self._inner = obb
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in PLATFORM_ATTRS:
+            return getattr(self._inner, name)
+        return _Route(self, name)
+
+    @property
+    def unique_calls(self):
+        return len(self._calls)
+
+    def _call(self, route, params):
+        key = record_key(route, params)
+        with self._lock:
+            self.requests += 1
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = self._calls[key] = Future()
+        if not owner:
+            count("shared_fetches", stage="fetch", ticker=params.get("symbol"))
+            return future.result()
+
+        target = self._inner
+        for part in route.split("."):
+            target = getattr(target, part)
+        try:
+            future.set_result(target(**params))
+        except BaseException as e:
+            future.set_exception(e)
+        return future.result()
+
+
+def _rows(res):
+    results = res if isinstance(res, pd.DataFrame) else getattr(res, "results", res)
+    if isinstance(results, pd.DataFrame):
+        df = results.reset_index() if results.index.name else results
+        return df.to_dict("records")
+    if results is None:
+        return []
+    return results if isinstance(results, (list, tuple)) else [results]
@@ -1,13 +1,20 @@
-from openbb import obb
+import data_source
+from data_source import obb
 import pandas as pd
 import os
 import numpy as np
+import data_quality
+from fundamentals_arrays import StatementArrays
+from instrumentation import span
+import memo
 
 YEAR     = 2023
 TICKERS  = ["AMD", "MSFT", "NVDA", "HPQ"]     
 PROVIDER = "fmp"
 
 def _to_df(obb_object):
+    if isinstance(obb_object, StatementArrays):
+        return obb_object.to_frame()
     res = getattr(obb_object, "results", None)
     if res is None:
         return pd.DataFrame()
@@ -79,86 +86,117 @@ def _sdiv(a, b):
         return np.nan
     return a / b
 
-def compute_one(symbol):
-    try:
-        bal = _to_df(obb.equity.fundamental.balance(symbol=symbol, provider=PROVIDER, period="annual", limit=10))
-        inc = _to_df(obb.equity.fundamental.income (symbol=symbol, provider=PROVIDER, period="annual", limit=10))
-
-        b = _row_for_year(bal, YEAR)
-        i = _row_for_year(inc, YEAR)
-
-        # Balance sheet (FY2023)
-        ca   = b.get(_first_col(bal, ["total_current_assets","current_assets","currentAssets"]))
-        cl   = b.get(_first_col(bal, ["total_current_liabilities","current_liabilities","currentLiabilities"]))
-        inv  = b.get(_first_col(bal, ["inventory","inventories","inventory_net","inventoryNet"]))
+@memo.memoize(deps=(_row_for_year, _filter_fy, _first_col, _to_num, _sdiv))
+def measures(bal, inc, year):
+    # the fiscal-year metrics, unrounded and in METRIC_COLUMNS order. Pure in
+    # its inputs, so it is memoized on disk when FA_MEMO_DIR is set (memo.py);
+    # classification and formatting stay in compute_one
+    b = _row_for_year(bal, year)
+    i = _row_for_year(inc, year)
+
+    # Balance sheet
+    ca   = b.get(_first_col(bal, ["total_current_assets","current_assets","currentAssets"]))
+    cl   = b.get(_first_col(bal, ["total_current_liabilities","current_liabilities","currentLiabilities"]))
+    inv  = b.get(_first_col(bal, ["inventory","inventories","inventory_net","inventoryNet"]))
+    cash = b.get(_first_col(bal, [
+        "cash_and_cash_equivalents","cashAndCashEquivalents"
+    ]))  # primary per spec; fallback below if missing
+    if pd.isna(cash):
         cash = b.get(_first_col(bal, [
-            "cash_and_cash_equivalents","cashAndCashEquivalents"
-        ]))  # primary per spec; fallback below if missing
-        if pd.isna(cash):
-            cash = b.get(_first_col(bal, [
-                "cash_and_short_term_investments","cashAndShortTermInvestments",
-                "cashAndCashEquivalentsAndShortTermInvestments"
-            ]))
-
-        ta   = b.get(_first_col(bal, ["total_assets","totalAssets"]))
-        tl   = b.get(_first_col(bal, ["total_liabilities","totalLiabilities"]))
-        te   = b.get(_first_col(bal, [
-            "totalStockholdersEquity", "totalEquity"
+            "cash_and_short_term_investments","cashAndShortTermInvestments",
+            "cashAndCashEquivalentsAndShortTermInvestments"
         ]))
-        if pd.isna(te) and (not pd.isna(ta)) and (not pd.isna(tl)):
-            te = _to_num(ta) - _to_num(tl)
-
-        total_debt = b.get(_first_col(bal, ["total_debt","totalDebt","shortLongTermDebtTotal"]))
-        if pd.isna(total_debt):
-            sd = b.get(_first_col(bal, ["short_term_debt","shortTermDebt"]))
-            ld = b.get(_first_col(bal, ["long_term_debt","longTermDebt","longTermDebtNoncurrent"]))
-            total_debt = _to_num(sd) + _to_num(ld) if (not pd.isna(sd) or not pd.isna(ld)) else np.nan
-
-        # Income statement (FY2023)
-        revenue = i.get(_first_col(inc, ["revenue","total_revenue","sales","totalRevenue","Revenue"]))
-        gross   = i.get(_first_col(inc, ["gross_profit","grossProfit"]))
-        if pd.isna(gross):
-            cor = i.get(_first_col(inc, ["cost_of_revenue","costOfRevenue","cost_of_goods_sold"]))
-            if not pd.isna(revenue) and not pd.isna(cor):
-                gross = _to_num(revenue) - _to_num(cor)
-        
-        op_income = i.get(_first_col(inc, ["total_operating_income","totalOperatingIncome","ebit"]))
-        net_income = i.get(_first_col(inc, ["net_income","netIncome"]))
-        interest_expense = i.get(_first_col(inc, ["interest_expense","interestExpense"]))
-
-        # Metrics
-        current_ratio = _sdiv(ca, cl)
-
-        quick_ratio = np.nan
-        if not pd.isna(ca) and not pd.isna(inv) and not pd.isna(cl):
-            quick_ratio = _sdiv(_to_num(ca) - _to_num(inv), cl)
 
-        cash_ratio = _sdiv(cash, cl)
-        debt_equity = _sdiv(total_debt, te)
-
-        interest_coverage = _sdiv(op_income, interest_expense)
-
-        asset_turnover = _sdiv(revenue, ta)
-
-        roe_pct = np.nan
-        if not pd.isna(net_income) and not pd.isna(te) and _to_num(te) != 0.0:
-            roe_pct = ((_to_num(net_income) / _to_num(te)) * 100.0)
-
-        net_margin_pct = np.nan
-        if not pd.isna(net_income) and not pd.isna(revenue) and _to_num(revenue) != 0.0:
-            net_margin_pct = (_to_num(net_income) / _to_num(revenue)) * 100.0
-
-        gm_pct = np.nan
-        if not pd.isna(gross) and not pd.isna(revenue) and _to_num(revenue) != 0.0:
-            gm_pct = (_to_num(gross) / _to_num(revenue)) * 100.0
+    ta   = b.get(_first_col(bal, ["total_assets","totalAssets"]))
+    tl   = b.get(_first_col(bal, ["total_liabilities","totalLiabilities"]))
+    te   = b.get(_first_col(bal, [
+        "totalStockholdersEquity", "totalEquity"
+    ]))
+    if pd.isna(te) and (not pd.isna(ta)) and (not pd.isna(tl)):
+        te = _to_num(ta) - _to_num(tl)
+
+    total_debt = b.get(_first_col(bal, ["total_debt","totalDebt","shortLongTermDebtTotal"]))
+    if pd.isna(total_debt):
+        sd = b.get(_first_col(bal, ["short_term_debt","shortTermDebt"]))
+        ld = b.get(_first_col(bal, ["long_term_debt","longTermDebt","longTermDebtNoncurrent"]))
+        total_debt = _to_num(sd) + _to_num(ld) if (not pd.isna(sd) or not pd.isna(ld)) else np.nan
+
+    # Income statement
+    revenue = i.get(_first_col(inc, ["revenue","total_revenue","sales","totalRevenue","Revenue"]))
+    gross   = i.get(_first_col(inc, ["gross_profit","grossProfit"]))
+    if pd.isna(gross):
+        cor = i.get(_first_col(inc, ["cost_of_revenue","costOfRevenue","cost_of_goods_sold"]))
+        if not pd.isna(revenue) and not pd.isna(cor):
+            gross = _to_num(revenue) - _to_num(cor)
+
+    op_income = i.get(_first_col(inc, ["total_operating_income","totalOperatingIncome","ebit"]))
+    net_income = i.get(_first_col(inc, ["net_income","netIncome"]))
+    interest_expense = i.get(_first_col(inc, ["interest_expense","interestExpense"]))
+
+    # Metrics
+    current_ratio = _sdiv(ca, cl)
+
+    quick_ratio = np.nan
+    if not pd.isna(ca) and not pd.isna(inv) and not pd.isna(cl):
+        quick_ratio = _sdiv(_to_num(ca) - _to_num(inv), cl)
+
+    cash_ratio = _sdiv(cash, cl)
+    debt_equity = _sdiv(total_debt, te)
+
+    interest_coverage = _sdiv(op_income, interest_expense)
+
+    asset_turnover = _sdiv(revenue, ta)
+
+    roe_pct = np.nan
+    if not pd.isna(net_income) and not pd.isna(te) and _to_num(te) != 0.0:
+        roe_pct = ((_to_num(net_income) / _to_num(te)) * 100.0)
+
+    net_margin_pct = np.nan
+    if not pd.isna(net_income) and not pd.isna(revenue) and _to_num(revenue) != 0.0:
+        net_margin_pct = (_to_num(net_income) / _to_num(revenue)) * 100.0
+
+    gm_pct = np.nan
+    if not pd.isna(gross) and not pd.isna(revenue) and _to_num(revenue) != 0.0:
+        gm_pct = (_to_num(gross) / _to_num(revenue)) * 100.0
+
+    op_margin_pct = np.nan
+    if not pd.isna(op_income) and not pd.isna(revenue) and _to_num(revenue) != 0.0:
+        op_margin_pct = (_to_num(op_income) / _to_num(revenue)) * 100.0
+
+    wc_b = np.nan
+    if not pd.isna(ca) and not pd.isna(cl):
+        wc_b = (_to_num(ca) - _to_num(cl)) / 1e9
+
+    return (current_ratio, quick_ratio, cash_ratio, debt_equity, interest_coverage, asset_turnover,
+            roe_pct, net_margin_pct, gm_pct, op_margin_pct, wc_b)
+
+def fetch_statements(symbol):
+    with span("fetch", symbol):
+        bal_res = obb.equity.fundamental.balance(symbol=symbol, provider=PROVIDER, period="annual", limit=10)
+        inc_res = obb.equity.fundamental.income (symbol=symbol, provider=PROVIDER, period="annual", limit=10)
+    return bal_res, inc_res
+
+def gate(statements):
+    # data-quality checks over every fetched {symbol: fetch_statements(symbol)}
+    # at once; fiscal years failing them are dropped from both statements
+    return data_quality.gate_statements(statements, "liquidity_leverage", balance_index=0)
+
+def run_params():
+    # everything a checkpointed universe run's rows depend on (see checkpoint.py)
+    return {"analysis": "liquidity_leverage", "YEAR": YEAR, "provider": PROVIDER, "period": "annual", "limit": 10,
+            "quality": data_quality.MODE, **data_source.source_params()}
+
+def compute_one(symbol, statements=None):
+    # statements: the symbol's entry of gate(...), fetched and gated here when not given
+    try:
+        bal_res, inc_res = statements or gate({symbol: fetch_statements(symbol)})[symbol]
 
-        op_margin_pct = np.nan
-        if not pd.isna(op_income) and not pd.isna(revenue) and _to_num(revenue) != 0.0:
-            op_margin_pct = (_to_num(op_income) / _to_num(revenue)) * 100.0
+        with span("transform", symbol):
+            bal = _to_df(bal_res)
+            inc = _to_df(inc_res)
 
-        wc_b = np.nan
-        if not pd.isna(ca) and not pd.isna(cl):
-            wc_b = (_to_num(ca) - _to_num(cl)) / 1e9
+        (current_ratio, quick_ratio, cash_ratio, debt_equity, interest_coverage, asset_turnover,
+         roe_pct, net_margin_pct, gm_pct, op_margin_pct, wc_b) = measures(bal, inc, YEAR)
 
         cr_val = _to_num(current_ratio)
         de_val = _to_num(debt_equity)
@@ -171,7 +209,7 @@ def compute_one(symbol):
             else:
                 health = "Weak"
         else:
-            "N/A"
+            health = "N/A"
         
         roe_val = _to_num(roe_pct)
         wc_val = _to_num(wc_b)
@@ -187,9 +225,9 @@ def compute_one(symbol):
             efficiency = "N/A"
 
         def _fmt(x):
-            return "N/A" if (x is None or (isinstance(x, float) and np.isnan(x))) else round(float(x), 1)
+            return np.nan if (x is None or (isinstance(x, float) and np.isnan(x))) else round(float(x), 1)
 
-        return {
+        row = {
             "Ticker": symbol,
             "Current Ratio": _fmt(current_ratio),
             "Quick Ratio": _fmt(quick_ratio),
@@ -205,30 +243,18 @@ def compute_one(symbol):
             "Financial Health": health,
             "Efficiency Category": efficiency,
         }
+        row["Status"] = STATUS_OK if not any(np.isnan(row[c]) for c in METRIC_COLUMNS) else STATUS_INSUFFICIENT
+        return row
     except Exception as e:
         print(f"Failed {symbol}: {e}")
-        return {
-            "Ticker": symbol,
-            "Current Ratio": "N/A",
-            "Quick Ratio": "N/A",
-            "Cash Ratio": "N/A",
-            "Debt/Equity": "N/A",
-            "Interest Coverage": "N/A",
-            "Asset Turnover": "N/A",
-            "ROE (%)": "N/A",
-            "Net Margin (%)": "N/A",
-            "Gross Margin (%)": "N/A",
-            "Operating Margin (%)": "N/A",
-            "Working Capital ($B)": "N/A",
-            "Financial Health": "N/A",
-            "Efficiency Category": "N/A",
-        }
-
+        row = {"Ticker": symbol}
+        row.update({c: np.nan for c in METRIC_COLUMNS})
+        row.update({"Financial Health": "N/A", "Efficiency Category": "N/A", "Status": STATUS_ERROR})
+        return row
 
-rows = [compute_one(sym) for sym in TICKERS]
 
-final_df = pd.DataFrame(rows, columns=[
-    "Ticker",
+# metric columns are float64 with NaN for missing values; Status says why
+METRIC_COLUMNS = [
     "Current Ratio",
     "Quick Ratio",
     "Cash Ratio",
@@ -240,29 +266,52 @@ final_df = pd.DataFrame(rows, columns=[
     "Gross Margin (%)",
     "Operating Margin (%)",
     "Working Capital ($B)",
-    "Financial Health",
-    "Efficiency Category",
-])
-
-health_order = {'Strong': 0, 'Moderate': 1, 'Weak': 2, 'N/A': 3}
-efficiency_order = {'Efficient': 0, 'Moderate': 1, 'Inefficient': 2, 'N/A': 3}
+]
 
-final_df['health_sort'] = final_df['Financial Health'].map(health_order)
-final_df['efficiency_sort'] = final_df['Efficiency Category'].map(efficiency_order)
+STATUS_OK = "OK"
+STATUS_INSUFFICIENT = "Insufficient Data"
+STATUS_ERROR = "Error"
 
-def _sort_val(x):
-    if x == "N/A":
-        return -999999
-    return float(x)
+COLUMNS = ["Ticker"] + METRIC_COLUMNS + ["Financial Health", "Efficiency Category", "Status"]
+# declared output types (output_sink.typed_frame), so Parquet/Arrow schemas
+# never depend on the first batch's values
+COLUMN_DTYPES = {c: ("float64" if c in METRIC_COLUMNS else "string") for c in COLUMNS}
 
-final_df['roe_sort'] = final_df['ROE (%)'].apply(_sort_val)
-
-final_df = final_df.sort_values(
-    ['health_sort', 'efficiency_sort', 'roe_sort'], 
-    ascending=[True, True, False])
-
-final_df = final_df.drop(['health_sort', 'efficiency_sort', 'roe_sort'], axis=1).reset_index(drop=True)
-
-print(final_df.to_string(index=False))
+health_order = {'Strong': 0, 'Moderate': 1, 'Weak': 2, 'N/A': 3}
+efficiency_order = {'Efficient': 0, 'Moderate': 1, 'Inefficient': 2, 'N/A': 3}
 
-df_to_csv(final_df)
+def results_frame(rows):
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df[METRIC_COLUMNS] = df[METRIC_COLUMNS].astype("float64")
+    return df
+
+def sort_results(final_df):
+    # missing ROE sorts last within its health/efficiency group
+    keys = pd.DataFrame({
+        'health_sort': final_df['Financial Health'].map(health_order),
+        'efficiency_sort': final_df['Efficiency Category'].map(efficiency_order),
+        'roe_sort': final_df['ROE (%)'].fillna(-np.inf),
+    })
+    order = keys.sort_values(
+        ['health_sort', 'efficiency_sort', 'roe_sort'], 
+        ascending=[True, True, False]).index
+
+    return final_df.loc[order].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    # one data-quality pass over every fetched symbol; compute_one refetches a
+    # symbol whose fetch failed and reports it as an Error row
+    statements = gate(data_quality.fetch_all(fetch_statements, TICKERS))
+    rows = []
+    for sym in TICKERS:
+        with span("compute", sym):
+            rows.append(compute_one(sym, statements.get(sym)))
+
+    with span("compute", name="sort_results"):
+        final_df = sort_results(results_frame(rows))
+
+    print(final_df.to_string(index=False))
+
+    with span("output"):
+        df_to_csv(final_df)
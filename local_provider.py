@@ -0,0 +1,322 @@
+import functools
+import hashlib
+import json
+import os
+import time
+import zlib
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+# Offline stand-in for the parts of `obb` the analysis scripts call. Serves
+# recorded responses from a data directory when present, otherwise
+# deterministic synthetic data for N symbols x M years, with optional latency.
+
+N_SYMBOLS = 100
+YEARS = 10
+END_DATE = "2024-12-31"
+SEED = 0
+
+ROUTES = [
+    "equity.price.historical",
+    "crypto.price.historical",
+    "equity.fundamental.income",
+    "equity.fundamental.balance",
+    "equity.fundamental.cash",
+    "equity.fundamental.ratios",
+    "equity.fundamental.metrics",
+]
+
+
+class Record:
+    # result model stand-in: attribute access plus model_dump()
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def model_dump(self):
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        return f"Record({self.__dict__!r})"
+
+
+class LocalResult:
+    def __init__(self, results, route, params):
+        self.results = results
+        self.provider = "local"
+        self.extra = {"route": route, "params": params}
+
+    def to_dataframe(self):
+        df = pd.DataFrame([r.model_dump() for r in self.results])
+        if "date" in df.columns:
+            df = df.set_index("date")
+        return df
+
+    to_df = to_dataframe
+
+
+def _json_default(x):
+    if isinstance(x, (date, pd.Timestamp)):
+        return x.isoformat()[:10]
+    if isinstance(x, np.generic):
+        return x.item()
+    return str(x)
+
+
+def record_key(route, params):
+    params = {k: v for k, v in params.items() if v is not None}
+    blob = json.dumps(params, sort_keys=True, default=_json_default)
+    return hashlib.sha1(f"{route}|{blob}".encode()).hexdigest()[:16]
+
+
+def record_path(data_dir, route, params):
+    symbol = str(params.get("symbol", "_")).replace("/", "_").replace("^", "_")
+    return os.path.join(data_dir, route, symbol, record_key(route, params) + ".json")
+
+
+def load_recorded(data_dir, route, params):
+    path = record_path(data_dir, route, params)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        payload = json.load(f)
+    return [Record(**r) for r in payload["results"]]
+
+
+def save_recorded(data_dir, route, params, results):
+    path = record_path(data_dir, route, params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rows = [r.model_dump() if hasattr(r, "model_dump") else dict(r) for r in results]
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"route": route, "params": params, "results": rows}, f, default=_json_default)
+    os.replace(tmp, path)
+    return path
+
+
+def _rng(seed, *parts):
+    return np.random.default_rng(zlib.crc32(":".join(map(str, (seed,) + parts)).encode()))
+
+
+class LocalOBB:
+
+    def __init__(self, n_symbols=N_SYMBOLS, years=YEARS, end_date=END_DATE, latency=0.0, data_dir=None, seed=SEED):
+        self.n_symbols = n_symbols
+        self.years = years
+        self.end_date = pd.Timestamp(end_date)
+        self.start_date = self.end_date - pd.DateOffset(years=years)
+        self.latency = latency
+        self.data_dir = data_dir
+        self.seed = seed
+        self.calls = 0
+        # income/balance/cash/ratios/metrics for a symbol all come from one history
+        self._fundamentals = functools.lru_cache(maxsize=256)(self._fundamentals)
+
+        self.user = SimpleNamespace(preferences=SimpleNamespace(output_type="OBBject"))
+        self.equity = SimpleNamespace(
+            price=SimpleNamespace(historical=self._route("equity.price.historical", self._equity_prices)),
+            fundamental=SimpleNamespace(
+                income=self._route("equity.fundamental.income", self._income),
+                balance=self._route("equity.fundamental.balance", self._balance),
+                cash=self._route("equity.fundamental.cash", self._cash),
+                ratios=self._route("equity.fundamental.ratios", self._ratios),
+                metrics=self._route("equity.fundamental.metrics", self._metrics),
+            ),
+        )
+        self.crypto = SimpleNamespace(
+            price=SimpleNamespace(historical=self._route("crypto.price.historical", self._crypto_prices)),
+        )
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            n_symbols=int(os.environ.get("FA_LOCAL_SYMBOLS", N_SYMBOLS)),
+            years=int(os.environ.get("FA_LOCAL_YEARS", YEARS)),
+            end_date=os.environ.get("FA_LOCAL_END_DATE", END_DATE),
+            latency=float(os.environ.get("FA_LOCAL_LATENCY_MS", 0)) / 1000.0,
+            data_dir=os.environ.get("FA_LOCAL_DATA_DIR") or None,
+            seed=int(os.environ.get("FA_LOCAL_SEED", SEED)),
+        )
+
+    def universe(self):
+        return [f"SYM{i:05d}" for i in range(self.n_symbols)]
+
+    def _route(self, route, synth):
+        def call(**params):
+            self.calls += 1
+            if self.latency:
+                time.sleep(self.latency)
+            results = load_recorded(self.data_dir, route, params) if self.data_dir else None
+            if results is None:
+                results = synth(**params)
+            out = LocalResult(results, route, params)
+            if self.user.preferences.output_type == "dataframe":
+                return out.to_dataframe()
+            return out
+        call.__name__ = route.rsplit(".", 1)[-1]
+        return call
+
+    # --- prices ---
+
+    def _market(self, freq, n):
+        # common factor so synthetic betas and correlations look like real ones
+        return _rng(self.seed, "market", freq).normal(0.0003, 0.01, n)
+
+    def _prices(self, symbol, start_date, end_date, freq, vol):
+        dates = pd.date_range(self.start_date, self.end_date, freq=freq)
+        rng = _rng(self.seed, "price", symbol)
+        beta = 1.0 if symbol.startswith("^") else rng.uniform(0.3, 1.8)
+        rets = beta * self._market(freq, len(dates)) + rng.normal(0, vol * rng.uniform(0.6, 1.6), len(dates))
+        close = rng.uniform(20, 500) * np.exp(np.cumsum(rets))
+        spread = max(vol, 0.01)
+        open_ = close * np.exp(rng.normal(0, spread / 4, len(dates)))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, spread / 2, len(dates))))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, spread / 2, len(dates))))
+        volume = rng.integers(1e5, 5e7, len(dates))
+        prev = np.concatenate([[close[0]], close[:-1]])
+
+        keep = np.ones(len(dates), dtype=bool)
+        if start_date:
+            keep &= dates >= pd.Timestamp(start_date)
+        if end_date:
+            keep &= dates <= pd.Timestamp(end_date)
+
+        return [
+            Record(
+                date=d.date(), open=float(o), high=float(h), low=float(lo), close=float(c),
+                volume=int(v), vwap=float((h + lo + c) / 3), adj_close=float(c),
+                change=float(c - p), change_percent=float(c / p - 1),
+            )
+            for d, o, h, lo, c, v, p in zip(dates[keep], open_[keep], high[keep], low[keep],
+                                            close[keep], volume[keep], prev[keep])
+        ]
+
+    def _equity_prices(self, symbol, start_date=None, end_date=None, **_):
+        vol = 0.0 if symbol.startswith("^") else 0.015
+        return self._prices(symbol, start_date, end_date, "B", vol)
+
+    def _crypto_prices(self, symbol, start_date=None, end_date=None, **_):
+        return self._prices(symbol, start_date, end_date, "D", 0.04)
+
+    # --- fundamentals ---
+
+    def _fundamentals(self, symbol):
+        # one consistent quarterly history per symbol, oldest first
+        rng = _rng(self.seed, "fundamentals", symbol)
+        periods = pd.period_range(self.start_date, self.end_date, freq="Q")
+        periods = periods[periods.end_time <= self.end_date + pd.Timedelta(days=1)]
+        n = len(periods)
+
+        revenue = rng.uniform(5e8, 3e10) * np.exp(np.cumsum(rng.normal(0.015, 0.06, n)))
+        gross_margin = np.clip(rng.uniform(0.2, 0.7) + rng.normal(0, 0.02, n), 0.05, 0.95)
+        op_margin = np.clip(gross_margin - rng.uniform(0.05, 0.3) + rng.normal(0, 0.03, n), -0.3, 0.6)
+        rd = revenue * rng.uniform(0, 0.15)
+        da = revenue * rng.uniform(0.02, 0.08)
+        operating_income = revenue * op_margin
+        interest = revenue * rng.uniform(0, 0.03)
+        pretax = operating_income - interest
+        tax = np.maximum(pretax, 0) * 0.21
+        net_income = pretax - tax
+        shares = rng.uniform(1e8, 8e9) * np.exp(np.cumsum(rng.normal(-0.002, 0.004, n)))
+
+        total_assets = revenue * rng.uniform(2, 6) * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+        current_assets = total_assets * np.clip(rng.uniform(0.2, 0.6) + rng.normal(0, 0.02, n), 0.05, 0.9)
+        cash = current_assets * rng.uniform(0.1, 0.5)
+        inventory = current_assets * rng.uniform(0, 0.3)
+        total_liabilities = total_assets * np.clip(rng.uniform(0.3, 0.8) + rng.normal(0, 0.02, n), 0.05, 0.98)
+        current_liabilities = total_liabilities * rng.uniform(0.2, 0.6)
+        short_term_debt = current_liabilities * rng.uniform(0, 0.3)
+        long_term_debt = (total_liabilities - current_liabilities) * rng.uniform(0.2, 0.8)
+        retained_earnings = (total_assets - total_liabilities) * rng.uniform(-0.5, 1.5)
+        operating_cash_flow = net_income + da + revenue * rng.normal(0, 0.03, n)
+        capex = -revenue * rng.uniform(0.02, 0.12)
+        price = rng.uniform(20, 500) * np.exp(np.cumsum(rng.normal(0.02, 0.1, n)))
+
+        return {
+            "period": periods,
+            "revenue": revenue, "cost_of_revenue": revenue * (1 - gross_margin),
+            "gross_profit": revenue * gross_margin, "research_and_development_expense": rd,
+            "depreciation_and_amortization": da, "total_operating_income": operating_income,
+            "ebit": operating_income, "ebitda": operating_income + da, "interest_expense": interest,
+            "income_before_tax": pretax, "income_tax_expense": tax, "net_income": net_income,
+            "consolidated_net_income": net_income, "weighted_average_basic_shares_outstanding": shares,
+            "total_assets": total_assets, "total_current_assets": current_assets,
+            "cash_and_cash_equivalents": cash, "cash_and_short_term_investments": cash * 1.2,
+            "inventory": inventory, "total_liabilities": total_liabilities,
+            "total_current_liabilities": current_liabilities, "short_term_debt": short_term_debt,
+            "long_term_debt": long_term_debt, "total_debt": short_term_debt + long_term_debt,
+            "retained_earnings": retained_earnings, "total_equity": total_assets - total_liabilities,
+            "operating_cash_flow": operating_cash_flow, "capital_expenditure": capex,
+            "free_cash_flow": operating_cash_flow + capex, "price": price,
+        }
+
+    def _periods(self, symbol, period, limit, fields, flows):
+        f = self._fundamentals(symbol)
+        periods = f["period"]
+        rows = []
+        if period == "quarter":
+            for k in range(len(periods)):
+                rows.append((periods[k].end_time.date(), f"Q{periods[k].quarter}", periods[k].year,
+                             {name: f[name][k] for name in fields}))
+        else:
+            for year in sorted(set(periods.year)):
+                idx = np.flatnonzero(periods.year == year)
+                if len(idx) < 4:
+                    continue
+                vals = {name: f[name][idx].sum() if name in flows else f[name][idx[-1]] for name in fields}
+                rows.append((date(year, 12, 31), "FY", year, vals))
+
+        rows = rows[::-1][:limit or None]
+        return [
+            Record(period_ending=pe, fiscal_period=fp, fiscal_year=fy, **{k: float(v) for k, v in vals.items()})
+            for pe, fp, fy, vals in rows
+        ]
+
+    _INCOME = [
+        "revenue", "cost_of_revenue", "gross_profit", "research_and_development_expense",
+        "depreciation_and_amortization", "total_operating_income", "ebit", "ebitda", "interest_expense",
+        "income_before_tax", "income_tax_expense", "net_income", "consolidated_net_income",
+        "weighted_average_basic_shares_outstanding",
+    ]
+    _BALANCE = [
+        "total_assets", "total_current_assets", "cash_and_cash_equivalents", "cash_and_short_term_investments",
+        "inventory", "total_liabilities", "total_current_liabilities", "short_term_debt", "long_term_debt",
+        "total_debt", "retained_earnings", "total_equity",
+    ]
+    _CASH = ["operating_cash_flow", "capital_expenditure", "free_cash_flow"]
+
+    def _income(self, symbol, period="annual", limit=5, **_):
+        flows = set(self._INCOME) - {"weighted_average_basic_shares_outstanding"}
+        return self._periods(symbol, period, limit, self._INCOME, flows)
+
+    def _balance(self, symbol, period="annual", limit=5, **_):
+        return self._periods(symbol, period, limit, self._BALANCE, set())
+
+    def _cash(self, symbol, period="annual", limit=5, **_):
+        return self._periods(symbol, period, limit, self._CASH, set(self._CASH))
+
+    def _ratios(self, symbol, period="annual", limit=5, **_):
+        rows = self._periods(symbol, period, limit, ["price", "weighted_average_basic_shares_outstanding",
+                                                     "total_assets", "total_equity", "total_current_assets",
+                                                     "total_current_liabilities"], set())
+        for r in rows:
+            d = r.__dict__
+            equity = d.pop("total_equity")
+            market_cap = d.pop("price") * d.pop("weighted_average_basic_shares_outstanding")
+            d["price_book_value_ratio"] = market_cap / equity if equity else None
+            d["company_equity_multiplier"] = d.pop("total_assets") / equity if equity else None
+            d["current_ratio"] = d.pop("total_current_assets") / d.pop("total_current_liabilities")
+        return rows
+
+    def _metrics(self, symbol, period="annual", limit=5, **_):
+        rows = self._periods(symbol, period, limit, ["price", "weighted_average_basic_shares_outstanding",
+                                                     "total_debt", "cash_and_cash_equivalents", "revenue"], set())
+        for r in rows:
+            d = r.__dict__
+            market_cap = d.pop("price") * d.pop("weighted_average_basic_shares_outstanding")
+            d["market_cap"] = market_cap
+            d["enterprise_value"] = market_cap + d.pop("total_debt") - d.pop("cash_and_cash_equivalents")
+            d["ev_to_sales"] = d["enterprise_value"] / d.pop("revenue")
+        return rows
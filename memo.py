@@ -0,0 +1,251 @@
+import argparse
+import atexit
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import struct
+import sys
+import threading
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+# Content-addressed disk memoization for the pure computation steps of the
+# fundamentals scripts. A result is stored under the SHA-256 of
+#
+#   the function's qualified name, the source code of the function and of the
+#   helpers it names in deps=, an explicit version string, and the arguments
+#
+# where arguments are hashed by value (floats bit-exact, arrays by dtype,
+# shape and bytes, DataFrames column by column, statement arrays by fields,
+# values and meta). Editing the function or its helpers, or passing different
+# statements or parameters, gives a new key. Code outside the memoized step,
+# such as classification thresholds and output formatting, reruns every time.
+#
+# Off unless FA_MEMO_DIR is set. Entries are pickles under
+# <dir>/<key[:2]>/<key>.pkl. A hit refreshes the file's mtime. When the
+# directory grows past FA_MEMO_MAX_MB, the least recently used entries are
+# deleted until it is back under 90% of the limit. Hits and misses per
+# function are printed to stderr at exit.
+#
+#   FA_MEMO_DIR=.memo python liquidity_leverage.py
+#   python memo.py stats .memo
+#   python memo.py clear .memo
+
+MEMO_DIR = os.environ.get("FA_MEMO_DIR") or None
+MAX_MB = float(os.environ.get("FA_MEMO_MAX_MB", 256))
+
+_stats = defaultdict(lambda: [0, 0])
+_lock = threading.Lock()
+_sizes = {}
+
+
+def _feed(h, obj):
+    # canonical, type-tagged bytes for obj
+    if obj is None or isinstance(obj, (bool, np.bool_)):
+        h.update(b"N" if obj is None else (b"T" if obj else b"F"))
+    elif isinstance(obj, (int, np.integer)):
+        h.update(b"i" + str(int(obj)).encode())
+    elif isinstance(obj, (float, np.floating)):
+        h.update(b"f" + struct.pack("<d", float(obj)))
+    elif isinstance(obj, str):
+        h.update(b"s" + struct.pack("<q", len(obj)) + obj.encode())
+    elif isinstance(obj, bytes):
+        h.update(b"b" + struct.pack("<q", len(obj)) + obj)
+    elif isinstance(obj, np.ndarray):
+        h.update(b"a" + obj.dtype.str.encode() + str(obj.shape).encode())
+        if obj.dtype.kind == "O":
+            # strings, dates and None from statement frames; pickle is
+            # deterministic for these and much faster than element-wise feeding
+            h.update(pickle.dumps(obj.tolist(), protocol=4))
+        else:
+            h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, pd.DataFrame):
+        h.update(b"D" + struct.pack("<q", len(obj)))
+        _feed(h, [f"{c}:{t}" for c, t in obj.dtypes.items()])
+        _feed(h, obj.to_numpy(dtype=object))
+    elif isinstance(obj, pd.Series):
+        h.update(b"S")
+        _feed(h, obj.to_numpy())
+    elif isinstance(obj, dict):
+        h.update(b"d" + struct.pack("<q", len(obj)))
+        for k in sorted(obj, key=str):
+            _feed(h, str(k))
+            _feed(h, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"l" + struct.pack("<q", len(obj)))
+        for x in obj:
+            _feed(h, x)
+    elif all(hasattr(obj, a) for a in ("fields", "values", "meta")):
+        # fundamentals_arrays.StatementArrays
+        h.update(b"A")
+        _feed(h, (obj.fields, obj.values, obj.meta))
+    elif hasattr(obj, "model_dump"):
+        _feed(h, obj.model_dump())
+    else:
+        _feed(h, str(obj))
+
+
+def digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        _feed(h, part)
+    return h.hexdigest()
+
+
+def code_version(fn, deps=(), version=""):
+    return digest(version, *(inspect.getsource(f) for f in (fn, *deps)))
+
+
+def _dir_size(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        for f in files:
+            try:
+                total += os.stat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def evict(directory, max_bytes, target=0.9):
+    # deletes least recently used entries until the directory is under
+    # target * max_bytes; returns (entries removed, bytes left)
+    entries = []
+    for root, _, files in os.walk(directory):
+        for f in files:
+            if f.endswith(".pkl"):
+                path = os.path.join(root, f)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    if total <= max_bytes:
+        return removed, total
+    for _, size, path in sorted(entries):
+        if total <= target * max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed, total
+
+
+def _path(directory, key):
+    return os.path.join(directory, key[:2], key + ".pkl")
+
+
+def _store(directory, key, value):
+    path = _path(directory, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    size = os.path.getsize(path)
+    with _lock:
+        if directory not in _sizes:
+            _sizes[directory] = _dir_size(directory)
+        else:
+            _sizes[directory] += size
+        over = _sizes[directory] > MAX_MB * 2 ** 20
+    if over:
+        _, left = evict(directory, MAX_MB * 2 ** 20)
+        with _lock:
+            _sizes[directory] = left
+
+
+def memoize(fn=None, *, deps=(), version=""):
+    # @memoize or @memoize(deps=(helper, ...), version="2")
+    if fn is None:
+        return functools.partial(memoize, deps=deps, version=version)
+    name = f"{fn.__module__}.{fn.__qualname__}"
+    code = []
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        directory = MEMO_DIR
+        if directory is None:
+            return fn(*args, **kwargs)
+        if not code:
+            code.append(code_version(fn, deps, version))
+        key = digest(name, code[0], args, kwargs)
+        path = _path(directory, key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # missing, evicted meanwhile, or cut short by a crash mid-write
+            pass
+        else:
+            with _lock:
+                _stats[name][0] += 1
+            return value
+        value = fn(*args, **kwargs)
+        with _lock:
+            _stats[name][1] += 1
+        _store(directory, key, value)
+        return value
+
+    wrapper.memo_name = name
+    return wrapper
+
+
+def stats():
+    # {function: (hits, misses)}
+    with _lock:
+        return {name: tuple(v) for name, v in _stats.items()}
+
+
+def report(file=None):
+    file = file or sys.stderr
+    rows = stats()
+    if not rows:
+        return
+    print(f"memo cache {MEMO_DIR}:", file=file)
+    print(f"  {'function':<52} {'hits':>7} {'misses':>7} {'hit rate':>9}", file=file)
+    for name, (hits, misses) in sorted(rows.items()):
+        print(f"  {name:<52} {hits:>7} {misses:>7} {hits / (hits + misses):>9.1%}", file=file)
+
+
+def _at_exit():
+    if MEMO_DIR is not None:
+        report()
+
+
+atexit.register(_at_exit)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear a memo cache directory")
+    parser.add_argument("command", choices=["stats", "clear", "evict"])
+    parser.add_argument("dir", nargs="?", default=MEMO_DIR)
+    parser.add_argument("--max-mb", type=float, default=MAX_MB)
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error("no cache directory (pass one or set FA_MEMO_DIR)")
+
+    if args.command == "stats":
+        files = [os.path.join(r, f) for r, _, fs in os.walk(args.dir) for f in fs if f.endswith(".pkl")]
+        size = sum(os.path.getsize(f) for f in files)
+        print(f"{args.dir}: {len(files)} entries, {size / 2 ** 20:.2f} MB (limit {args.max_mb:g} MB)")
+    elif args.command == "evict":
+        removed, left = evict(args.dir, args.max_mb * 2 ** 20)
+        print(f"{args.dir}: removed {removed} entries, {left / 2 ** 20:.2f} MB left")
+    else:
+        removed, _ = evict(args.dir, 0, target=0)
+        print(f"{args.dir}: removed {removed} entries")
+
+
+if __name__ == "__main__":
+    main()
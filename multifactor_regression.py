@@ -0,0 +1,208 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import capm_risk_adjusted_performance as capm
+import data_source
+from chunked_pipeline import batches, chunk_returns, plan
+from instrumentation import span
+from price_store import PriceStore
+
+# Fama-French-style multi-factor regressions for every ticker in a price store:
+#
+#   r - rf = alpha + b_mkt * mkt_rf + b_smb * smb + b_hml * hml + b_mom * mom + e
+#
+# All tickers share one design matrix X = [1, factors] on the store's
+# calendar. Each ticker only uses the dates where both its return and the
+# factors are present (mask M), so the normal equations are
+#
+#   X'X[s] = sum_t M[s,t] x_t x_t'      X'y[s] = sum_t M[s,t] y[s,t] x_t
+#
+# built for a whole symbol batch with two matrix products per date chunk and
+# solved together with batched linear algebra. The same batching and memory
+# budget as chunked_pipeline apply.
+#
+# The factor file is a CSV with a date column and mkt_rf, smb, hml, mom and
+# optionally rf, in decimals (--percent for Ken French's percent files).
+#
+#   python multifactor_regression.py prices/ --factors factors.csv
+#   FA_DATA_SOURCE=local python multifactor_regression.py --synthetic-factors factors.csv
+
+FACTORS = ("mkt_rf", "smb", "hml", "mom")
+FACTOR_FILE = os.environ.get("FA_FACTOR_FILE", "factors.csv")
+
+STATUS_OK = "OK"
+STATUS_INSUFFICIENT = "Insufficient Data"
+
+# Ken French column names
+_ALIASES = {"mkt-rf": "mkt_rf", "mkt_rf": "mkt_rf", "umd": "mom", "wml": "mom", "mom": "mom",
+            "smb": "smb", "hml": "hml", "rf": "rf", "date": "date"}
+
+# per-cell bytes of a chunk: the price/return blocks, the masked copies and
+# the (k+1)^2-wide product feeding X'X
+CELL_BYTES = 8 * 12
+
+
+def load_factors(path=None, factors=FACTORS, percent=False):
+    # DataFrame indexed by datetime64 date with `factors` and rf columns
+    df = pd.read_csv(path or FACTOR_FILE)
+    df.columns = [_ALIASES.get(str(c).strip().lower(), str(c).strip().lower()) for c in df.columns]
+    if "date" not in df.columns:
+        df = df.rename(columns={df.columns[0]: "date"})
+    missing = [f for f in factors if f not in df.columns]
+    if missing:
+        raise ValueError(f"Factor file has no {missing} columns (found {list(df.columns)})")
+    if "rf" not in df.columns:
+        df["rf"] = 0.0
+    date = df["date"].astype(str)
+    # French files use YYYYMMDD
+    df["date"] = pd.to_datetime(date, format="%Y%m%d") if date.str.fullmatch(r"\d{8}").all() else pd.to_datetime(date)
+    out = df.set_index("date")[list(factors) + ["rf"]].apply(pd.to_numeric, errors="coerce").sort_index()
+    return out / 100 if percent else out
+
+
+def design(factors, dates):
+    # (D, 1 + k) design matrix and rf on `dates`; NaN rows where a factor is missing
+    aligned = factors.reindex(pd.DatetimeIndex(dates))
+    rf = aligned["rf"].to_numpy(dtype=np.float64)
+    x = aligned.drop(columns="rf").to_numpy(dtype=np.float64)
+    return np.column_stack([np.ones(len(x)), x]), rf
+
+
+def normal_equations(y, x):
+    # y (B, C) excess returns with NaN where missing, x (C, p) design rows;
+    # returns the masked sums (n, X'X, X'y, y'y, sum y)
+    mask = np.isfinite(y) & np.isfinite(x).all(axis=1)
+    m = mask.astype(np.float64)
+    x0 = np.where(np.isfinite(x), x, 0.0)
+    y0 = np.where(mask, y, 0.0)
+    p = x.shape[1]
+    outer = (x0[:, :, None] * x0[:, None, :]).reshape(len(x0), p * p)
+    return (mask.sum(axis=1), (m @ outer).reshape(-1, p, p), y0 @ x0,
+            (y0 * y0).sum(axis=1), y0.sum(axis=1))
+
+
+def _add(acc, sums):
+    return sums if acc is None else tuple(a + b for a, b in zip(acc, sums))
+
+
+def solve(sums):
+    # batched OLS from the normal-equation sums; NaN where a ticker has too few
+    # observations or a rank-deficient X'X
+    n, xtx, xty, yty, ysum = sums
+    b, p = xty.shape
+    ok = (n > p) & (np.linalg.matrix_rank(xtx, hermitian=True) == p)
+    inv = np.full_like(xtx, np.nan)
+    if ok.any():
+        inv[ok] = np.linalg.inv(xtx[ok])
+    coef = np.einsum("skl,sl->sk", inv, xty)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ssr = np.maximum(yty - np.einsum("sk,sk->s", coef, xty), 0.0)
+        sigma2 = ssr / (n - p)
+        se = np.sqrt(sigma2[:, None] * np.diagonal(inv, axis1=1, axis2=2))
+        sst = yty - ysum * ysum / n
+        r_squared = 1 - ssr / sst
+    return {"n": n, "coef": coef, "t": coef / se, "r_squared": np.where(ok, r_squared, np.nan), "ok": ok}
+
+
+def regress(returns, factors, dates):
+    # in-memory form: returns (S, D) on `dates`, NaN where missing
+    x, rf = design(factors, dates)
+    return solve(normal_equations(returns - rf, x))
+
+
+def regress_store(store, factors, tickers=None, start=None, end=None, budget_mb=None):
+    tickers = list(tickers or store.symbols)
+    rows_idx = np.array([store.symbol_index[t] for t in tickers], dtype=np.intp)
+    d0, d1 = store.date_range(start, end)
+    x, rf = design(factors, store.dates[d0:d1])
+    p = x.shape[1]
+    batch, chunk = plan(len(tickers), d1 - d0, CELL_BYTES + 8 * p * p, 8 * (p * p + p + 4), budget_mb)
+
+    results = []
+    for i0, i1 in batches(len(tickers), batch):
+        rows = rows_idx[i0:i1]
+        last = np.full(len(rows), np.nan)
+        sums = None
+        for c0, c1 in batches(d1 - d0, chunk):
+            with span("fetch", name="price_store"):
+                prices = store.block("adj_close", rows, d0 + c0, d0 + c1)
+                present = store.block_present(rows, d0 + c0, d0 + c1)
+            with span("compute", name="multifactor_chunk"):
+                rets, last = chunk_returns(prices, present, last)
+                sums = _add(sums, normal_equations(rets - rf[c0:c1], x[c0:c1]))
+        with span("compute", name="multifactor_solve"):
+            results.append(solve(sums))
+    merged = {k: np.concatenate([r[k] for r in results]) for k in results[0]} if results else None
+    return results_frame(tickers, merged, list(factors.columns.drop("rf")))
+
+
+def results_frame(tickers, sol, factor_names=FACTORS):
+    # loadings, alpha (annualized %, as in the CAPM script), t-stats and R^2
+    rows = {"ticker": tickers}
+    if sol is None:
+        return pd.DataFrame(rows)
+    coef, t = sol["coef"], sol["t"]
+    rows["alpha"] = np.round(coef[:, 0] * capm.trading_days_per_year * 100, 2)
+    for k, name in enumerate(factor_names, start=1):
+        rows[f"beta_{name}"] = np.round(coef[:, k], 3)
+    rows["t_alpha"] = np.round(t[:, 0], 2)
+    for k, name in enumerate(factor_names, start=1):
+        rows[f"t_{name}"] = np.round(t[:, k], 2)
+    rows["r_squared"] = np.round(sol["r_squared"], 3)
+    rows["n_obs"] = sol["n"]
+    rows["Status"] = np.where(sol["ok"], STATUS_OK, STATUS_INSUFFICIENT)
+    return pd.DataFrame(rows)
+
+
+def sort_results(out):
+    return out.sort_values("ticker").reset_index(drop=True)
+
+
+def synthetic_factors(start, end, market=capm.market_ticker, seed=0):
+    # factor file for offline runs: mkt_rf from the provider's market index,
+    # seeded noise for the others
+    res = data_source.obb.equity.price.historical(symbol=market, start_date=start, end_date=end, provider="fmp")
+    prices = res.to_dataframe().reset_index()
+    rf = capm.daily_rf_rate
+    out = pd.DataFrame({"date": pd.to_datetime(prices["date"]).dt.strftime("%Y-%m-%d"),
+                        "mkt_rf": prices["adj_close"].pct_change() - rf})
+    rng = np.random.default_rng(seed)
+    for name, scale in (("smb", 0.005), ("hml", 0.005), ("mom", 0.007)):
+        out[name] = rng.normal(0, scale, len(out))
+    out["rf"] = rf
+    return out.dropna()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-factor regressions for every ticker in a price store")
+    parser.add_argument("store", nargs="?", help="directory written by price_store.py build")
+    parser.add_argument("--factors", default=FACTOR_FILE, help="factor CSV (default FA_FACTOR_FILE)")
+    parser.add_argument("--percent", action="store_true", help="factor file values are in percent")
+    parser.add_argument("--symbols", help="comma-separated subset of the store's symbols")
+    parser.add_argument("--start", default=capm.start_date)
+    parser.add_argument("--end", default=capm.end_date)
+    parser.add_argument("--budget-mb", type=float, default=None, help="memory budget (default FA_MEMORY_BUDGET_MB)")
+    parser.add_argument("--synthetic-factors", metavar="PATH", help="write a synthetic factor file and exit")
+    args = parser.parse_args(argv)
+
+    if args.synthetic_factors:
+        synthetic_factors(args.start, args.end).to_csv(args.synthetic_factors, index=False)
+        print(f"Saved {args.synthetic_factors}")
+        return
+    if not args.store:
+        parser.error("store is required")
+
+    store = PriceStore(args.store)
+    factors = load_factors(args.factors, percent=args.percent)
+    symbols = [s for s in args.symbols.split(",") if s] if args.symbols else \
+        [s for s in store.symbols if s != capm.market_ticker]
+    out = sort_results(regress_store(store, factors, symbols, args.start, args.end, args.budget_mb))
+    with span("output"):
+        data_source.save_output(out, "multifactor_regression")
+
+
+if __name__ == "__main__":
+    main()
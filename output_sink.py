@@ -0,0 +1,221 @@
+import os
+import threading
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+# Result writer for the analysis scripts. Rows or frames can be written as
+# they are produced; each write() becomes a Parquet row group or an Arrow IPC
+# record batch once `batch_rows` rows are buffered. Parquet and Arrow get typed
+# columns: the scripts' "N/A" placeholders become nulls, so numeric columns
+# stay float64 instead of object. CSV is kept, untyped and byte-compatible with
+# df_to_csv, as the default format. pyarrow is optional and only imported
+# when a Parquet or Arrow sink is opened.
+#
+#   FA_OUTPUT_DIR        output directory (default output/)
+#   FA_OUTPUT_FORMAT     csv (default) | parquet | arrow
+#   FA_OUTPUT_PARTITION  run_date -> <dir>/<name>/run_date=YYYY-MM-DD/part-*.ext
+
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+MISSING = ("N/A", "NA", "")
+BATCH_ROWS = 10_000
+
+OUTPUT_DIR = os.environ.get("FA_OUTPUT_DIR", "output")
+OUTPUT_FORMAT = os.environ.get("FA_OUTPUT_FORMAT", "csv").lower()
+PARTITION = os.environ.get("FA_OUTPUT_PARTITION", "").lower() or None
+
+
+def _pyarrow(fmt):
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(f"{fmt} output needs pyarrow; install it or set FA_OUTPUT_FORMAT=csv") from None
+    return pyarrow
+
+
+def _is_number(x):
+    return isinstance(x, (int, float, np.integer, np.floating)) and not isinstance(x, (bool, np.bool_))
+
+
+def typed_frame(df, dtypes=None):
+    # object columns holding numbers and "N/A" become float64 with NaN; text
+    # columns keep strings with None for "N/A". dtypes ({column: dtype}, e.g. a
+    # script's COLUMN_DTYPES) overrides the inference for the columns it names
+    dtypes = dtypes or {}
+    out = df.copy()
+    for name in out.columns:
+        if name in dtypes:
+            col = out[name]
+            if col.dtype == object or pd.api.types.is_string_dtype(col):
+                col = col.where(~col.isin(MISSING), None)
+            out[name] = col.astype(dtypes[name])
+            continue
+        col = out[name]
+        if col.dtype != object and not pd.api.types.is_string_dtype(col):
+            continue
+        values = [v for v in col if v is not None and not (isinstance(v, float) and np.isnan(v)) and v not in MISSING]
+        if values and all(_is_number(v) for v in values):
+            out[name] = pd.to_numeric(col.where(~col.isin(MISSING), None), errors="coerce").astype("float64")
+        elif not values:
+            # nothing to infer from: a nullable string column, so later batches
+            # with text still fit the schema (numeric columns come as float64
+            # or are declared through dtypes)
+            out[name] = pd.Series(pd.NA, index=col.index, dtype="string")
+        else:
+            out[name] = col.map(lambda v: None if v is None or (isinstance(v, str) and v in MISSING)
+                                else (v.isoformat() if isinstance(v, (date, datetime)) else str(v)))
+    return out
+
+
+def _conform(df, schema, pa):
+    # a later batch inferred differently from the first (text where the first
+    # batch had none, or the reverse) is cast to the schema's column types
+    out = df
+    for field in schema:
+        col = df[field.name]
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            if not (col.dtype == object or pd.api.types.is_string_dtype(col)):
+                out = out if out is not df else df.copy()
+                out[field.name] = col.astype("string")
+        elif pa.types.is_floating(field.type) and not pd.api.types.is_float_dtype(col):
+            out = out if out is not df else df.copy()
+            out[field.name] = pd.to_numeric(col, errors="coerce").astype("float64")
+    return out
+
+
+def output_path(name, fmt=OUTPUT_FORMAT, out_dir=None, partition=PARTITION, run_date=None):
+    out_dir = out_dir or OUTPUT_DIR
+    ext = FORMATS[fmt]
+    if partition == "run_date":
+        run_date = run_date or date.today().isoformat()
+        stamp = datetime.now().strftime("%H%M%S")
+        return os.path.join(out_dir, name, f"run_date={run_date}", f"part-{stamp}-{os.getpid()}{ext}")
+    if partition:
+        raise ValueError(f"Unknown partitioning: {partition!r} (expected 'run_date')")
+    return os.path.join(out_dir, name + ext)
+
+
+class ResultSink:
+
+    def __init__(self, name, fmt=None, out_dir=None, partition=PARTITION, dtypes=None,
+                 batch_rows=BATCH_ROWS, run_date=None):
+        fmt = (fmt or OUTPUT_FORMAT).lower()
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown output format: {fmt!r} (expected one of {sorted(FORMATS)})")
+        self._pa = _pyarrow(fmt) if fmt != "csv" else None
+        self.name = name
+        self.fmt = fmt
+        self.path = output_path(name, fmt, out_dir, partition, run_date)
+        self.dtypes = dtypes
+        self.batch_rows = batch_rows
+        self.rows_written = 0
+        self._pending = []
+        self._pending_rows = 0
+        self._writer = None
+        self._schema = None
+        self._columns = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def write(self, batch):
+        # batch: DataFrame, list of row dicts, or a single row dict
+        if isinstance(batch, dict):
+            batch = [batch]
+        df = batch if isinstance(batch, pd.DataFrame) else pd.DataFrame(list(batch))
+        if df.empty:
+            return
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"Sink {self.name!r} is closed")
+            self._pending.append(df)
+            self._pending_rows += len(df)
+            if self._pending_rows >= self.batch_rows:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        df = pd.concat(self._pending, ignore_index=True) if len(self._pending) > 1 else self._pending[0]
+        self._pending, self._pending_rows = [], 0
+        if self._columns is None:
+            self._columns = list(df.columns)
+        df = df.reindex(columns=self._columns)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="a" if self.rows_written else "w", header=not self.rows_written, index=False)
+        else:
+            pa = self._pa
+            df = typed_frame(df, self.dtypes)
+            if self._schema is None:
+                self._schema = pa.Schema.from_pandas(df, preserve_index=False)
+            else:
+                df = _conform(df, self._schema, pa)
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                if self.fmt == "parquet":
+                    self._writer = pa.parquet.ParquetWriter(self.path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.path, self._schema)
+            self._writer.write_table(table)
+        self.rows_written += len(df)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return self.path
+            self._flush()
+            if self._writer is not None:
+                self._writer.close()
+            self._closed = True
+        return self.path
+
+
+def write_frame(df, name, fmt=None, out_dir=None, partition=PARTITION, dtypes=None):
+    with ResultSink(name, fmt, out_dir, partition, dtypes) as sink:
+        sink.write(df)
+    if sink.rows_written == 0 and sink.fmt == "csv":
+        # keep df_to_csv behaviour for empty frames: a header-only file
+        os.makedirs(os.path.dirname(sink.path) or ".", exist_ok=True)
+        df.to_csv(sink.path, index=False)
+    return sink.path
+
+
+def _read_file(path, fmt):
+    if fmt == "csv":
+        return pd.read_csv(path)
+    pa = _pyarrow(fmt)
+    if fmt == "parquet":
+        return pa.parquet.read_table(path).to_pandas()
+    with pa.ipc.open_file(path) as reader:
+        return reader.read_pandas()
+
+
+def read_output(name, fmt=None, out_dir=None):
+    # reads <name>.<ext>, or every part of a run_date-partitioned output
+    fmt = (fmt or OUTPUT_FORMAT).lower()
+    path = os.path.join(out_dir or OUTPUT_DIR, name)
+    if not os.path.isdir(path):
+        return _read_file(path + FORMATS[fmt], fmt)
+    parts = []
+    for root, _, files in sorted(os.walk(path)):
+        for f in sorted(files):
+            if f.endswith(FORMATS[fmt]):
+                df = _read_file(os.path.join(root, f), fmt)
+                df.insert(0, "run_date", os.path.basename(root).split("=", 1)[-1])
+                parts.append(df)
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
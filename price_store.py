@@ -0,0 +1,156 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import data_source
+from instrumentation import span
+
+# On-disk daily price store for histories too large to hold as DataFrames
+# (decades x thousands of symbols). One directory:
+#
+#   index.json      symbols, fields, calendar
+#   dates.npy       datetime64[D] (D,)      the calendar, ascending
+#   present.npy     bool          (S, D)    symbol had a bar on that date
+#   <field>.npy     float64       (S, D)    NaN where absent
+#
+# Arrays are plain .npy files opened with mmap_mode="r", so reading a block of
+# symbols x dates only pages in that block. Rows are symbols, so one symbol's
+# history over a date range is contiguous on disk.
+#
+#   python price_store.py build prices/ --start 2000-01-01 --end 2024-12-31
+#   python price_store.py build prices/ --symbols SPY,QQQ --adjustment splits_and_dividends
+
+PRICE_FIELDS = ("close", "adj_close")
+
+
+def _fetch(symbol, start, end, **params):
+    res = data_source.obb.equity.price.historical(symbol=symbol, start_date=start, end_date=end,
+                                                   provider="fmp", **params)
+    return res.to_dataframe().reset_index()
+
+
+class PriceStore:
+
+    def __init__(self, path, mode="r"):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        self.symbols = list(self.index["symbols"])
+        self.fields = list(self.index["fields"])
+        self.symbol_index = {s: i for i, s in enumerate(self.symbols)}
+        self.dates = np.load(os.path.join(path, "dates.npy"))
+        self.present = np.load(os.path.join(path, "present.npy"), mmap_mode=mode)
+        self.values = {f: np.load(os.path.join(path, f + ".npy"), mmap_mode=mode) for f in self.fields}
+
+    @classmethod
+    def create(cls, path, symbols, start, end, fields=PRICE_FIELDS, calendar="B"):
+        # empty store (all absent) on a business-day ("B") or daily ("D") calendar
+        symbols = list(symbols)
+        dates = pd.date_range(start, end, freq=calendar).to_numpy(dtype="datetime64[D]")
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "dates.npy"), dates)
+        shape = (len(symbols), len(dates))
+        present = np.lib.format.open_memmap(os.path.join(path, "present.npy"), mode="w+", dtype=np.bool_, shape=shape)
+        present[:] = False
+        present.flush()
+        for field in fields:
+            values = np.lib.format.open_memmap(os.path.join(path, field + ".npy"), mode="w+", dtype=np.float64, shape=shape)
+            values[:] = np.nan
+            values.flush()
+        del present, values
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump({"symbols": symbols, "fields": list(fields), "calendar": calendar}, f)
+        return cls(path, mode="r+")
+
+    @classmethod
+    def build(cls, path, symbols, start, end, fields=PRICE_FIELDS, calendar="B", fetch=_fetch, **params):
+        # one obb call per symbol; only that symbol's frame is in memory at a time
+        store = cls.create(path, symbols, start, end, fields, calendar)
+        for symbol in store.symbols:
+            with span("fetch", symbol):
+                df = fetch(symbol, start, end, **params)
+            with span("transform", symbol) as sp:
+                store.put(symbol, df)
+                sp.count("rows", len(df))
+        store.flush()
+        return cls(path)
+
+    def put(self, symbol, df):
+        # df: one symbol's bars with a date column and the store's fields
+        i = self.symbol_index[symbol]
+        dates = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[D]")
+        pos = np.searchsorted(self.dates, dates)
+        off_calendar = (pos >= len(self.dates)) | (self.dates[np.minimum(pos, len(self.dates) - 1)] != dates)
+        if off_calendar.any():
+            raise ValueError(f"{symbol}: {int(off_calendar.sum())} bars fall outside the store's "
+                             f"{self.index['calendar']!r} calendar, e.g. {dates[off_calendar][0]}")
+        self.present[i, pos] = True
+        for field in self.fields:
+            if field in df.columns:
+                self.values[field][i, pos] = pd.to_numeric(df[field], errors="coerce").to_numpy(dtype=np.float64)
+
+    def flush(self):
+        self.present.flush()
+        for values in self.values.values():
+            values.flush()
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def date_range(self, start=None, end=None):
+        # [lo, hi) column slice of the calendar between start and end, inclusive
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start).date(), "D")))
+        hi = len(self.dates) if end is None else \
+            int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end).date(), "D"), side="right"))
+        return lo, hi
+
+    def block(self, field, rows, d0, d1):
+        # in-memory copy of field[rows, d0:d1]; rows is a slice or index array
+        return np.array(self.values[field][rows, d0:d1])
+
+    def block_present(self, rows, d0, d1):
+        return np.array(self.present[rows, d0:d1])
+
+    def frame(self, symbol, fields=None, start=None, end=None):
+        # one symbol's bars shaped like the fetch output
+        i = self.symbol_index[symbol]
+        d0, d1 = self.date_range(start, end)
+        mask = self.present[i, d0:d1]
+        df = pd.DataFrame({"date": pd.DatetimeIndex(self.dates[d0:d1][mask])})
+        for field in fields or self.fields:
+            df[field] = self.values[field][i, d0:d1][mask]
+        return df
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build an on-disk price store from obb price histories")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("path")
+    build.add_argument("--symbols", help="comma-separated symbols (default: the local provider's universe)")
+    build.add_argument("--extra-symbols", default="^GSPC", help="added to the symbols, e.g. the CAPM market index")
+    build.add_argument("--start", default="2000-01-01")
+    build.add_argument("--end", default="2024-12-31")
+    build.add_argument("--fields", default=",".join(PRICE_FIELDS))
+    build.add_argument("--calendar", default="B", choices=["B", "D"])
+    build.add_argument("--adjustment", help="passed through to obb.equity.price.historical")
+    args = parser.parse_args(argv)
+
+    if args.symbols:
+        symbols = [s for s in args.symbols.split(",") if s]
+    elif hasattr(data_source.obb, "universe"):
+        symbols = data_source.obb.universe()
+    else:
+        parser.error("--symbols is required unless FA_DATA_SOURCE=local")
+    symbols += [s for s in args.extra_symbols.split(",") if s and s not in symbols]
+    params = {"adjustment": args.adjustment} if args.adjustment else {}
+    store = PriceStore.build(args.path, symbols, args.start, args.end, args.fields.split(","), args.calendar, **params)
+    print(f"Built {args.path}: {len(store.symbols)} symbols x {len(store.dates)} dates")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import capm_risk_adjusted_performance as capm
+import data_source
+from chunked_pipeline import batches, chunk_returns, plan
+from instrumentation import span
+from price_store import PriceStore
+
+# Prefix-sum index over a price store for ad-hoc range questions ("SPY's log
+# return and realized vol from 2020-02-19 to 2020-03-23", "NVDA's beta over
+# this window"). Built once, it answers any date range in O(1) per query, and
+# a whole batch of (ticker, start, end) queries in a few vectorized gathers.
+#
+#   index.json    symbols, market, fields, calendar
+#   dates.npy     datetime64[D] (D,)    the store calendar
+#   <sum>.npy     float64  (S, D + 1)   running sums, column 0 is 0
+#
+#     n, r, rr                count, sum and sum of squares of the daily log
+#                             returns of `close` (etf_volatility_regime_analysis)
+#     m, x, y, xx, yy, xy     over the dates where both the ticker and the
+#                             market have an `adj_close` return: count, sums,
+#                             sums of squares and cross-products of the daily
+#                             simple returns (capm_risk_adjusted_performance)
+#
+# Returns are taken over each ticker's own bars and dated on the bar they end
+# on, so a query over [start, end] uses the returns dated start..end: the log
+# return is log(close on end / last close before start). A range's sums are
+# P[:, hi] - P[:, lo], where lo and hi count the calendar dates before start
+# and up to end. On the store's business-day or daily calendar those counts
+# come from np.busday_count or plain day arithmetic, with no search.
+#
+#   variance   ddof=1 of the log returns, as the ETF script's rolling std
+#   beta       cov(ddof=1) / var(market, ddof=0), as the CAPM script
+#
+#   python range_index.py build prices/ idx/
+#   python range_index.py query idx/ --symbols SPY,QQQ --start 2020-02-19 --end 2020-03-23
+#   python range_index.py query idx/ --ranges ranges.csv     # Ticker,Start,End columns
+
+VOL_SUMS = ("n", "r", "rr")
+BETA_SUMS = ("m", "x", "y", "xx", "yy", "xy")
+SUMS = VOL_SUMS + BETA_SUMS
+
+# working bytes per symbol x date cell of a build chunk: two price blocks,
+# presence, the compacted copies and returns, and the nine running sums
+BUILD_CELL_BYTES = 8 * 24
+
+COLUMNS = ["Ticker", "Start", "End", "Returns", "LogReturn", "Variance", "Vol", "AnnualizedVol",
+           "MarketObs", "Covariance", "MarketVariance", "Beta", "Correlation"]
+
+
+def build(store, out_dir, tickers=None, market=capm.market_ticker, vol_field="close", beta_field="adj_close",
+          budget_mb=None):
+    tickers = list(dict.fromkeys(tickers or store.symbols))
+    if market not in store.symbol_index:
+        raise KeyError(f"market {market!r} is not in the store")
+    rows_idx = np.array([store.symbol_index[t] for t in tickers], dtype=np.intp)
+    m_idx = np.array([store.symbol_index[market]], dtype=np.intp)
+    n_dates = len(store.dates)
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "dates.npy"), store.dates)
+    out = {name: np.lib.format.open_memmap(os.path.join(out_dir, name + ".npy"), mode="w+", dtype=np.float64,
+                                           shape=(len(tickers), n_dates + 1)) for name in SUMS}
+    for prefix in out.values():
+        prefix[:, 0] = 0.0
+    batch, chunk = plan(len(tickers), n_dates, BUILD_CELL_BYTES, 8 * (len(SUMS) + 2), budget_mb)
+
+    for i0, i1 in batches(len(tickers), batch):
+        rows = rows_idx[i0:i1]
+        last = np.full(len(rows), np.nan)
+        last_simple = np.full(len(rows), np.nan)
+        last_market = np.full(1, np.nan)
+        carry = {name: np.zeros(len(rows)) for name in SUMS}
+        for c0, c1 in batches(n_dates, chunk):
+            with span("fetch", name="price_store"):
+                present = store.block_present(rows, c0, c1)
+                closes = store.block(vol_field, rows, c0, c1)
+                prices = store.block(beta_field, rows, c0, c1)
+                m_prices = store.block(beta_field, m_idx, c0, c1)
+                m_present = store.block_present(m_idx, c0, c1)
+            with span("compute", name="range_index"):
+                logret, last = chunk_returns(closes, present, last, log=True)
+                stock, last_simple = chunk_returns(prices, present, last_simple)
+                market_ret, last_market = chunk_returns(m_prices, m_present, last_market)
+                market_ret = np.broadcast_to(market_ret, stock.shape)
+
+                # inner merge on date, then dropna on both returns
+                valid = np.isfinite(logret)
+                joint = np.isfinite(stock) & np.isfinite(market_ret)
+                r = np.where(valid, logret, 0.0)
+                x = np.where(joint, stock, 0.0)
+                y = np.where(joint, market_ret, 0.0)
+                terms = {"n": valid, "r": r, "rr": r * r,
+                         "m": joint, "x": x, "y": y, "xx": x * x, "yy": y * y, "xy": x * y}
+                for name, term in terms.items():
+                    running = np.cumsum(term, axis=1, dtype=np.float64) + carry[name][:, None]
+                    out[name][i0:i1, 1 + c0:1 + c1] = running
+                    carry[name] = running[:, -1]
+
+    for prefix in out.values():
+        prefix.flush()
+    index = {"symbols": tickers, "market": market, "vol_field": vol_field, "beta_field": beta_field,
+             "calendar": store.index.get("calendar"), "dates": n_dates}
+    with open(os.path.join(out_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+    return index
+
+
+class RangeIndex:
+
+    def __init__(self, path, mmap_mode="r"):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        self.symbols = list(self.index["symbols"])
+        self.symbol_index = {s: i for i, s in enumerate(self.symbols)}
+        self.calendar = self.index.get("calendar")
+        self.dates = np.load(os.path.join(path, "dates.npy"))
+        self.sums = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode) for name in SUMS}
+
+    def positions(self, dates, inclusive=False):
+        # number of calendar dates before each date (with inclusive, up to and
+        # including it), i.e. the date's column in the prefix arrays
+        dates = np.asarray(pd.to_datetime(dates).to_numpy(dtype="datetime64[D]"))
+        if inclusive:
+            dates = dates + np.timedelta64(1, "D")
+        if not len(self.dates):
+            return np.zeros(dates.shape, dtype=np.intp)
+        if self.calendar == "B":
+            pos = np.busday_count(self.dates[0], dates)
+        elif self.calendar == "D":
+            pos = (dates - self.dates[0]).astype(np.int64)
+        else:
+            pos = np.searchsorted(self.dates, dates)
+        return np.clip(pos, 0, len(self.dates)).astype(np.intp)
+
+    def range_sums(self, rows, lo, hi, names=SUMS):
+        # {name: sum over columns [lo, hi) for each (row, lo, hi)}
+        return {name: self.sums[name][rows, hi] - self.sums[name][rows, lo] for name in names}
+
+    def query(self, tickers, starts, ends):
+        # one row per (ticker, start, end); starts/ends broadcast against tickers
+        tickers = np.asarray(tickers, dtype=object)
+        starts = np.broadcast_to(np.asarray(starts, dtype=object), tickers.shape)
+        ends = np.broadcast_to(np.asarray(ends, dtype=object), tickers.shape)
+        missing = [t for t in dict.fromkeys(tickers) if t not in self.symbol_index]
+        if missing:
+            raise KeyError(f"not in the index: {', '.join(missing)}")
+        rows = np.array([self.symbol_index[t] for t in tickers], dtype=np.intp)
+        lo = self.positions(starts)
+        hi = np.maximum(self.positions(ends, inclusive=True), lo)
+
+        with span("compute", name="range_query"):
+            s = self.range_sums(rows, lo, hi)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                n, m = s["n"], s["m"]
+                variance = np.where(n > 1, np.maximum(s["rr"] - s["r"] * s["r"] / n, 0.0) / (n - 1), np.nan)
+                dx = np.maximum(s["xx"] - s["x"] * s["x"] / m, 0.0)
+                dy = np.maximum(s["yy"] - s["y"] * s["y"] / m, 0.0)
+                dxy = s["xy"] - s["x"] * s["y"] / m
+                enough = m > 1
+                covariance = np.where(enough, dxy / (m - 1), np.nan)
+                market_variance = np.where(enough, dy / m, np.nan)
+                beta = np.where(enough, covariance / market_variance, np.nan)
+                correlation = np.where(enough, dxy / np.sqrt(dx * dy), np.nan)
+            vol = np.sqrt(variance)
+
+        return pd.DataFrame({
+            "Ticker": tickers,
+            "Start": starts,
+            "End": ends,
+            "Returns": n.astype(np.int64),
+            "LogReturn": np.where(n > 0, s["r"], np.nan),
+            "Variance": variance,
+            "Vol": vol,
+            "AnnualizedVol": vol * np.sqrt(capm.trading_days_per_year),
+            "MarketObs": m.astype(np.int64),
+            "Covariance": covariance,
+            "MarketVariance": market_variance,
+            "Beta": beta,
+            "Correlation": correlation,
+        }, columns=COLUMNS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prefix-sum index for O(1) range return, vol and beta queries")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("store", help="directory written by price_store.py build")
+    b.add_argument("out_dir")
+    b.add_argument("--symbols", help="comma-separated subset of the store's symbols")
+    b.add_argument("--market", default=capm.market_ticker)
+    b.add_argument("--budget-mb", type=float, default=None, help="memory budget (default FA_MEMORY_BUDGET_MB)")
+    q = sub.add_parser("query")
+    q.add_argument("index_dir")
+    q.add_argument("--symbols", help="comma-separated symbols, each queried over --start/--end (default: all)")
+    q.add_argument("--start", default=capm.start_date)
+    q.add_argument("--end", default=capm.end_date)
+    q.add_argument("--ranges", help="CSV of queries with Ticker, Start and End columns")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        store = PriceStore(args.store)
+        symbols = [s for s in args.symbols.split(",") if s] if args.symbols else None
+        index = build(store, args.out_dir, symbols, args.market, budget_mb=args.budget_mb)
+        print(f"Saved {args.out_dir}: {len(index['symbols'])} symbols x {index['dates']} dates")
+        return
+
+    idx = RangeIndex(args.index_dir)
+    if args.ranges:
+        ranges = pd.read_csv(args.ranges, dtype=str)
+        out = idx.query(ranges["Ticker"].to_numpy(), ranges["Start"].to_numpy(), ranges["End"].to_numpy())
+    else:
+        symbols = [s for s in args.symbols.split(",") if s] if args.symbols else idx.symbols
+        out = idx.query(symbols, args.start, args.end)
+    print(out.to_string(index=False))
+    with span("output"):
+        data_source.save_output(out, "range_index")
+
+
+if __name__ == "__main__":
+    main()
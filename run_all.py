@@ -0,0 +1,226 @@
+import argparse
+import sys
+from functools import partial
+
+import data_source
+from dag import Graph
+from instrumentation import span
+from lazy_obb import SharedOBB
+from output_sink import ResultSink
+
+import Crypto_momentum_strategy as crypto
+import capm_risk_adjusted_performance as capm
+import etf_volatility_regime_analysis as etf
+import financial_distress_analysis as distress
+import financial_metrics_analysis as metrics
+import liquidity_leverage as liquidity
+import simple_altman_z_score_analysis as altman
+
+# Runs every analysis as one task graph: fetch nodes per symbol feed compute
+# nodes, which feed one output node per analysis. All scripts share one
+# SharedOBB, so an identical obb call made by two analyses goes out once, and
+# the graph runs on a thread pool so fetches overlap with computations.
+#
+# With --stream, each row goes to its analysis' ResultSink as soon as its
+# compute node finishes (completion order, unsorted), so partial results are
+# on disk while the rest of the graph runs.
+#
+#   python run_all.py --workers 16
+#   python run_all.py --only capm,liquidity
+#   FA_OUTPUT_FORMAT=parquet python run_all.py --stream
+
+MODULES = {
+    "etf": etf,
+    "capm": capm,
+    "crypto": crypto,
+    "altman": altman,
+    "liquidity": liquidity,
+    "metrics": metrics,
+    "distress": distress,
+}
+
+
+def _compute(stage_ticker, fn, *args):
+    with span("compute", stage_ticker):
+        return fn(*args)
+
+
+def _output(module, *rows):
+    with span("compute", name="sort_results"):
+        rows = [r for r in rows if r is not None]
+        frame = module.results_frame(rows)
+        if hasattr(module, "sort_results"):
+            frame = module.sort_results(frame)
+    with span("output"):
+        data_source.save_output(frame, module.__name__, getattr(module, "COLUMN_DTYPES", None))
+    return frame
+
+
+def _gate(module, symbols, *frames):
+    # one data-quality node per analysis, between its fetches and computes; a
+    # failed fetch arrives as None and is left out, so a price compute node
+    # fails and a fundamentals one fetches again and reports the error
+    return module.gate({s: f for s, f in zip(symbols, frames) if f is not None})
+
+
+def _streamed(fn, module, sink):
+    def run(*args):
+        row = fn(*args)
+        sink.write(module.results_frame([row]))
+        return row
+    return run
+
+
+def _close(sink, *rows):
+    with span("output"):
+        path = sink.close()
+    print(f"Saved {path}")
+    return path
+
+
+def stream_outputs(graph, names):
+    # compute:<analysis>:<symbol> nodes write to the analysis' sink; the
+    # output node only closes it
+    sinks = {}
+    for name in names:
+        module = MODULES[name]
+        sink = sinks[name] = ResultSink(module.__name__, dtypes=getattr(module, "COLUMN_DTYPES", None))
+        for task in graph.tasks.values():
+            if task.name.startswith(f"compute:{name}:"):
+                task.fn = _streamed(task.fn, module, sink)
+        graph.tasks[f"output:{name}"].fn = partial(_close, sink)
+    return sinks
+
+
+def add_etf(graph):
+    fetched = [graph.add(f"fetch:etf_prices:{sym}", partial(etf.fetch_prices, sym)) for sym in etf.TICKERS]
+    gated = graph.add("quality:etf", partial(_gate, etf, etf.TICKERS), fetched, allow_failed=True)
+    rows = [graph.add(f"compute:etf:{sym}",
+                      lambda frames, s=sym: _compute(s, etf.compute_vol_metrics, s, frames[s]), [gated])
+            for sym in etf.TICKERS]
+    return graph.add("output:etf", partial(_output, etf), rows, allow_failed=True)
+
+
+def add_capm(graph):
+    symbols = [capm.market_ticker] + capm.tickers
+    fetched = [graph.add(f"fetch:capm_prices:{sym}", partial(capm.fetch_prices, sym)) for sym in symbols]
+    gated = graph.add("quality:capm", partial(_gate, capm, symbols), fetched, allow_failed=True)
+    market = graph.add(f"transform:capm_returns:{capm.market_ticker}",
+                       lambda frames: capm.returns_frame(frames[capm.market_ticker].copy(), "market_return"), [gated])
+    rows = []
+    for ticker in capm.tickers:
+        rows.append(graph.add(f"compute:capm:{ticker}",
+                              lambda frames, market_data, t=ticker: _compute(
+                                  t, capm.compute_capm_row, t, capm.returns_frame(frames[t].copy(), "stock_return"),
+                                  market_data),
+                              [gated, market]))
+    return graph.add("output:capm", partial(_output, capm), rows, allow_failed=True)
+
+
+def add_crypto(graph):
+    fetched = [graph.add(f"fetch:crypto_prices:{sym}", partial(crypto.fetch_prices, sym)) for sym in crypto.CRYPTOS]
+    gated = graph.add("quality:crypto", partial(_gate, crypto, crypto.CRYPTOS), fetched, allow_failed=True)
+    rows = [graph.add(f"compute:crypto:{sym}",
+                      lambda frames, s=sym: _compute(s, crypto.backtest_momentum, s, frames[s]), [gated])
+            for sym in crypto.CRYPTOS]
+    return graph.add("output:crypto", partial(_output, crypto), rows, allow_failed=True)
+
+
+def add_altman(graph):
+    fetched = [graph.add(f"fetch:altman_statements:{ticker}", partial(altman.fetch_statements, ticker))
+               for ticker in altman.tickers]
+    gated = graph.add("quality:altman", partial(_gate, altman, altman.tickers), fetched, allow_failed=True)
+    rows = [graph.add(f"compute:altman:{ticker}",
+                      lambda statements, t=ticker: _compute(t, altman.altman_z_row, t,
+                                                            *altman.fy_statements(t, statements[t])),
+                      [gated])
+            for ticker in altman.tickers]
+    return graph.add("output:altman", partial(_output, altman), rows, allow_failed=True)
+
+
+def add_liquidity(graph):
+    # compute_one turns a failed fetch into an all-NaN "Error" row: the quality
+    # node leaves the symbol out and compute_one fetches it again (the retry
+    # is answered by SharedOBB)
+    fetched = [graph.add(f"fetch:liquidity_statements:{sym}", partial(liquidity.fetch_statements, sym))
+               for sym in liquidity.TICKERS]
+    gated = graph.add("quality:liquidity", partial(_gate, liquidity, liquidity.TICKERS), fetched, allow_failed=True)
+    rows = [graph.add(f"compute:liquidity:{sym}",
+                      lambda statements, s=sym: _compute(s, liquidity.compute_one, s, statements.get(s)), [gated])
+            for sym in liquidity.TICKERS]
+    return graph.add("output:liquidity", partial(_output, liquidity), rows, allow_failed=True)
+
+
+def add_metrics(graph):
+    fetched = graph.add(f"fetch:metrics_inputs:{metrics.ticker}", partial(metrics.fetch_inputs, metrics.ticker))
+    gated = graph.add("quality:metrics", partial(_gate, metrics, [metrics.ticker]), [fetched], allow_failed=True)
+    row = graph.add(f"compute:metrics:{metrics.ticker}",
+                    lambda inputs, t=metrics.ticker: _compute(t, metrics.calculate_financial_metrics, t, inputs.get(t)),
+                    [gated])
+    return graph.add("output:metrics", partial(_output, metrics), [row], allow_failed=True)
+
+
+def add_distress(graph):
+    fetched = graph.add(f"fetch:distress_statements:{distress.ticker}", partial(distress.fetch_statements, distress.ticker))
+    gated = graph.add("quality:distress", partial(_gate, distress, [distress.ticker]), [fetched], allow_failed=True)
+    row = graph.add(f"compute:distress:{distress.ticker}",
+                    lambda statements, t=distress.ticker: _compute(t, distress.calculate_distress_score, t,
+                                                                   statements.get(t)),
+                    [gated])
+    return graph.add("output:distress", partial(_output, distress), [row], allow_failed=True)
+
+
+ANALYSES = {
+    "etf": add_etf,
+    "capm": add_capm,
+    "crypto": add_crypto,
+    "altman": add_altman,
+    "liquidity": add_liquidity,
+    "metrics": add_metrics,
+    "distress": add_distress,
+}
+
+
+def build_graph(names=None):
+    graph = Graph()
+    for name in names or ANALYSES:
+        ANALYSES[name](graph)
+    return graph
+
+
+def run(names=None, workers=8, stream=False):
+    shared = SharedOBB(data_source.obb)
+    for module in MODULES.values():
+        module.obb = shared
+
+    names = list(names or ANALYSES)
+    graph = build_graph(names)
+    if stream:
+        stream_outputs(graph, names)
+    results, errors, timings = graph.run(workers)
+
+    print(f"Ran {len(graph)} tasks on {workers} workers: {len(errors)} failed, "
+          f"{shared.requests} obb calls, {shared.unique_calls} fetched")
+    for name, error in errors.items():
+        print(f" {name}: {type(error).__name__}: {error}", file=sys.stderr)
+    outputs = {name.split(":", 1)[1]: frame for name, frame in results.items() if name.startswith("output:")}
+    return outputs, errors, timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run all analyses as one task graph")
+    parser.add_argument("--only", default=",".join(ANALYSES), help="comma-separated subset of: " + ", ".join(ANALYSES))
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--stream", action="store_true", help="write rows as they finish instead of one sorted table")
+    args = parser.parse_args(argv)
+
+    names = [n for n in args.only.split(",") if n]
+    unknown = set(names) - set(ANALYSES)
+    if unknown:
+        parser.error(f"unknown analyses: {sorted(unknown)}")
+    outputs, errors, _ = run(names, args.workers, args.stream)
+    return 1 if any(name.startswith("output:") for name in errors) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import argparse
+import heapq
+import math
+
+import numpy as np
+
+import data_source
+import shard
+from instrumentation import span
+
+# Top-K screens over a universe. Rows stream in batch by batch from the
+# analysis (shard.py's per-analysis runners). A bounded heap keeps only the K
+# best rows, so the full result table is never built or sorted: O(n log K)
+# time and O(K + batch) memory.
+#
+# Each screen orders rows by a key that matches the script's own sort,
+# with the row's position in the symbol list as the last key. Ties are then
+# broken the way pandas' stable sorts break them. The K rows equal the
+# first K rows of the full table sorted the same way.
+#
+#   distress   lowest Distress Score (most distressed) first
+#   altman     lowest Z-score first, on the 2-decimal value the table shows
+#   capm       sort_results order: performance category, alpha desc, ticker
+#   liquidity  sort_results order: health, efficiency, ROE desc (missing last)
+#
+#   python screener.py distress -k 50 --symbols-file universe.txt
+#   FA_DATA_SOURCE=local FA_LOCAL_SYMBOLS=5000 python screener.py capm -k 50 --universe
+
+BATCH = 256
+
+
+def _missing(x):
+    return x is None or (isinstance(x, float) and math.isnan(x))
+
+
+def _ascending(x):
+    # missing values sort last, as in pandas
+    return (True, 0.0) if _missing(x) else (False, float(x))
+
+
+def _descending(x):
+    return (True, 0.0) if _missing(x) else (False, -float(x))
+
+
+def _distress_key(row):
+    return _ascending(row["Distress Score"])
+
+
+def _altman_key(row):
+    # results_frame rounds to 2 decimals before the table is sorted
+    z = row["Z-score"]
+    return _ascending(None if _missing(z) else np.round(z, 2))
+
+
+def _capm_key(row):
+    import capm_risk_adjusted_performance as capm
+
+    return (capm.category_order.get(row["performance_category"], math.inf),
+            *_descending(row["alpha"]), row["ticker"])
+
+
+def _liquidity_key(row):
+    import liquidity_leverage as liquidity
+
+    return (liquidity.health_order.get(row["Financial Health"], math.inf),
+            liquidity.efficiency_order.get(row["Efficiency Category"], math.inf),
+            *_descending(row["ROE (%)"]))
+
+
+SCREENS = {
+    "distress": _distress_key,
+    "altman": _altman_key,
+    "capm": _capm_key,
+    "liquidity": _liquidity_key,
+}
+
+
+class _Entry:
+    # heap entry ordered so the worst kept row sits at the top
+    __slots__ = ("rank", "row")
+
+    def __init__(self, rank, row):
+        self.rank = rank
+        self.row = row
+
+    def __lt__(self, other):
+        return self.rank > other.rank
+
+
+class TopK:
+    # the k rows with the smallest key(row), ties going to the row pushed first
+
+    def __init__(self, k, key):
+        self.k = k
+        self.key = key
+        self.heap = []
+        self.seen = 0
+
+    def push(self, row, position=None):
+        rank = (*self.key(row), self.seen if position is None else position)
+        self.seen += 1
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, _Entry(rank, row))
+        elif rank < self.heap[0].rank:
+            heapq.heapreplace(self.heap, _Entry(rank, row))
+
+    def rows(self):
+        return [e.row for e in sorted(self.heap, key=lambda e: e.rank)]
+
+
+def screen(analysis, symbols, k, batch=BATCH):
+    # (module, top-k results table)
+    top = TopK(k, SCREENS[analysis])
+    module, failed = None, []
+    for i0 in range(0, len(symbols), batch):
+        module, rows, bad = shard.compute_rows(analysis, symbols[i0:i0 + batch])
+        failed += bad
+        with span("compute", name="screen"):
+            for j, row in enumerate(rows):
+                if row is not None:
+                    top.push(row, i0 + j)
+    if failed:
+        print(f"{len(failed)} symbols failed: {', '.join(failed)}")
+    if module is None:
+        import importlib
+        module = importlib.import_module(shard.ANALYSES[analysis][0])
+    return module, module.results_frame(top.rows()).reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Top-K screens over a symbol universe")
+    parser.add_argument("analysis", choices=list(SCREENS))
+    parser.add_argument("-k", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=BATCH, help="symbols computed per batch")
+    parser.add_argument("--symbols", help="comma-separated symbols (default: the script's own list)")
+    parser.add_argument("--symbols-file", help="one symbol per line")
+    parser.add_argument("--universe", action="store_true", help="the local provider's whole universe")
+    args = parser.parse_args(argv)
+
+    symbols = list(dict.fromkeys(shard.symbols_from_args(args, parser)))
+    module, out = screen(args.analysis, symbols, args.k, args.batch)
+    print(out.to_string(index=False))
+    with span("output"):
+        data_source.save_output(out, f"{module.__name__}_top{args.k}", getattr(module, "COLUMN_DTYPES", None))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import zlib
+
+import numpy as np
+
+import data_quality
+import data_source
+from instrumentation import span
+
+# Sharded runs of the per-symbol analyses. Symbols go to shard
+# crc32(symbol) % K, so every node computes the same split from the same
+# symbol list without talking to the others. Each shard runs on its own (on
+# another machine, or as a local process standing in for one) and writes one
+# partial file:
+#
+#   <dir>/<script>.shard-<i>-of-<K>.json
+#       {"analysis", "shard", "shards", "symbols": hash of the full list,
+#        "params", "rows": [[position in the full list, row], ...], "failed"}
+#
+# A partial is written to a temporary name and renamed when the shard is done,
+# so a partial that exists is complete. The merge step checks that all K
+# partials are there and come from the same symbol list and parameters. It
+# puts the rows back in symbol-list order and builds the table with the
+# script's own results_frame and sort_results. The merged file is the one a
+# single run over the whole list writes.
+#
+#   python shard.py run liquidity --shard 3/8 --symbols-file universe.txt --dir parts/
+#   python shard.py merge liquidity --shards 8 --symbols-file universe.txt --dir parts/
+#   FA_DATA_SOURCE=local python shard.py local capm --shards 4 --dir parts/   # run + merge
+
+
+def shard_of(symbol, shards):
+    return zlib.crc32(symbol.encode()) % shards
+
+
+def symbols_key(symbols):
+    return hashlib.sha256("\n".join(symbols).encode()).hexdigest()[:16]
+
+
+def _json_default(x):
+    if isinstance(x, np.generic):
+        return x.item()
+    return str(x)
+
+
+def _params(module):
+    params = {"quality": data_quality.MODE, **data_source.source_params()}
+    params.update(module.run_params() if hasattr(module, "run_params") else {})
+    return params
+
+
+# ---- per-analysis runners: rows for a list of symbols -------------------------
+
+def _etf(symbols):
+    import etf_volatility_regime_analysis as etf
+
+    frames = etf.gate({s: etf.fetch_prices(s) for s in symbols})
+    rows = []
+    for s in symbols:
+        with span("compute", s):
+            rows.append(etf.compute_vol_metrics(s, frames[s]))
+    return etf, rows
+
+
+def _capm(symbols):
+    import capm_risk_adjusted_performance as capm
+
+    frames = capm.gate({s: capm.fetch_prices(s) for s in [capm.market_ticker] + symbols})
+    market = capm.returns_frame(frames[capm.market_ticker], "market_return")
+    rows = []
+    for s in symbols:
+        with span("compute", s):
+            rows.append(capm.compute_capm_row(s, capm.returns_frame(frames[s], "stock_return"), market))
+    return capm, rows
+
+
+def _crypto(symbols):
+    import Crypto_momentum_strategy as crypto
+
+    frames = crypto.gate({s: crypto.fetch_prices(s) for s in symbols})
+    rows = []
+    for s in symbols:
+        with span("compute", s):
+            rows.append(crypto.backtest_momentum(s, frames[s]))
+    return crypto, rows
+
+
+def _altman(symbols):
+    import simple_altman_z_score_analysis as altman
+
+    fetched = altman.gate({s: altman.fetch_statements(s) for s in symbols})
+    rows = []
+    for s in symbols:
+        statements = altman.fy_statements(s, fetched[s])
+        with span("compute", s):
+            rows.append(altman.altman_z_row(s, *statements))
+    return altman, rows
+
+
+def _liquidity(symbols):
+    import liquidity_leverage as liquidity
+
+    # the fundamentals scripts turn a failed fetch into an error row, so a
+    # symbol whose fetch fails is left to its compute call rather than retried
+    statements = liquidity.gate(data_quality.fetch_all(liquidity.fetch_statements, symbols))
+    rows = []
+    for s in symbols:
+        with span("compute", s):
+            rows.append(liquidity.compute_one(s, statements.get(s)))
+    return liquidity, rows
+
+
+def _metrics(symbols):
+    import financial_metrics_analysis as metrics
+
+    inputs = metrics.gate(data_quality.fetch_all(metrics.fetch_inputs, symbols))
+    rows = []
+    for s in symbols:
+        with span("compute", s):
+            rows.append(metrics.calculate_financial_metrics(s, inputs.get(s)))
+    return metrics, rows
+
+
+def _distress(symbols):
+    import financial_distress_analysis as distress
+
+    statements = distress.gate(data_quality.fetch_all(distress.fetch_statements, symbols))
+    rows = []
+    for s in symbols:
+        with span("compute", s):
+            rows.append(distress.calculate_distress_score(s, statements.get(s)))
+    return distress, rows
+
+
+ANALYSES = {
+    "etf": ("etf_volatility_regime_analysis", "TICKERS", _etf),
+    "capm": ("capm_risk_adjusted_performance", "tickers", _capm),
+    "crypto": ("Crypto_momentum_strategy", "CRYPTOS", _crypto),
+    "altman": ("simple_altman_z_score_analysis", "tickers", _altman),
+    "liquidity": ("liquidity_leverage", "TICKERS", _liquidity),
+    "metrics": ("financial_metrics_analysis", "ticker", _metrics),
+    "distress": ("financial_distress_analysis", "ticker", _distress),
+}
+
+
+def default_symbols(analysis):
+    import importlib
+
+    module_name, attr, _ = ANALYSES[analysis]
+    value = getattr(importlib.import_module(module_name), attr)
+    return [value] if isinstance(value, str) else list(value)
+
+
+def partial_path(directory, analysis, shard, shards):
+    return os.path.join(directory, f"{ANALYSES[analysis][0]}.shard-{shard}-of-{shards}.json")
+
+
+def compute_rows(analysis, symbols):
+    # (module, rows, failed symbols) for a list of symbols; rows are None
+    # where a symbol failed or the script produced no row
+    runner = ANALYSES[analysis][2]
+    try:
+        module, rows = runner(symbols)
+        return module, rows, []
+    except Exception as e:
+        if len(symbols) == 1:
+            print(f" {symbols[0]}: {type(e).__name__}: {e}")
+            import importlib
+            return importlib.import_module(ANALYSES[analysis][0]), [None], list(symbols)
+        # the price analyses fetch the whole list first; the symbols are
+        # retried one at a time to isolate the failure
+        print(f"{type(e).__name__}: {e}; retrying symbol by symbol")
+    module, rows, failed = None, [], []
+    for s in symbols:
+        module, (row,), bad = compute_rows(analysis, [s])
+        rows.append(row)
+        failed += bad
+    return module, rows, failed
+
+
+def run_shard(analysis, symbols, shard, shards, directory):
+    # computes this shard's symbols and writes its partial file
+    symbols = list(dict.fromkeys(symbols))
+    mine = [(k, s) for k, s in enumerate(symbols) if shard_of(s, shards) == shard]
+    print(f"Shard {shard}/{shards}: {len(mine)} of {len(symbols)} symbols")
+    rows, failed = [], []
+    if mine:
+        module, computed, failed = compute_rows(analysis, [s for _, s in mine])
+        rows = [[k, row] for (k, _), row in zip(mine, computed) if row is not None]
+    else:
+        import importlib
+        module = importlib.import_module(ANALYSES[analysis][0])
+
+    os.makedirs(directory, exist_ok=True)
+    path = partial_path(directory, analysis, shard, shards)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"analysis": analysis, "shard": shard, "shards": shards, "symbols": symbols_key(symbols),
+                   "params": _params(module), "rows": rows, "failed": failed}, f, default=_json_default)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def merge(analysis, symbols, shards, directory):
+    # the merged results table, in the order a single run would produce
+    import importlib
+
+    module = importlib.import_module(ANALYSES[analysis][0])
+    key = symbols_key(list(dict.fromkeys(symbols)))
+    params = json.loads(json.dumps(_params(module), default=_json_default))
+    missing = [i for i in range(shards) if not os.path.exists(partial_path(directory, analysis, i, shards))]
+    if missing:
+        raise FileNotFoundError(f"{analysis}: shards {missing} of {shards} have not written their partials")
+
+    rows, failed = [], []
+    for i in range(shards):
+        with open(partial_path(directory, analysis, i, shards)) as f:
+            part = json.load(f)
+        if part["symbols"] != key:
+            raise ValueError(f"{analysis}: shard {i} ran over a different symbol list")
+        if part["params"] != params:
+            raise ValueError(f"{analysis}: shard {i} ran with different parameters: {part['params']}")
+        rows += part["rows"]
+        failed += part["failed"]
+    if failed:
+        print(f"{len(failed)} symbols failed: {', '.join(failed)}")
+
+    rows = [row for _, row in sorted(rows, key=lambda r: r[0])]
+    with span("compute", name="sort_results"):
+        frame = module.results_frame(rows)
+        if hasattr(module, "sort_results"):
+            frame = module.sort_results(frame)
+    return module, frame, failed
+
+
+def symbols_from_args(args, parser):
+    if args.symbols:
+        return [s for s in args.symbols.split(",") if s]
+    if args.symbols_file:
+        with open(args.symbols_file) as f:
+            return [line.strip() for line in f if line.strip()]
+    if args.universe:
+        if not hasattr(data_source.obb, "universe"):
+            parser.error("--universe needs FA_DATA_SOURCE=local")
+        return data_source.obb.universe()
+    return default_symbols(args.analysis)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded runs of the per-symbol analyses")
+    parser.add_argument("command", choices=["run", "merge", "local"])
+    parser.add_argument("analysis", choices=list(ANALYSES))
+    parser.add_argument("--shard", help="i/K: run shard i of K (command run)")
+    parser.add_argument("--shards", type=int, help="K (commands merge and local)")
+    parser.add_argument("--dir", default="shards", help="directory of partial files")
+    parser.add_argument("--symbols", help="comma-separated symbols (default: the script's own list)")
+    parser.add_argument("--symbols-file", help="one symbol per line")
+    parser.add_argument("--universe", action="store_true", help="the local provider's whole universe")
+    args = parser.parse_args(argv)
+    symbols = symbols_from_args(args, parser)
+
+    if args.command == "run":
+        if not args.shard:
+            parser.error("run needs --shard i/K")
+        shard, shards = (int(x) for x in args.shard.split("/"))
+        print(f"Saved {run_shard(args.analysis, symbols, shard, shards, args.dir)}")
+        return 0
+
+    if not args.shards:
+        parser.error(f"{args.command} needs --shards K")
+    if args.command == "local":
+        # one process per shard, each standing in for a separate node
+        forward = ["--dir", args.dir]
+        for flag in ("symbols", "symbols_file"):
+            if getattr(args, flag):
+                forward += ["--" + flag.replace("_", "-"), getattr(args, flag)]
+        if args.universe:
+            forward.append("--universe")
+        procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "run", args.analysis,
+                                   "--shard", f"{i}/{args.shards}", *forward])
+                 for i in range(args.shards)]
+        codes = [p.wait() for p in procs]
+        if any(codes):
+            print(f"Shards failed: {[i for i, c in enumerate(codes) if c]}", file=sys.stderr)
+            return 1
+
+    module, frame, failed = merge(args.analysis, symbols, args.shards, args.dir)
+    with span("output"):
+        data_source.save_output(frame, module.__name__, getattr(module, "COLUMN_DTYPES", None))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,171 @@
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Price panel in one shared-memory segment, so process-pool workers read the
+# whole universe without each task pickling its DataFrame. Layout:
+#
+#   values   float64 (F, S, D)   fields x symbols x dates, NaN where absent
+#   present  bool    (S, D)      symbol had a record on that date
+#
+# The owner (create) is the only process that unlinks the segment: on close(),
+# on leaving the `with` block, at interpreter exit, and, if the owner itself is
+# killed, through the multiprocessing resource tracker. Workers attach
+# untracked and read-only, so a crashing worker never unlinks or leaks it.
+
+PRICE_FIELDS = ("close", "adj_close", "change_percent")
+
+# FA_PANEL_WORKERS > 1 makes the price scripts compute through a shared panel
+WORKERS = int(os.environ.get("FA_PANEL_WORKERS", 0))
+
+
+def _attach_untracked(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    # before 3.13 attaching registers the segment with the resource tracker,
+    # which would unlink it when this (non-owner) process exits
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedPanel:
+
+    def __init__(self, shm, handle, owner):
+        self._shm = shm
+        self.handle = handle
+        self.owner = owner
+        self.fields = list(handle["fields"])
+        self.symbols = list(handle["symbols"])
+        self.dates = pd.DatetimeIndex(handle["dates"])
+        self.field_index = {f: k for k, f in enumerate(self.fields)}
+        self.symbol_index = {s: k for k, s in enumerate(self.symbols)}
+
+        n_fields, n_symbols, n_dates = len(self.fields), len(self.symbols), len(self.dates)
+        self.values = np.ndarray((n_fields, n_symbols, n_dates), dtype=np.float64, buffer=shm.buf)
+        self.present = np.ndarray((n_symbols, n_dates), dtype=np.bool_, buffer=shm.buf,
+                                  offset=self.values.nbytes)
+        if not owner:
+            self.values.flags.writeable = False
+            self.present.flags.writeable = False
+        atexit.register(self.close)
+
+    @classmethod
+    def create(cls, frames, fields=PRICE_FIELDS):
+        # frames: {symbol: DataFrame with a date column or index plus `fields`}
+        symbols = list(frames)
+        tables = []
+        for sym in symbols:
+            df = frames[sym]
+            if "date" not in df.columns:
+                df = df.reset_index()
+                df = df.rename(columns={df.columns[0]: "date"}) if "date" not in df.columns else df
+            tables.append(df)
+        dates = pd.DatetimeIndex(sorted(set().union(*[pd.to_datetime(df["date"]) for df in tables]))) \
+            if tables else pd.DatetimeIndex([])
+
+        n_fields, n_symbols, n_dates = len(fields), len(symbols), len(dates)
+        nbytes = 8 * n_fields * n_symbols * n_dates + n_symbols * n_dates
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        handle = {"name": shm.name, "fields": list(fields), "symbols": symbols, "dates": dates.to_numpy(dtype="datetime64[ns]")}
+        panel = cls(shm, handle, owner=True)
+        try:
+            panel.values[:] = np.nan
+            panel.present[:] = False
+            for i, df in enumerate(tables):
+                pos = dates.get_indexer(pd.to_datetime(df["date"]))
+                panel.present[i, pos] = True
+                for k, field in enumerate(fields):
+                    if field in df.columns:
+                        panel.values[k, i, pos] = pd.to_numeric(df[field], errors="coerce").to_numpy(dtype=np.float64)
+        except BaseException:
+            panel.close()
+            raise
+        return panel
+
+    @classmethod
+    def attach(cls, handle):
+        return cls(_attach_untracked(handle["name"]), handle, owner=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def column(self, field):
+        # (S, D) view; read-only in workers
+        return self.values[self.field_index[field]]
+
+    def frame(self, symbol, fields=None):
+        # one symbol's rows as a fresh DataFrame shaped like the fetch output
+        i = self.symbol_index[symbol]
+        mask = self.present[i]
+        df = pd.DataFrame({"date": self.dates[mask]})
+        for field in fields or self.fields:
+            df[field] = self.values[self.field_index[field], i, mask]
+        return df
+
+    def close(self):
+        if self._shm is None:
+            return
+        atexit.unregister(self.close)
+        shm, self._shm = self._shm, None
+        # drop our views before closing the mapping
+        self.values = self.present = None
+        shm.close()
+        if self.owner:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+_PANEL = None
+
+
+def _init_worker(handle):
+    global _PANEL
+    _PANEL = SharedPanel.attach(handle)
+
+
+def _run(kernel, symbol):
+    return kernel(symbol, _PANEL)
+
+
+def _with_frame(fn, fields, symbol, panel):
+    return fn(symbol, panel.frame(symbol, fields))
+
+
+def frame_kernel(fn, fields=None):
+    # adapts fn(symbol, df) to the kernel(symbol, panel) signature; picklable
+    # as long as fn is a module-level function
+    return partial(_with_frame, fn, fields)
+
+
+def map_panel(panel, kernel, symbols=None, workers=None, chunksize=1):
+    # kernel(symbol, panel) in a process pool; results in `symbols` order
+    symbols = list(symbols if symbols is not None else panel.symbols)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(panel.handle,)) as pool:
+        return list(pool.map(partial(_run, kernel), symbols, chunksize=chunksize))
+
+
+def map_frames(frames, kernel, workers=None, fields=PRICE_FIELDS, symbols=None, chunksize=1):
+    # loads frames into a panel, maps kernel over it, always unlinks the segment
+    with SharedPanel.create(frames, fields) as panel:
+        return map_panel(panel, kernel, symbols, workers, chunksize)
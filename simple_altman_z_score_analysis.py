@@ -1,19 +1,44 @@
 import pandas as pd
-from openbb import obb
+import data_quality
+from data_source import obb
+from fundamentals_arrays import to_arrays
+from instrumentation import span
 
 tickers = ["NVDA","AAPL","XOM","EBAY","AMZN","CSCO","COST","EIX","EA"]
-results = []
+def fetch_statements(ticker):
+    with span("fetch", ticker):
+        balance_res = obb.equity.fundamental.balance(symbol=ticker, limit=100, provider='fmp')
+        income_res = obb.equity.fundamental.income(symbol=ticker, limit=100, provider='fmp')
+        ratios_res = obb.equity.fundamental.ratios(symbol=ticker, limit=100, provider='fmp')
+    return balance_res, income_res, ratios_res
 
-for ticker in tickers:
-    
-    balanceall = obb.equity.fundamental.balance(symbol=ticker, limit=100, provider='fmp').results
-    incomeall = obb.equity.fundamental.income(symbol=ticker, limit=100, provider='fmp').results
-    ratiosall = obb.equity.fundamental.ratios(symbol=ticker, limit=100, provider='fmp').results
 
-    balance = [next(x for x in balanceall if x.fiscal_year == 2024)]
-    income = [next(x for x in incomeall if x.fiscal_year == 2024)]
-    ratios = [next(x for x in ratiosall if x.fiscal_year == 2024)]
+def gate(statements):
+    # data-quality checks over every fetched {ticker: fetch_statements(ticker)}
+    # at once; a fiscal year failing them is dropped from all three statements,
+    # so no Z-score is computed on it
+    return data_quality.gate_statements(statements, "simple_altman_z_score_analysis", balance_index=0)
 
+
+def fy_statements(ticker, statements, year=2024):
+    balance_res, income_res, ratios_res = statements
+    with span("transform", ticker):
+        balanceall = to_arrays(balance_res).results
+        incomeall = to_arrays(income_res).results
+        ratiosall = to_arrays(ratios_res).results
+
+        balance = [next(x for x in balanceall if x.fiscal_year == year)]
+        income = [next(x for x in incomeall if x.fiscal_year == year)]
+        ratios = [next(x for x in ratiosall if x.fiscal_year == year)]
+    return balance, income, ratios
+
+
+def fetch_fy_statements(ticker, year=2024):
+    # a single ticker, fetched and gated on its own
+    return fy_statements(ticker, gate({ticker: fetch_statements(ticker)})[ticker], year)
+
+
+def altman_z_row(ticker, balance, income, ratios):
     # Balance sheet items
     ta = balance[0].total_assets
     wc = balance[0].total_current_assets - balance[0].total_current_liabilities
@@ -50,17 +75,42 @@ for ticker in tickers:
     else:
         Category = "Safe Zone"
 
-    results.append({
+    return {
         "Ticker": ticker,
         "Z-score": z,
         "Current Ratio": current_ratio,
         "Category": Category
-    })
+    }
+
+
+# declared output types (output_sink.typed_frame), so Parquet/Arrow schemas
+# never depend on the first batch's values
+COLUMN_DTYPES = {"Ticker": "string", "Z-score": "float64", "Current Ratio": "float64", "Category": "string"}
+
+
+def results_frame(rows):
+    return pd.DataFrame(rows).round(2)
+
+
+def sort_results(dfres):
+    # Sort by Z-score descending
+    return dfres.sort_values("Z-score", ascending=False).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    results = []
+
+    fetched = gate({ticker: fetch_statements(ticker) for ticker in tickers})
+    for ticker in tickers:
+        statements = fy_statements(ticker, fetched[ticker])
+        with span("compute", ticker):
+            results.append(altman_z_row(ticker, *statements))
 
-# Create dataframe and round
-dfres = pd.DataFrame(results).round(2)
+    # Create dataframe and round
+    with span("compute", name="sort_results"):
+        dfres = results_frame(results)
 
-# Sort by Z-score descending
-dfres = dfres.sort_values("Z-score", ascending=False).reset_index(drop=True)
+        dfres = sort_results(dfres)
 
-df_to_csv(dfres)
+    with span("output"):
+        df_to_csv(dfres)
@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from scipy.signal import lfilter
+
+import data_source
+import etf_volatility_regime_analysis as etf
+from chunked_pipeline import ETF_CELL_BYTES, MEMORY_BUDGET_MB, batches, compact, rolling_std
+from instrumentation import span
+from price_store import PriceStore
+
+# Conditional volatility models next to the ETF script's rolling windows:
+#
+#   ewma   RiskMetrics, var_t = lam * var_{t-1} + (1 - lam) * r_{t-1}^2
+#   garch  GARCH(1,1), var_t = omega + alpha * r_{t-1}^2 + beta * var_{t-1},
+#          fitted per ticker by Gaussian maximum likelihood
+#
+# Both are one-day-ahead vols over each ticker's own bars (the log returns the
+# ETF script uses). EWMA runs for a whole batch of tickers as one loop over
+# time on a (tickers x days) array. GARCH is fitted ticker by ticker on a
+# process pool. Its variance recursion is a first-order linear filter
+# (scipy.signal.lfilter), so a likelihood evaluation is one C call.
+# Each fit is warm-started from the ticker's parameters in FA_GARCH_PARAMS,
+# saved by the previous run. Tickers without saved parameters start from
+# alpha=0.05, beta=0.90.
+#
+# The report has one row per ticker and model (rolling21, ewma, garch) with
+# the ETF script's statistics, with the model's vol in place of vol21:
+# max vol and its date, days above the median, and the ratio to vol63 at the
+# max.
+#
+#   python vol_models.py prices/ --workers 8
+#   python vol_models.py prices/ --start 2005-01-01 --report-start 2024-01-01 --end 2024-12-31
+
+EWMA_LAMBDA = 0.94
+MIN_PERIODS = 21
+MODELS = ("rolling21", "ewma", "garch")
+PARAMS_FILE = os.environ.get("FA_GARCH_PARAMS", "garch_params.json")
+
+# GARCH is fitted on percent returns; omega is in percent^2
+SCALE = 100.0
+GARCH_START = (0.05, 0.90)
+
+REPORT_COLUMNS = {
+    "Max21dVolPct": "MaxVolPct",
+    "DateOfMax21d": "DateOfMaxVol",
+    "Max63dVolPct": "Max63dVolPct",
+    "DateOfMax63d": "DateOfMax63d",
+    "AboveMedianVolDays": "AboveMedianVolDays",
+    "VolRatioAtMax21d": "VolRatioAtMax",
+}
+
+
+def rolling_vols(close, present):
+    # log returns and 21/63-bar rolling vols over each row's own bars, compacted
+    # to the front of the row (see chunked_pipeline.compact); returns
+    # (logret, vol21, vol63, original column of each bar, bars per row)
+    close, order, n = compact(close, present)
+    prev = np.concatenate([np.full((len(close), 1), np.nan), close[:, :-1]], axis=1)
+    logret = np.log(close / prev)
+    vol21, vol63 = (rolling_std(np.pad(logret, ((0, 0), (w - 1, 0)), constant_values=np.nan), w, close.shape[1])
+                    for w in (21, 63))
+    return logret, vol21, vol63, order, n
+
+
+def ewma_vol(returns, lam=EWMA_LAMBDA, min_periods=MIN_PERIODS):
+    # returns (S, T), NaN where missing; missing days leave the variance as is
+    var = np.full(len(returns), np.nan)
+    seen = np.zeros(len(returns), dtype=np.int64)
+    out = np.full(returns.shape, np.nan)
+    for t in range(returns.shape[1]):
+        out[:, t] = np.where(seen >= min_periods, var, np.nan)
+        r = returns[:, t]
+        valid = np.isfinite(r)
+        r2 = np.where(valid, r * r, 0.0)
+        var = np.where(valid, np.where(np.isnan(var), r2, lam * var + (1 - lam) * r2), var)
+        seen += valid
+    return np.sqrt(out)
+
+
+def garch_variance(params, r):
+    # conditional variance of each r_t given r_0..r_{t-1}, started at var(r)
+    omega, alpha, beta = params
+    var0 = r.var()
+    u = omega + alpha * r[:-1] * r[:-1]
+    rest = lfilter([1.0], [1.0, -beta], u, zi=[beta * var0])[0]
+    return np.concatenate([[var0], rest])
+
+
+def _garch_nll(params, r):
+    var = garch_variance(params, r)
+    if not np.all(var > 0):
+        return 1e10
+    return 0.5 * np.sum(np.log(var) + r * r / var)
+
+
+def _nll_persistence(x, r):
+    # optimised over (omega, alpha + beta, alpha / (alpha + beta)) so that
+    # stationarity is a box bound rather than a penalty wall
+    omega, persistence, share = x
+    return _garch_nll((omega, persistence * share, persistence * (1 - share)), r)
+
+
+def _minimize(r, start, var):
+    omega, alpha, beta = start
+    persistence = min(alpha + beta, 0.9999)
+    x0 = (omega, persistence, alpha / persistence if persistence > 0 else 0.5)
+    bounds = [(1e-8 * max(var, 1e-12), 10 * max(var, 1e-12)), (0.0, 0.9999), (0.0, 1.0)]
+    x0 = tuple(min(max(v, lo), hi) for v, (lo, hi) in zip(x0, bounds))
+    return minimize(_nll_persistence, np.asarray(x0, dtype=np.float64), args=(r,), method="L-BFGS-B",
+                    bounds=bounds, options={"ftol": 1e-12, "gtol": 1e-8})
+
+
+def fit_garch(r, start=None):
+    # ((omega, alpha, beta), iterations) for returns r (finite, in SCALE
+    # units), demeaned; a start that fails to converge is retried from the
+    # default start
+    r = r - r.mean()
+    var = r.var()
+    alpha, beta = GARCH_START
+    default = (var * (1 - alpha - beta), alpha, beta)
+    res = _minimize(r, start or default, var)
+    nit = res.nit
+    if start is not None and not res.success:
+        retry = _minimize(r, default, var)
+        nit += retry.nit
+        res = retry if retry.fun < res.fun else res
+    omega, persistence, share = (float(x) for x in res.x)
+    return (omega, persistence * share, persistence * (1 - share)), int(nit)
+
+
+def _fit_task(items):
+    # one pool task: [(ticker, returns, saved params or None)]
+    out = []
+    for ticker, r, start in items:
+        if len(r) < MIN_PERIODS:
+            out.append((ticker, None, 0))
+            continue
+        params, nit = fit_garch(r * SCALE, start)
+        out.append((ticker, params, nit))
+    return out
+
+
+def fit_garch_panel(series, warm=None, workers=None, chunksize=16):
+    # series: {ticker: finite log returns}; returns ({ticker: params}, iterations)
+    warm = warm or {}
+    items = [(t, r, warm.get(t)) for t, r in series.items()]
+    tasks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = [row for chunk in pool.map(_fit_task, tasks) for row in chunk]
+    else:
+        results = [row for task in tasks for row in _fit_task(task)]
+    return {t: p for t, p, _ in results if p is not None}, sum(nit for _, _, nit in results)
+
+
+def garch_vol(params, r):
+    # daily vol (not SCALE units) for finite returns r
+    x = r * SCALE
+    return np.sqrt(garch_variance(params, x - x.mean())) / SCALE
+
+
+def load_params(path=None):
+    path = path or PARAMS_FILE
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {t: tuple(p) for t, p in json.load(f).items()}
+
+
+def save_params(params, path=None):
+    path = path or PARAMS_FILE
+    merged = load_params(path)
+    merged.update(params)
+    with open(path, "w") as f:
+        json.dump({t: list(p) for t, p in sorted(merged.items())}, f)
+
+
+def _model_metrics(sym, dates, vol, vol63):
+    yr = pd.DataFrame({"date": dates, "vol21": vol, "vol63": vol63})
+    return {REPORT_COLUMNS.get(k, k): v for k, v in etf.vol_metrics(sym, yr).items()}
+
+
+def vol_model_report(store, symbols=None, history_start=etf.FETCH_START, report_start=etf.REPORT_START,
+                     report_end=etf.REPORT_END, workers=None, warm=None, budget_mb=None):
+    # returns (report, fitted GARCH params)
+    symbols = list(symbols or store.symbols)
+    rows_idx = np.array([store.symbol_index[s] for s in symbols], dtype=np.intp)
+    d0, d1 = store.date_range(history_start, report_end)
+    r0, r1 = store.date_range(report_start, report_end)
+    # the recursions need each ticker's whole history, so batches hold full rows
+    budget = (budget_mb or MEMORY_BUDGET_MB) * 2 ** 20
+    batch = max(1, min(len(symbols), int(budget // (max(d1 - d0, 1) * (ETF_CELL_BYTES + 8 * 4)))))
+    warm = load_params() if warm is None else warm
+
+    out, fitted = [], {}
+    for i0, i1 in batches(len(symbols), batch):
+        rows = rows_idx[i0:i1]
+        with span("fetch", name="price_store"):
+            close = store.block("close", rows, d0, d1)
+            present = store.block_present(rows, d0, d1)
+        with span("compute", name="rolling_vols"):
+            logret, vol21, vol63, order, n = rolling_vols(close, present)
+            vols = {"rolling21": vol21, "vol63": vol63}
+        with span("compute", name="ewma"):
+            vols["ewma"] = ewma_vol(logret)
+        with span("compute", name="garch_fit") as sp:
+            series = {}
+            for k, sym in enumerate(symbols[i0:i1]):
+                finite = np.isfinite(logret[k])
+                series[sym] = logret[k, finite]
+            params, iterations = fit_garch_panel(series, warm, workers)
+            sp.count("iterations", iterations)
+            fitted.update(params)
+            vols["garch"] = np.full(logret.shape, np.nan)
+            for k, sym in enumerate(symbols[i0:i1]):
+                if sym in params:
+                    finite = np.isfinite(logret[k])
+                    vols["garch"][k, finite] = garch_vol(params[sym], series[sym])
+
+        with span("compute", name="vol_model_metrics"):
+            for k, sym in enumerate(symbols[i0:i1]):
+                cols = d0 + order[k, :n[k]]
+                keep = (cols >= r0) & (cols < r1)
+                report_dates = pd.DatetimeIndex(store.dates[cols[keep]])
+                vol63 = vols["vol63"][k, :n[k]][keep]
+                for model in MODELS:
+                    row = _model_metrics(sym, report_dates, vols[model][k, :n[k]][keep], vol63)
+                    out.append({"Ticker": sym, "Model": model, **{c: row[c] for c in row if c != "Ticker"}})
+    return sort_results(pd.DataFrame(out)), fitted
+
+
+def sort_results(out):
+    if out.empty:
+        return out
+    order = {m: k for k, m in enumerate(MODELS)}
+    return out.sort_values(["Ticker", "Model"], key=lambda c: c.map(order) if c.name == "Model" else c) \
+        .reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rolling, EWMA and GARCH(1,1) vol report over a price store")
+    parser.add_argument("store", help="directory written by price_store.py build")
+    parser.add_argument("--symbols", help="comma-separated subset of the store's symbols")
+    parser.add_argument("--start", default=etf.FETCH_START, help="start of history")
+    parser.add_argument("--report-start", default=etf.REPORT_START)
+    parser.add_argument("--end", default=etf.REPORT_END, help="end of the report window")
+    parser.add_argument("--workers", type=int, default=None, help="GARCH fitting processes (default: all CPUs)")
+    parser.add_argument("--cold", action="store_true", help="ignore saved GARCH parameters")
+    parser.add_argument("--budget-mb", type=float, default=None, help="memory budget (default FA_MEMORY_BUDGET_MB)")
+    args = parser.parse_args(argv)
+
+    store = PriceStore(args.store)
+    symbols = [s for s in args.symbols.split(",") if s] if args.symbols else None
+    out, params = vol_model_report(store, symbols, args.start, args.report_start, args.end, args.workers,
+                                   {} if args.cold else None, args.budget_mb)
+    save_params(params)
+    with span("output"):
+        data_source.save_output(out, "vol_models")
+
+
+if __name__ == "__main__":
+    main()
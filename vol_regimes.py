@@ -0,0 +1,146 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import data_source
+from chunked_pipeline import ETF_CELL_BYTES, MEMORY_BUDGET_MB, batches
+from instrumentation import span
+from price_store import PriceStore
+from vol_models import rolling_vols
+
+# High/low volatility regime episodes over each ticker's whole history.
+# A bar is in the high regime when
+#
+#   median  vol21 > its rolling median over the last MEDIAN_WINDOW bars
+#   ratio   vol21 / vol63 > threshold
+#
+# and in the low regime otherwise; bars where the rule is undefined (warm-up,
+# missing data) belong to no episode. Episodes are found for a whole symbol
+# batch at once by run-length encoding the (tickers x bars) state array: run
+# starts are the flat positions where the state changes or a row begins, and
+# each run's peak vol21 and its date come from reduceat over those starts.
+#
+#   python vol_regimes.py prices/
+#   python vol_regimes.py prices/ --rule ratio --threshold 1.2 --min-length 5
+
+RULES = ("median", "ratio")
+MEDIAN_WINDOW = 252
+RATIO_THRESHOLD = 1.0
+HIGH, LOW, UNDEFINED = 1, 0, -1
+
+COLUMNS = ["Ticker", "Regime", "Start", "End", "Duration", "PeakVol21Pct", "PeakDate"]
+
+
+def regime_states(vol21, vol63, rule="median", threshold=RATIO_THRESHOLD, window=MEDIAN_WINDOW):
+    # int8 (S, T): HIGH, LOW or UNDEFINED per bar
+    if rule == "median":
+        # pandas' rolling median runs down the columns in C
+        median = pd.DataFrame(vol21.T).rolling(window, min_periods=window).median().to_numpy().T
+        defined = np.isfinite(vol21) & np.isfinite(median)
+        high = vol21 > median
+    elif rule == "ratio":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = vol21 / vol63
+        defined = np.isfinite(ratio)
+        high = ratio > threshold
+    else:
+        raise ValueError(f"Unknown regime rule: {rule!r} (expected one of {RULES})")
+    return np.where(defined, np.where(high, HIGH, LOW), UNDEFINED).astype(np.int8)
+
+
+def run_lengths(states):
+    # (row, start, length, state) of every run of equal values in each row
+    rows, cols = states.shape
+    flat = states.ravel()
+    change = np.empty(flat.size, dtype=bool)
+    if flat.size:
+        change[0] = True
+        np.not_equal(flat[1:], flat[:-1], out=change[1:])
+        change[::cols] = True
+    starts = np.flatnonzero(change)
+    lengths = np.diff(np.append(starts, flat.size))
+    return starts // max(cols, 1), starts, lengths, flat[starts]
+
+
+def episodes(states, vol21):
+    # runs of HIGH / LOW with their peak vol21; positions are flat indices
+    row, start, length, state = run_lengths(states)
+    if not len(start):
+        return {"row": row, "start": start, "length": length, "state": state,
+                "peak": np.empty(0), "peak_at": start}
+    vol = np.where(np.isfinite(vol21), vol21, -np.inf).ravel()
+    peak = np.maximum.reduceat(vol, start)
+    run_of = np.repeat(np.arange(len(start)), length)
+    at = np.where(vol == peak[run_of], np.arange(vol.size), vol.size)
+    peak_at = np.minimum.reduceat(at, start)
+    keep = state != UNDEFINED
+    return {"row": row[keep], "start": start[keep], "length": length[keep], "state": state[keep],
+            "peak": peak[keep], "peak_at": peak_at[keep]}
+
+
+def regime_episodes(store, symbols=None, start=None, end=None, rule="median", threshold=RATIO_THRESHOLD,
+                    window=MEDIAN_WINDOW, min_length=1, budget_mb=None):
+    symbols = list(symbols or store.symbols)
+    rows_idx = np.array([store.symbol_index[s] for s in symbols], dtype=np.intp)
+    d0, d1 = store.date_range(start, end)
+    # rolling windows and the median need each ticker's whole history
+    budget = (budget_mb or MEMORY_BUDGET_MB) * 2 ** 20
+    batch = max(1, min(len(symbols), int(budget // (max(d1 - d0, 1) * (ETF_CELL_BYTES + 8 * 4)))))
+
+    parts = []
+    for i0, i1 in batches(len(symbols), batch):
+        rows = rows_idx[i0:i1]
+        with span("fetch", name="price_store"):
+            close = store.block("close", rows, d0, d1)
+            present = store.block_present(rows, d0, d1)
+        with span("compute", name="regime_rle") as sp:
+            _, vol21, vol63, order, n = rolling_vols(close, present)
+            ep = episodes(regime_states(vol21, vol63, rule, threshold, window), vol21)
+            keep = ep["length"] >= min_length
+            ep = {k: v[keep] for k, v in ep.items()}
+            # compacted bar positions back to calendar dates
+            dates = store.dates[d0 + order.ravel()]
+            parts.append(pd.DataFrame({
+                "Ticker": np.asarray(symbols[i0:i1], dtype=object)[ep["row"]],
+                "Regime": np.where(ep["state"] == HIGH, "High", "Low"),
+                "Start": dates[ep["start"]],
+                "End": dates[ep["start"] + ep["length"] - 1],
+                "Duration": ep["length"].astype(np.int32),
+                "PeakVol21Pct": np.round(ep["peak"] * 100, 4),
+                "PeakDate": dates[ep["peak_at"]],
+            }))
+            sp.count("episodes", len(parts[-1]))
+    out = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS)
+    out["Ticker"] = out["Ticker"].astype("category")
+    out["Regime"] = out["Regime"].astype("category")
+    return out
+
+
+def sort_results(out):
+    return out.sort_values(["Ticker", "Start"]).reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="High/low volatility regime episodes over the full history")
+    parser.add_argument("store", help="directory written by price_store.py build")
+    parser.add_argument("--symbols", help="comma-separated subset of the store's symbols")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--rule", choices=RULES, default="median")
+    parser.add_argument("--threshold", type=float, default=RATIO_THRESHOLD, help="vol21/vol63 level for --rule ratio")
+    parser.add_argument("--window", type=int, default=MEDIAN_WINDOW, help="rolling median bars for --rule median")
+    parser.add_argument("--min-length", type=int, default=1, help="drop episodes shorter than this many bars")
+    parser.add_argument("--budget-mb", type=float, default=None, help="memory budget (default FA_MEMORY_BUDGET_MB)")
+    args = parser.parse_args(argv)
+
+    store = PriceStore(args.store)
+    symbols = [s for s in args.symbols.split(",") if s] if args.symbols else None
+    out = sort_results(regime_episodes(store, symbols, args.start, args.end, args.rule, args.threshold,
+                                       args.window, args.min_length, args.budget_mb))
+    with span("output"):
+        data_source.save_output(out, "vol_regimes")
+
+
+if __name__ == "__main__":
+    main()